@@ -1,4 +1,108 @@
+import argparse
+import itertools
+import sys
+from datetime import datetime, timedelta
+
+from . import attendance
+from . import config
+from .daemon import SyncDaemon
 from .fpsync import perform_sync
+from .rebuild import rebuild
+from .report import AttendanceMatrix
+from .whatif import Policy, WhatIf
 
-if __name__ == "__main__":
+
+def parse_date(text):
+    return datetime.strptime(text, '%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m TMSSync')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('sync', help='record new punches (the default)')
+    cmd = commands.add_parser(
+        'daemon', help='keep recording new punches until stopped')
+    cmd.add_argument('--workers', type=int, default=config.SYNC_WORKERS)
+    cmd.add_argument('--min-interval', type=float,
+                     default=config.DAEMON_MIN_INTERVAL, metavar='SECONDS')
+    cmd.add_argument('--max-interval', type=float,
+                     default=config.DAEMON_MAX_INTERVAL, metavar='SECONDS')
+    cmd = commands.add_parser(
+        'rebuild', help='work out sessions and attendance again')
+    cmd.add_argument('--from', dest='date_from', type=parse_date,
+                     required=True, metavar='YYYY-MM-DD')
+    cmd.add_argument('--to', dest='date_to', type=parse_date,
+                     metavar='YYYY-MM-DD', help='last day to rebuild')
+    cmd.add_argument('--employees', type=int, nargs='+', metavar='CODE')
+    cmd.add_argument('--workers', type=int, default=config.SYNC_WORKERS)
+    cmd.add_argument('--restart', action='store_true',
+                     help='ignore what an interrupted run already did')
+    cmd = commands.add_parser(
+        'whatif', help='count attendance under other lateness rules')
+    cmd.add_argument('--from', dest='date_from', type=parse_date,
+                     required=True, metavar='YYYY-MM-DD')
+    cmd.add_argument('--to', dest='date_to', type=parse_date, required=True,
+                     metavar='YYYY-MM-DD', help='last day to count')
+    cmd.add_argument('--grace', type=int, nargs='+', metavar='MINUTES',
+                     help='late grace times to try')
+    cmd.add_argument('--early-offset', type=int, nargs='+',
+                     metavar='MINUTES', help='early start offsets to try')
+    cmd.add_argument('--by-employee', action='store_true')
+    cmd = commands.add_parser(
+        'report', help='write everyone\'s attendance as CSV')
+    cmd.add_argument('--from', dest='date_from', type=parse_date,
+                     required=True, metavar='YYYY-MM-DD')
+    cmd.add_argument('--to', dest='date_to', type=parse_date, required=True,
+                     metavar='YYYY-MM-DD', help='last day to report')
+    cmd.add_argument('--employees', type=int, nargs='+', metavar='CODE')
+    cmd.add_argument('--output', help='CSV file to write, standard output '
+                     'by default')
+    args = parser.parse_args(argv)
+
+    if args.command == 'rebuild':
+        date_to = args.date_to
+        if date_to is not None:
+            date_to += timedelta(days=1)
+        return 1 if rebuild(args.date_from, date_to, args.employees,
+                            args.workers, args.restart) else 0
+    if args.command == 'report':
+        employees = attendance.Employee.get_all()
+        if args.employees:
+            codes = set(args.employees)
+            employees = [emp for emp in employees if emp.employeeCode in codes]
+        matrix = AttendanceMatrix.load(
+            args.date_from, args.date_to + timedelta(days=1),
+            sorted(emp.employeeId for emp in employees))
+        names = dict((emp.employeeId, emp.employeeCode) for emp in employees)
+        if args.output:
+            with open(args.output, 'w', newline='') as out:
+                matrix.write_csv(out, names)
+        else:
+            matrix.write_csv(sys.stdout, names)
+        return 0
+    if args.command == 'whatif':
+        whatif = WhatIf.load(args.date_from,
+                             args.date_to + timedelta(days=1))
+        policies = [
+            Policy(*[None if minutes is None else timedelta(minutes=minutes)
+                     for minutes in pair])
+            for pair in itertools.product(
+                args.grace or [None], args.early_offset or [None])]
+        outcome = whatif.evaluate(policies)
+        print(outcome.summary())
+        if args.by_employee:
+            for i, policy in enumerate(policies):
+                print('\n%s' % policy.name)
+                for row in outcome.by_employee(i):
+                    print('%8d %8d %8d %8d %8d' % row)
+        return 0
+    if args.command == 'daemon':
+        SyncDaemon(args.workers, min_interval=args.min_interval,
+                   max_interval=args.max_interval).run()
+        return 0
     perform_sync()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
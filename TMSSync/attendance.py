@@ -1,8 +1,14 @@
 from __future__ import print_function
 
+import bisect
+import contextlib
+import threading
 from datetime import datetime, timedelta
 
+from . import backend
 from . import connection
+from . import daycalendar
+from . import unitofwork
 
 
 Connection = connection.Connection
@@ -13,15 +19,42 @@ MAX_EARLY_START_OFFSET = timedelta(hours=2, minutes=15)
 IN_SHIFT_SESSION_DURATION = timedelta(hours=4, minutes=15)
 EXT_SHIFT_SESSION_DURATION = timedelta(hours=2, minutes=15)
 
+_local = threading.local()
+
+
+def _hook(name, default):
+    """The hook ``name`` installed for the running thread by ``overriding``,
+    else ``default``, the one installed on the class"""
+    return getattr(_local, 'hooks', {}).get(name, default)
+
+
+@contextlib.contextmanager
+def overriding(**hooks):
+    """Install the ``calendar``, ``timelines`` or ``inOutIds`` hooks for the
+    running thread alone, over those of DayDetail, Session and
+    AttendanceDetail, while the block runs"""
+    previous = getattr(_local, 'hooks', {})
+    _local.hooks = dict(previous, **hooks)
+    try:
+        yield
+    finally:
+        _local.hooks = previous
+
 
 class DayDetail(object):
     saturday_optional = True
 
+    # a DayCalendar installed here answers from memory
+    calendar = None
+
     WEEKEND = 'Weekend'
     OPTIONAL = 'Optional'
 
     @classmethod
     def get(self, date):
+        calendar = _hook('calendar', self.calendar)
+        if calendar is not None:
+            return calendar.get(date)
         date = datetime(date.year, date.month, date.day)
         today = date.strftime('%A')
         hday = Connection().execute(
@@ -41,16 +74,45 @@ class DayDetail(object):
 
         return ''
 
+    @classmethod
+    def get_range(cls, date_from, date_to):
+        """``(date, get(date))`` for every day in ``[date_from, date_to)``,
+        read with two queries at most"""
+        day = datetime(date_from.year, date_from.month, date_from.day)
+        days = []
+        while day < date_to:
+            days.append(day)
+            day += timedelta(days=1)
+        calendar = _hook('calendar', cls.calendar)
+        if calendar is None and days:
+            calendar = daycalendar.DayCalendar(
+                    days[0], days[-1], cls.saturday_optional)
+        return [(day, calendar.get(day)) for day in days]
+
 
 class ShiftDetails(object):
+    __slots__ = ('_timeFrom', '_timeTo', '_offset', '_employee', 'employeeId',
+                 'effectiveFrom')
+
     grace_time = LATE_GRACE_TIME
     early_offset = MAX_EARLY_START_OFFSET
 
-    def __init__(self, timeFrom, timeTo, employeeId=None, employee=None):
+    history_query = ('Select timeFrom, timeTo, employeeId, EffectiveFrom '
+                     'From ShiftDetails %s '
+                     'Order By EmployeeID, SDID')
+
+    def __init__(self, timeFrom, timeTo, employeeId=None, employee=None,
+                 effectiveFrom=None):
         self._timeFrom = timeFrom.time()
         self._timeTo = timeTo.time()
+        # how far the day of the shift is behind the day of the clock
+        self._offset = timedelta(hours=self._timeFrom.hour,
+                                 minutes=self._timeFrom.minute)
         self._employee = employee
         self.employeeId = employeeId
+        # the shift applies from then on, or from when the one given before
+        # it does when None; ``fpsync.setup_database`` fills it in
+        self.effectiveFrom = effectiveFrom
         if employee:
             self.employeeId = employee.employeeId
 
@@ -87,17 +149,37 @@ class ShiftDetails(object):
 
     @classmethod
     def get_by_emp(cls, employee):
-        query = ('Select timeFrom, timeTo, employeeId '
-                 'From ShiftDetails '
-                 'Where SDID = ( '
-                 'Select Max(SDID) From ShiftDetails Where EmployeeID = ?)')
-        data = Connection().execute(query, employee.employeeId).fetchone()
-        return cls(*data, employee=employee) if data else None
+        if Employee.directory is not None:
+            return Employee.directory.get_shift(employee)
+        return cls.get_history(employee).current()
+
+    @classmethod
+    def get_history(cls, employee):
+        """Every shift the employee has been given, as a ShiftHistory"""
+        query = cls.history_query % 'Where EmployeeID = ?'
+        return ShiftHistory([
+            cls(timeFrom, timeTo, employee=employee, effectiveFrom=since)
+            for timeFrom, timeTo, _, since in Connection().execute(
+                query, employee.employeeId)])
+
+    @classmethod
+    def get_all_history(cls):
+        """The ShiftHistory of every employee by id, from one query"""
+        shifts = {}
+        for timeFrom, timeTo, emp_id, since in Connection().execute(
+                cls.history_query % ''):
+            shifts.setdefault(emp_id, []).append(
+                cls(timeFrom, timeTo, emp_id, effectiveFrom=since))
+        return dict((emp_id, ShiftHistory(emp_shifts))
+                    for emp_id, emp_shifts in shifts.items())
+
+    @classmethod
+    def get_current_all(cls):
+        return [history.current()
+                for history in cls.get_all_history().values()]
 
     def get_track_date(self, dt, allow_early_start=False):
-        shifted_time = dt - timedelta(
-                hours=self._timeFrom.hour,
-                minutes=self._timeFrom.minute)
+        shifted_time = dt - self._offset
         if allow_early_start:
             shifted_time += self.early_offset
         date = shifted_time.date()
@@ -137,13 +219,56 @@ class ShiftDetails(object):
         return self.is_early_start(time) or time < self.start_time(td)
 
 
+class ShiftHistory(object):
+    """The shifts of an employee by the time they apply from
+
+    ``shifts`` are in the order they were given in. A shift without an
+    effective date applies from the time the one given before it does, and
+    of shifts applying from the same time the last given wins, so without
+    effective dates the latest shift applies throughout, as it always did.
+    Times before the first effective date get the first shift.
+    """
+
+    __slots__ = ('shifts', '_starts')
+
+    def __init__(self, shifts):
+        starts = []
+        since = datetime.min
+        for shift in shifts:
+            since = shift.effectiveFrom or since
+            starts.append((since, shift))
+        starts.sort(key=lambda start: start[0])
+        self.shifts = [shift for since, shift in starts]
+        self._starts = [since for since, shift in starts]
+
+    def __len__(self):
+        return len(self.shifts)
+
+    def shift_at(self, time):
+        """The shift that applies at ``time``, None without any"""
+        if not self.shifts:
+            return None
+        return self.shifts[
+            max(bisect.bisect_right(self._starts, time) - 1, 0)]
+
+    def current(self):
+        return self.shift_at(datetime.now())
+
+
 class Employee(object):
+    __slots__ = ('employeeId', 'employeeCode', 'employeeName', 'status',
+                 '_shift', '_shifts')
+
+    # an EmployeeDirectory installed here answers from memory
+    directory = None
+
     def __init__(self, id, code, name, status, shift=None):
         self.employeeId = int(id)
         self.employeeCode = int(code)
         self.employeeName = str(name)
         self.status = bool(status)
         self._shift = shift
+        self._shifts = None
 
     def __repr__(self):
         return 'Employee(%d, %d, "%s")' % (self.employeeId, self.employeeCode,
@@ -151,6 +276,8 @@ class Employee(object):
 
     @classmethod
     def get_by_code(cls, code):
+        if cls.directory is not None:
+            return cls.directory.get_by_code(code)
         query = '''
             select
                 employeeId, employeecode, employeename, employeestatus
@@ -161,6 +288,8 @@ class Employee(object):
 
     @classmethod
     def get(cls, id):
+        if cls.directory is not None:
+            return cls.directory.get(id)
         query = '''
             select
                 employeeId, employeecode, employeename, employeestatus
@@ -169,14 +298,41 @@ class Employee(object):
         cur = Connection().execute(query, id).fetchone()
         return cls(*cur) if cur else None
 
+    @classmethod
+    def get_all(cls):
+        query = '''
+            select
+                employeeId, employeecode, employeename, employeestatus
+            from employee'''
+        return [cls(*data) for data in Connection().execute(query)]
+
     @property
     def shift(self):
+        """The shift that applies now"""
         if self._shift is None:
             self._shift = ShiftDetails.get_by_emp(self)
         return self._shift
 
+    @property
+    def shifts(self):
+        if self._shifts is None:
+            if self.directory is not None:
+                self._shifts = self.directory.get_shifts(self)
+            else:
+                self._shifts = ShiftDetails.get_history(self)
+        return self._shifts
+
+    def shift_at(self, time):
+        """The shift that applied at ``time``"""
+        return self.shifts.shift_at(time)
+
 
 class EmployeeAttendance(object):
+    __slots__ = ('_eaid', 'employeeId', 'attendanceDate', 'attendanceStatus',
+                 'timeStatus', 'description', '_employee', '_clean')
+
+    table = 'EmployeeAttendance'
+
     class Status:
         PRESENT = P = 'P'
         ABSENT = A = 'A'
@@ -198,6 +354,39 @@ class EmployeeAttendance(object):
         COMPENSATE = 'Compensate'
         NONE = ''
 
+    # what merge does to a row already there
+    MERGE_PRESENT = 'present'
+    MERGE_ABSENT = 'absent'
+
+    merge_query = '''
+        MERGE dbo.EmployeeAttendance WITH (HOLDLOCK) AS E
+        USING (VALUES %s) AS M(
+            EmployeeId, AttendanceDate, AttendanceStatus, TimeStatus,
+            Description, MergeRule)
+        ON E.EmployeeId = M.EmployeeId AND E.AttendanceDate = M.AttendanceDate
+        WHEN MATCHED THEN UPDATE SET
+            AttendanceStatus = CASE
+                WHEN M.MergeRule = 'present'
+                    OR E.AttendanceStatus IN ('Holiday', 'A')
+                THEN M.AttendanceStatus ELSE E.AttendanceStatus END,
+            TimeStatus = CASE
+                WHEN M.MergeRule = 'present' AND (
+                    M.TimeStatus = 'OverTime'
+                    OR M.TimeStatus = 'Late' AND E.TimeStatus = ''
+                    OR M.TimeStatus = 'InTime'
+                        AND E.TimeStatus IN ('Late', ''))
+                THEN M.TimeStatus ELSE E.TimeStatus END,
+            Description = CASE
+                WHEN M.MergeRule = 'absent'
+                    AND E.Description IN ('Optional', '')
+                THEN M.Description ELSE E.Description END
+        WHEN NOT MATCHED THEN
+            INSERT (EmployeeId, AttendanceDate, AttendanceStatus, TimeStatus,
+                    Description)
+            VALUES (M.EmployeeId, M.AttendanceDate, M.AttendanceStatus,
+                    M.TimeStatus, M.Description);
+    '''
+
     def __init__(self,
                  attendanceDate,
                  attendanceStatus='',
@@ -207,19 +396,19 @@ class EmployeeAttendance(object):
                  eaid=None,
                  employee=None):
         self._eaid = eaid
-        self.employeeId = employeeId
         self.attendanceDate = datetime(
             attendanceDate.year, attendanceDate.month, attendanceDate.day)
         self.attendanceStatus = attendanceStatus
         self.timeStatus = timeStatus
         self.description = description
-        self.created = False
         self._employee = employee
         self.employeeId = employeeId
         if employee:
             self.employeeId = employee.employeeId
         if self.employeeId is None:
             raise ValueError('Must specify EmployeeId')
+        # the fields as the row has them, None while that is not known
+        self._clean = self._fields() if eaid is not None else None
 
     @property
     def employee(self):
@@ -244,13 +433,59 @@ class EmployeeAttendance(object):
             Order by
                 AttendanceDate
         '''
+        unitofwork.sync(cls.table)
         return [
             cls(*data, employee=employee)
             for data in Connection().execute(
                 query, employee.employeeId, date_from)]
 
+    @classmethod
+    def iter_rows(cls, date_from, date_to, employee_ids=None):
+        """Yield the rows of everyone's attendance in ``[date_from,
+        date_to)`` from one query, ordered by employee and date
+
+        Rows are in the order the constructor takes. With ``employee_ids``
+        only those employees are read, filtered by the database for up to
+        a thousand of them.
+        """
+        query = '''
+            Select
+                AttendanceDate, AttendanceStatus, timeStatus,
+                description, EmployeeId, eaid
+            From EmployeeAttendance
+            Where AttendanceDate >= ? and AttendanceDate < ? %s
+            Order by
+                EmployeeId, AttendanceDate
+        '''
+        params = [date_from, date_to]
+        wanted = where = None
+        if employee_ids is not None:
+            wanted = frozenset(employee_ids)
+            if len(wanted) <= 1000:
+                params.extend(wanted)
+                where = 'and EmployeeId In (%s)' % ', '.join(
+                        ['?'] * len(wanted))
+        unitofwork.sync(cls.table)
+        for data in Connection().iterate(query % (where or ''), *params):
+            if wanted is None or data[4] in wanted:
+                yield data
+
+    @classmethod
+    def iter_range(cls, date_from, date_to, employee_ids=None):
+        """Yield everyone's attendance in ``[date_from, date_to)`` as
+        ``iter_rows`` reads it"""
+        for data in cls.iter_rows(date_from, date_to, employee_ids):
+            yield cls(*data)
+
     @classmethod
     def get(cls, employee, attendanceDate):
+        uow = unitofwork.current()
+        if uow is not None:
+            data = uow.get(cls.table, (employee.employeeId, datetime(
+                attendanceDate.year, attendanceDate.month,
+                attendanceDate.day)))
+            if data is not None or uow.complete:
+                return cls(*data, employee=employee) if data else None
         query = '''
             Select
                 AttendanceDate, AttendanceStatus, timeStatus,
@@ -262,118 +497,198 @@ class EmployeeAttendance(object):
                                     attendanceDate).fetchone()
         return cls(*data, employee=employee) if data else None
 
-    def _get_eaid(self):
-        query = '''
-            Select eaid
-            From EmployeeAttendance
-            Where employeeId = ? and AttendanceDate = ?
-        '''
-        if self.created:
-            data = Connection().execute(query, self.employeeId,
-                                        self.attendanceDate).fetchone()
-            self._eaid = data[0]
-            self.created = False
+    def _set_eaid(self, eaid):
+        self._eaid = eaid
+
+    def _row(self):
+        return (self.attendanceDate, self.attendanceStatus, self.timeStatus,
+                self.description, self.employeeId, self._eaid)
+
+    # the columns an update sets, and the fields they are set from
+    columns = ('AttendanceStatus', 'TimeStatus', 'description')
+
+    def _fields(self):
+        return (self.attendanceStatus, self.timeStatus, self.description)
 
     def save(self):
-        self._get_eaid()
+        """Insert the row, or update the fields changed since it was read or
+        last saved; a row with none changed is not written"""
+        fields = self._fields()
+        if fields == self._clean:
+            unitofwork.count(self.table, False)
+            return
+        unitofwork.count(self.table, True)
+        uow = unitofwork.current()
+        key = (self.employeeId, self.attendanceDate)
+        if self._eaid is None:
+            # the row may have been written since this object was read
+            self._eaid = unitofwork.identity(self.table, key)
         if self._eaid is None:
             query = '''
                 Insert Into
                 EmployeeAttendance(employeeId, attendanceDate,
                         attendanceStatus, timeStatus, description)
-                Values(?, ?, ?, ?, ?)'''
-            Connection().execute(query, self.employeeId,
-                                 self.attendanceDate, self.attendanceStatus,
-                                 self.timeStatus, self.description)
-            self.created = True
-        else:
+                Output
+                    INSERTED.EAID, INSERTED.employeeId,
+                    INSERTED.attendanceDate
+                Values %s'''
+            params = (self.employeeId, self.attendanceDate,
+                      self.attendanceStatus, self.timeStatus,
+                      self.description)
+            if uow is not None:
+                uow.insert(self.table, key, query, params, self._row(),
+                           self._set_eaid)
+            else:
+                self._eaid = Connection().execute(
+                        query % unitofwork.values(len(params)),
+                        *params).fetchone()[0]
+        elif uow is not None:
+            # every batched update sets all the columns, to share a statement
             query = '''
                 Update EmployeeAttendance
                 Set
                     AttendanceStatus=?, TimeStatus=?, description=?
                 Where
                     EAID=?'''
-            Connection().execute(query, self.attendanceStatus, self.timeStatus,
-                                 self.description, self._eaid)
+            uow.update(self.table, key, query, fields + (self._eaid,),
+                       self._row())
+        else:
+            query, params = unitofwork.narrowed(
+                    self.table, 'EAID', self.columns, fields, self._clean)
+            Connection().execute(query, *(params + (self._eaid,)))
+        self._clean = fields
 
     @classmethod
     def delete_by_emp(cls, employee, timeFrom):
         query = '''
             Delete from EmployeeAttendance
             Where employeeId = ? and attendanceDate >= ? '''
+        unitofwork.sync(cls.table, forget=True)
         Connection().execute(query, employee.employeeId, timeFrom)
 
     @classmethod
     def delete_by_time(cls, timeFrom):
         query = 'Delete from EmployeeAttendance Where attendanceDate >= ?'
+        unitofwork.sync(cls.table, forget=True)
         Connection().execute(query, timeFrom)
 
     @classmethod
-    def mark_present(cls, employee, att_date, late=None):
-        att = cls.get(employee, att_date)
-        save = False
-
-        offday = DayDetail.get(att_date)
-        optday = offday == DayDetail.OPTIONAL
-        holiday = offday and not optday
-
-        if offday:
-            late = False
+    def _day(cls, change):
+        # the change with its date as the row keeps it
+        date = change[1]
+        return (change[0], datetime(date.year, date.month, date.day)) + tuple(
+                change[2:])
 
+    @classmethod
+    def _merged(cls, att, change):
+        # what merge makes of the day's row, None if it is left as it is
+        employeeId, att_date, status, timeStatus, descr, rule = change
         if att is None:
-            att = EmployeeAttendance(
-                    att_date, employee=employee)
-            save = True
+            return cls(att_date, status, timeStatus, descr, employeeId)
 
-        if att.attendanceStatus != cls.Status.P:
-            att.attendanceStatus = cls.Status.P
-            save = True
-
-        if holiday:
-            if att.timeStatus != cls.TimeStatus.OVERTIME:
-                att.timeStatus = cls.TimeStatus.OVERTIME
+        save = False
+        if rule == cls.MERGE_PRESENT:
+            if att.attendanceStatus != status:
+                att.attendanceStatus = status
                 save = True
-
-        elif late is not None:
-            if late and att.timeStatus == '':
-                att.timeStatus = cls.TimeStatus.LATE
+            if att.timeStatus != timeStatus and (
+                    timeStatus == cls.TimeStatus.OVERTIME or
+                    timeStatus == cls.TimeStatus.LATE and
+                    att.timeStatus == '' or
+                    timeStatus == cls.TimeStatus.INTIME and
+                    att.timeStatus in (cls.TimeStatus.LATE, '')):
+                att.timeStatus = timeStatus
                 save = True
-            elif not late and att.timeStatus in (cls.TimeStatus.LATE, ''):
-                att.timeStatus = cls.TimeStatus.INTIME
+        else:
+            if (att.attendanceStatus in (cls.Status.H, cls.Status.A) and
+                    att.attendanceStatus != status):
+                att.attendanceStatus = status
+                save = True
+            if (att.description in (DayDetail.OPTIONAL, '') and
+                    att.description != descr):
+                att.description = descr
                 save = True
+        return att if save else None
 
-        if save:
-            att.save()
+    @classmethod
+    def _merge_rows(cls, changes):
+        query = backend.read_query('MergeAttendance.sql', cls.merge_query)
+        Connection().execute(
+                query % unitofwork.values(len(changes[0]), len(changes)),
+                *[param for change in changes for param in change])
 
     @classmethod
-    def mark_absent(cls, employee, att_date):
-        att = cls.get(employee, att_date)
+    def merge(cls, changes):
+        """Apply ``(employeeId, attendanceDate, attendanceStatus, timeStatus,
+        description, rule)`` changes without reading the rows first
+
+        A day without a row gets one as given. ``rule`` says what becomes
+        of a row already there: ``MERGE_PRESENT`` makes it present with the
+        time status unless that would demote it, ``MERGE_ABSENT`` only
+        turns absences and holidays into one another, as ``mark_present``
+        and ``mark_absent`` do. The changes are sent with ``merge_query``
+        when the unit of work flushes, one of their own if none is open;
+        a complete unit of work applies them to its rows.
+        """
+        uow = unitofwork.current()
+        if uow is None:
+            with unitofwork.UnitOfWork():
+                return cls.merge(changes)
+
+        for change in changes:
+            change = cls._day(change)
+            key = change[:2]
+            if not uow.complete:
+                uow.merge(cls.table, key, change, cls._merge_rows)
+                continue
+            data = uow.get(cls.table, key)
+            att = cls._merged(cls(*data) if data else None, change)
+            if att is not None:
+                att.save()
+            else:
+                unitofwork.count(cls.table, False)
+
+    @classmethod
+    def presence(cls, employee, att_date, late=None):
+        """The change ``mark_present`` merges"""
         offday = DayDetail.get(att_date)
+        if offday and offday != DayDetail.OPTIONAL:
+            timeStatus = cls.TimeStatus.OVERTIME
+        elif offday:
+            timeStatus = cls.TimeStatus.INTIME
+        elif late is None:
+            timeStatus = ''
+        else:
+            timeStatus = cls.TimeStatus.LATE if late else cls.TimeStatus.INTIME
+        return (employee.employeeId, att_date, cls.Status.P, timeStatus, '',
+                cls.MERGE_PRESENT)
 
+    @classmethod
+    def absence(cls, employee, att_date, offday=None):
+        """The change ``mark_absent`` merges, for a day ``DayDetail`` says
+        ``offday`` of when given"""
+        if offday is None:
+            offday = DayDetail.get(att_date)
         status = cls.Status.A if not offday else cls.Status.H
         descr = (DayDetail.OPTIONAL
                  if offday == DayDetail.OPTIONAL else '')
+        return (employee.employeeId, att_date, status, '', descr,
+                cls.MERGE_ABSENT)
 
-        if att is None:
-            att = cls(
-                att_date,
-                attendanceStatus=status,
-                description=descr,
-                employee=employee)
-            att.save()
+    @classmethod
+    def mark_present(cls, employee, att_date, late=None):
+        cls.merge([cls.presence(employee, att_date, late)])
 
-        else:
-            save = False
-            if (att.attendanceStatus in (cls.Status.H, cls.Status.A) and
-                    att.attendanceStatus != status):
-                att.attendanceStatus = status
-                save = True
-            if (att.description in (DayDetail.OPTIONAL, '') and
-                    att.description != descr):
-                att.description = descr
-                save = True
-            if save:
-                att.save()
+    @classmethod
+    def mark_absent(cls, employee, att_date):
+        cls.merge([cls.absence(employee, att_date)])
+
+    @classmethod
+    def mark_absent_range(cls, employee, date_from, date_to):
+        """``mark_absent`` every day in ``[date_from, date_to)``, merged
+        together"""
+        cls.merge([cls.absence(employee, day, offday) for day, offday in
+                   DayDetail.get_range(date_from, date_to)])
 
 
 EAStatus = EmployeeAttendance.Status
@@ -381,6 +696,13 @@ TimeStatus = EmployeeAttendance.TimeStatus
 
 
 class AttendanceDetail(object):
+    __slots__ = ('employeeId', 'trackDate', 'inOutTime', 'inOutStatus',
+                 'inOutType', '_adid', '_inOutId', '_employee', '_clean')
+
+    table = 'AttendanceDetails'
+    # an InOutIdAllocator installed here hands out new InOutIDs
+    inOutIds = None
+
     class Types:
         SOFT = 'soft'
         COMPUTED = SOFT
@@ -414,7 +736,8 @@ class AttendanceDetail(object):
             self.employeeId = employee.employeeId
         if self.employeeId is None:
             raise ValueError('Must specify employee ID')
-        self.created = False
+        # the fields as the row has them, None while that is not known
+        self._clean = self._fields() if adid is not None else None
 
     def __str__(self):
         return '<Attendance Detail: %s, %s, %r, %s >' % (
@@ -448,6 +771,7 @@ class AttendanceDetail(object):
             Order By
                 inOutTime
         '''
+        unitofwork.sync(cls.table)
         cur = Connection().execute(
                 query, employee.employeeId, time_from, status)
         return [cls(*data, employee=employee) for data in cur]
@@ -467,6 +791,12 @@ class AttendanceDetail(object):
 
     @classmethod
     def get_by_inOutId(cls, employee, inOutId, inOutStatus):
+        uow = unitofwork.current()
+        if uow is not None:
+            data = uow.get(cls.table,
+                           (employee.employeeId, inOutId, inOutStatus))
+            if data is not None or uow.complete:
+                return cls(*data, employee=employee) if data else None
         query = '''
             Select
                 inOutTime, inOutStatus, inOutType, employeeId, trackDate, adid,
@@ -481,11 +811,19 @@ class AttendanceDetail(object):
 
     @classmethod
     def generateInOutID(self, employeeId):
+        inOutIds = _hook('inOutIds', self.inOutIds)
+        if inOutIds is not None:
+            return inOutIds.next(employeeId)
         query = '''
             Select IsNull(Max(InOutID),0) + 1
             from AttendanceDetails
             where EmployeeID = ?'''
         data = Connection().execute(query, employeeId).fetchone()
+        uow = unitofwork.current()
+        if uow is not None:
+            pending = [row[6] + 1 for row in uow.rows(self.table)
+                       if row[3] == employeeId]
+            return max([data[0]] + pending)
         return data[0]
 
     def _ensure_inOutId(self):
@@ -495,16 +833,8 @@ class AttendanceDetail(object):
             else:
                 raise ValueError('Must Specify inOutId')
 
-    def _get_adid(self):
-        query = '''
-        Select adid from AttendanceDetails
-        Where employeeId = ? and inOutId = ?
-        '''
-        if self.created:
-            data = Connection().execute(query, self.employeeId,
-                                        self._inOutId).fetchone()
-            self._adid = data[0]
-            self.created = False
+    def _set_adid(self, adid):
+        self._adid = adid
 
     def get_session(self):
         if self.inOutId is None:
@@ -520,23 +850,55 @@ class AttendanceDetail(object):
 
     def _set_track_date(self):
         if self.trackDate is None:
-            self.trackDate = self.employee.shift.get_track_date(self.inOutTime)
+            self.trackDate = self.employee.shift_at(
+                    self.inOutTime).get_track_date(self.inOutTime)
+
+    def _row(self):
+        return (self.inOutTime, self.inOutStatus, self.inOutType,
+                self.employeeId, self.trackDate, self._adid, self._inOutId)
+
+    # the columns an update sets, and the fields they are set from
+    columns = ('TrackDate', 'inOutTime', 'InOutType')
+
+    def _fields(self):
+        return (self.trackDate, self.inOutTime, self.inOutType)
 
     def save(self):
+        """Insert the entry, or update the fields changed since it was read
+        or last saved; an entry with none changed is not written"""
         self._ensure_inOutId()
-        self._get_adid()
         self._set_track_date()
+        fields = self._fields()
+        if fields == self._clean:
+            unitofwork.count(self.table, False)
+            return
+        unitofwork.count(self.table, True)
+        uow = unitofwork.current()
+        key = (self.employeeId, self._inOutId, self.inOutStatus)
+        if self._adid is None:
+            # the row may have been written since this object was read
+            self._adid = unitofwork.identity(self.table, key)
         if self._adid is None:
             query = '''
                 Insert INTO
                 AttendanceDetails(InOutID, EmployeeID, TrackDate, InOutTime,
                     InOutStatus, inOutType)
-                Values(?, ?, ?, ?, ?, ?);
+                Output
+                    INSERTED.ADID, INSERTED.EmployeeID, INSERTED.InOutID,
+                    INSERTED.InOutStatus
+                Values %s;
             '''
-            Connection().execute(
-                    query, self.inOutId, self.employeeId, self.trackDate,
-                    self.inOutTime, self.inOutStatus, self.inOutType)
-        else:
+            params = (self.inOutId, self.employeeId, self.trackDate,
+                      self.inOutTime, self.inOutStatus, self.inOutType)
+            if uow is not None:
+                uow.insert(self.table, key, query, params, self._row(),
+                           self._set_adid)
+            else:
+                self._adid = Connection().execute(
+                        query % unitofwork.values(len(params)),
+                        *params).fetchone()[0]
+        elif uow is not None:
+            # every batched update sets all the columns, to share a statement
             query = '''
                 Update AttendanceDetails
                 Set
@@ -544,8 +906,13 @@ class AttendanceDetail(object):
                 Where
                     ADID = ?
             '''
-            Connection().execute(query, self.trackDate, self.inOutTime,
-                                 self.inOutType, self._adid)
+            uow.update(self.table, key, query, fields + (self._adid,),
+                       self._row())
+        else:
+            query, params = unitofwork.narrowed(
+                    self.table, 'ADID', self.columns, fields, self._clean)
+            Connection().execute(query, *(params + (self._adid,)))
+        self._clean = fields
 
     @classmethod
     def get_earlier_entry(cls, employee, time, inOutStatus=Status.IN):
@@ -559,6 +926,7 @@ class AttendanceDetail(object):
         Order by
             inOutTime Desc
         '''
+        unitofwork.sync(cls.table)
         data = Connection().execute(query, time, inOutStatus,
                                     employee.employeeId).fetchone()
         return cls(*data, employee=employee) if data else None
@@ -575,6 +943,7 @@ class AttendanceDetail(object):
         Order by
             inOutTime
         '''
+        unitofwork.sync(cls.table)
         data = Connection().execute(query, time, inOutStatus,
                                     employee.employeeId).fetchone()
         return cls(*data, employee=employee) if data else None
@@ -584,12 +953,20 @@ class AttendanceDetail(object):
         query = '''
             Delete from AttendanceDetails
             Where employeeId = ? and inOutTime >= ? '''
+        unitofwork.sync(cls.table, forget=True)
         Connection().execute(query, employee.employeeId, timeFrom)
+        timelines = _hook('timelines', Session.timelines)
+        if timelines is not None:
+            timelines.discard(employee)
 
     @classmethod
     def delete_by_time(cls, timeFrom):
         query = ''' Delete from AttendanceDetails Where inOutTime >= ? '''
+        unitofwork.sync(cls.table, forget=True)
         Connection().execute(query, timeFrom)
+        timelines = _hook('timelines', Session.timelines)
+        if timelines is not None:
+            timelines.clear()
 
 
 ADStatus = AttendanceDetail.Status
@@ -597,6 +974,11 @@ ADTypes = AttendanceDetail.Types
 
 
 class Session(object):
+    # the shift and track date are worked out once, until a time changes
+    __slots__ = ('in_entry', 'out_entry', '_shift', '_trackDate')
+
+    # a TimelineIndex installed here answers neighbour lookups from memory
+    timelines = None
 
     early_offset = MAX_EARLY_START_OFFSET
     grace_inside = IN_SHIFT_SESSION_DURATION
@@ -605,6 +987,8 @@ class Session(object):
     def __init__(self, in_entry, out_entry=None):
         self.in_entry = in_entry
         self.out_entry = out_entry
+        self._shift = None
+        self._trackDate = None
 
     @property
     def employee(self):
@@ -631,6 +1015,7 @@ class Session(object):
 
         def fset(self, value):
             self.in_entry.inOutTime = value
+            self._shift = self._trackDate = None
 
         return locals()
 
@@ -650,6 +1035,7 @@ class Session(object):
                 self.make_out_entry(value)
             else:
                 self.out_entry.inOutTime = value
+            self._trackDate = None
 
         return locals()
 
@@ -670,15 +1056,23 @@ class Session(object):
 
     outType = property(**outType())
 
+    @property
+    def shift(self):
+        """The shift that applied when the session started"""
+        if self._shift is None:
+            self._shift = self.employee.shift_at(self.inTime)
+        return self._shift
+
     @property
     def trackDate(self):
-        early_date = self.employee.shift.get_track_date(
-                self.inTime + self.early_offset)
-        if self.outTime is not None:
-            out_date = self.employee.shift.get_track_date(self.outTime)
-            if out_date < early_date:
-                return out_date
-        return early_date
+        if self._trackDate is None:
+            shift = self.shift
+            track_date = shift.get_track_date(self.inTime + self.early_offset)
+            if self.outTime is not None:
+                track_date = min(track_date,
+                                 shift.get_track_date(self.outTime))
+            self._trackDate = track_date
+        return self._trackDate
 
     def __str__(self):
         return ('<Session: %s, %s (%s) --> %s (%s)>' % (
@@ -699,6 +1093,7 @@ class Session(object):
             inOutType=typ,
             inOutId=self.in_entry.inOutId,
             employee=self.in_entry.employee)
+        self._trackDate = None
 
     def is_between(self, time):
         if self.outTime is not None:
@@ -735,9 +1130,15 @@ class Session(object):
             self.out_entry.inOutId = self.in_entry.inOutId
             self.out_entry.trackDate = self.trackDate
             self.out_entry.save()
+        timelines = _hook('timelines', self.timelines)
+        if timelines is not None:
+            timelines.update(self)
 
     @classmethod
     def get_previous_session(cls, employee, inTime):
+        timelines = _hook('timelines', cls.timelines)
+        if timelines is not None:
+            return timelines.previous(employee, inTime)
         try:
             entry = AttendanceDetail.get_earlier_entry(employee, inTime)
             return entry.get_session()
@@ -746,6 +1147,9 @@ class Session(object):
 
     @classmethod
     def get_next_session(cls, employee, inTime):
+        timelines = _hook('timelines', cls.timelines)
+        if timelines is not None:
+            return timelines.next(employee, inTime)
         try:
             return AttendanceDetail.get_later_entry(employee,
                                                     inTime).get_session()
@@ -759,17 +1163,13 @@ class Session(object):
                                                    self.inTime)
         inDate = self.trackDate
         if prevSession:
-            prevDate = self.employee.shift.get_track_date(prevSession.outTime)
+            prevDate = prevSession.shift.get_track_date(prevSession.outTime)
         else:
             prevDate = inDate
-        dateCounter = prevDate
-
-        while dateCounter < inDate:
-            EmployeeAttendance.mark_absent(self.employee, dateCounter)
-            dateCounter += timedelta(days=1)
+        EmployeeAttendance.mark_absent_range(self.employee, prevDate, inDate)
 
         # mark today
-        shift = self.employee.shift
+        shift = self.shift
         dateCounter = inDate
         present = shift.is_between(self.inTime) or (
             self.outTime is not None and
@@ -800,13 +1200,14 @@ class Session(object):
             return
 
         # collect intervening shift times
+        shift = self.shift
         date_counter = self.trackDate.date()
         start_times, end_times = [], []
 
         while date_counter <= self.outTime.date():
 
-            start_time = self.employee.shift.start_time(date_counter)
-            end_time = self.employee.shift.end_time(date_counter)
+            start_time = shift.start_time(date_counter)
+            end_time = shift.end_time(date_counter)
 
             if self.is_between(start_time):
                 start_times.append(start_time)
@@ -816,7 +1217,7 @@ class Session(object):
 
             date_counter += timedelta(days=1)
 
-        is_early_start = self.employee.shift.is_early_start(self.inTime)
+        is_early_start = shift.is_early_start(self.inTime)
 
         if ((is_early_start and len(start_times) > 1) or
                 (not is_early_start and len(start_times) > 0)):
@@ -828,11 +1229,11 @@ class Session(object):
             if outType == ADTypes.SOFT:
                 make_two = False
 
-                if self.employee.shift.is_early_start(self.inTime):
+                if shift.is_early_start(self.inTime):
                     self.outTime = min(
                         start_times[0] + self.grace_inside, outTime)
 
-                elif self.employee.shift.is_between(self.inTime):
+                elif shift.is_between(self.inTime):
                     self.outTime = min(
                         self.inTime + self.grace_inside,
                         outTime, end_times[0] + self.grace_outside)
@@ -888,6 +1289,10 @@ class Session(object):
 
 
 class FPEntry(object):
+    __slots__ = ('_empcode', 'tid', '_date', '_time', '_emp', '_datetime')
+
+    table = 'FPEntries'
+
     __tid_to_inout__ = {
         1: ADStatus.IN,
         2: ADStatus.OUT,
@@ -917,9 +1322,22 @@ class FPEntry(object):
     def __init__(self, empcode, tid, date, time):
         self._empcode = int(empcode)
         self.tid = int(tid)
-        self.date = str(date)
-        self.time = str(time)
+        self._date = str(date)
+        self._time = str(time)
         self._emp = None
+        self._datetime = None
+
+    @classmethod
+    def from_punch(cls, punch, employee=None):
+        """The entry of a decoded ``Punch``, with nothing left to parse"""
+        entry = cls.__new__(cls)
+        entry._empcode = punch.code
+        entry.tid = punch.tid
+        entry._date = punch.date
+        entry._time = punch.time
+        entry._emp = employee
+        entry._datetime = punch.datetime
+        return entry
 
     @property
     def empcode(self):
@@ -939,15 +1357,49 @@ class FPEntry(object):
     def typ(self):
         return self.__tid_to_type__.get(self.tid, ADTypes.BIOM)
 
+    def date():
+        doc = "C_Date of the entry, as YYYYMMDD"
+
+        def fget(self):
+            return self._date
+
+        def fset(self, value):
+            self._date = str(value)
+            self._datetime = None
+
+        return locals()
+
+    date = property(**date())
+
+    def time():
+        doc = "C_Time of the entry, as HHMMSS"
+
+        def fget(self):
+            return self._time
+
+        def fset(self, value):
+            self._time = str(value)
+            self._datetime = None
+
+        return locals()
+
+    time = property(**time())
+
     @property
     def datetime(self):
-        return datetime.strptime(' '.join([self.date, self.time]),
-                                 '%Y%m%d %H%M%S')
+        if self._datetime is None:
+            self._datetime = datetime.strptime(
+                    ' '.join([self._date, self._time]), '%Y%m%d %H%M%S')
+        return self._datetime
 
     def save(self):
         insert_sql = ('insert into '
                       'FPEntries(C_Date, C_Time, L_TID, L_UID) '
                       'Values(?, ?, ?, ?)')
+        uow = unitofwork.current()
+        if uow is not None:
+            return uow.insert(self.table, None, insert_sql, (
+                self.date, self.time, self.tid, self._empcode))
         return Connection().execute(insert_sql, self.date, self.time, self.tid,
                                     self._empcode)
 
@@ -1075,6 +1527,7 @@ class FPEntry(object):
         query = '''
             Delete from FPEntries
             Where L_UID = ? and C_Date + C_Time >= ?'''
+        unitofwork.sync(cls.table)
         return Connection().execute(
                 query, employee.employeeCode,
                 time_from.strftime('%Y%m%d%H%M%S'))
@@ -1082,4 +1535,5 @@ class FPEntry(object):
     @classmethod
     def delete_by_time(cls, time_from):
         query = 'Delete from FPEntries Where C_Date + C_Time >= ?'
+        unitofwork.sync(cls.table)
         Connection().execute(query, time_from.strftime('%Y%m%d%H%M%S'))
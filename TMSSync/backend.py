@@ -0,0 +1,278 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from . import config
+
+
+__all__ = ['SQLServerBackend', 'SQLiteBackend', 'get_backend', 'read_query']
+
+
+__DIR__ = os.path.dirname(__file__)
+__QUERIES_DIR__ = os.path.join(__DIR__, 'queries')
+
+
+class SQLServerBackend(object):
+    """SQL Server through pyodbc, which is only imported when connecting
+
+    The queries are written for it, so they are run as they are.
+    """
+
+    name = 'mssql'
+
+    # SQLSTATEs that mean the link to the server is gone
+    disconnect_states = frozenset(
+            ['08S01', '08001', '08003', '08004', '08007'])
+
+    def __init__(self, conn_str):
+        self.conn_str = conn_str
+
+    @property
+    def module(self):
+        import pyodbc
+        return pyodbc
+
+    @property
+    def Error(self):
+        return self.module.Error
+
+    @property
+    def ProgrammingError(self):
+        return self.module.ProgrammingError
+
+    def connect(self, conn_str=None):
+        conn = self.module.connect(conn_str or self.conn_str)
+        conn.autocommit = True
+        return conn
+
+    def is_disconnect(self, error):
+        return bool(error.args) and error.args[0] in self.disconnect_states
+
+    def close(self):
+        pass
+
+
+def _to_datetime(value):
+    value = value.decode()
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Not a datetime: %r' % value)
+
+
+# T-SQL the queries use and what SQLite says instead
+_REWRITES = [
+    (re.compile(r'\bIsNull\(', re.I), 'IfNull('),
+    (re.compile(r'\bGETDATE\(\)', re.I), "datetime('now', 'localtime')"),
+    (re.compile(r'\b((?:\w+\.)?C_Date) \+ ((?:\w+\.)?C_Time)\b'), r'\1 || \2'),
+    (re.compile(r'\bdbo\.'), ''),
+]
+_OUTPUT = re.compile(
+        r'\bOutput\s+(.*?)\s+(Values\s+.*?);?\s*$', re.I | re.S)
+_TRANSACTIONS = [
+    (re.compile(r'^BEGIN TRANSACTION$'), 'BEGIN IMMEDIATE'),
+    (re.compile(r'^COMMIT TRANSACTION$'), 'COMMIT'),
+    (re.compile(r'^SAVE TRANSACTION (\w+)$'), r'SAVEPOINT \1'),
+    (re.compile(r'^ROLLBACK TRANSACTION (\w+)$'), r'ROLLBACK TO \1'),
+]
+_ROLLBACK = 'IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION'
+
+
+def translate(query):
+    """The SQLite for a statement of the queries written for SQL Server
+
+    Covers what the statements outside the query files use: ``IsNull``,
+    ``GETDATE()``, joining ``C_Date + C_Time``, ``dbo.``, inserts with an
+    ``Output`` clause and the transaction statements.
+    """
+    query = query.strip()
+    for pattern, replacement in _TRANSACTIONS:
+        if pattern.match(query):
+            return pattern.sub(replacement, query)
+    for pattern, replacement in _REWRITES:
+        query = pattern.sub(replacement, query)
+    match = _OUTPUT.search(query)
+    if match:
+        query = '%s%s Returning %s' % (
+            query[:match.start()], match.group(2),
+            match.group(1).replace('INSERTED.', ''))
+    return query
+
+
+class SQLiteCursor(object):
+    """A sqlite3 cursor taking the statements a pyodbc one would"""
+
+    fast_executemany = False
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursor = conn.raw.cursor()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, *args):
+        if len(args) == 1 and isinstance(args[0], (list, tuple)):
+            args = tuple(args[0])
+        if query.strip() == _ROLLBACK:
+            if self._conn.raw.in_transaction:
+                self._cursor.execute('ROLLBACK')
+            return self
+        query, script = self._conn.translate(query)
+        if script and not args:
+            self._cursor.executescript(query)
+        else:
+            self._cursor.execute(query, args)
+        return self
+
+    def executemany(self, query, params):
+        self._cursor.executemany(
+                self._conn.translate(query)[0], [tuple(row) for row in params])
+        return self
+
+    def nextset(self):
+        return False
+
+
+def _is_script(query):
+    # whether there is more than one statement, which execute refuses
+    statement = ''
+    for line in query.splitlines(True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            rest = re.sub(r'--[^\n]*', '', query[len(statement):])
+            return bool(rest.strip())
+    return False
+
+
+class SQLiteConnection(object):
+    """What ``PooledConnection`` needs of a connection, on sqlite3"""
+
+    def __init__(self, raw, shared=False):
+        self.raw = raw
+        self.shared = shared
+        self._translated = {}
+
+    def translate(self, query):
+        """The SQLite for ``query`` and whether it is a script"""
+        translated = self._translated.get(query)
+        if translated is None:
+            sqlite_query = translate(query)
+            translated = self._translated[query] = (
+                    sqlite_query, _is_script(sqlite_query))
+        return translated
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def execute(self, query, *args):
+        return self.cursor().execute(query, *args)
+
+    def close(self):
+        if not self.shared:
+            self.raw.close()
+
+
+class SQLiteBackend(object):
+    """An embedded SQLite database in a file or in memory
+
+    Statements written for SQL Server are translated on the fly and the
+    query files are read from ``queries/sqlite`` where they differ, with
+    ``Setup.sql`` creating every table the engine uses, including the
+    ``tEnter`` and ``ManualEntry`` tables new punches are read from.
+
+    A file database is opened in WAL mode, one connection per pooled
+    connection; writers take turns, so transactions start as ``BEGIN
+    IMMEDIATE``. An in-memory database lives in one connection that every
+    pooled connection shares, which suits a single worker only.
+    """
+
+    name = 'sqlite'
+    disconnect_states = frozenset()
+    Error = sqlite3.Error
+    ProgrammingError = sqlite3.ProgrammingError
+    timeout = 30
+
+    def __init__(self, path):
+        self.conn_str = path or ':memory:'
+        self._memory = None
+        self._lock = threading.Lock()
+        sqlite3.register_adapter(
+                datetime, lambda value: value.isoformat(' '))
+        sqlite3.register_converter('DATETIME', _to_datetime)
+        sqlite3.register_converter('TIMESTAMP', _to_datetime)
+
+    def _open(self, path):
+        return sqlite3.connect(
+                path, timeout=self.timeout, isolation_level=None,
+                detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+
+    def connect(self, conn_str=None):
+        path = conn_str or self.conn_str
+        if path == ':memory:':
+            with self._lock:
+                if self._memory is None:
+                    self._memory = self._open(path)
+            return SQLiteConnection(self._memory, shared=True)
+        raw = self._open(path)
+        raw.execute('PRAGMA journal_mode=WAL')
+        return SQLiteConnection(raw)
+
+    def is_disconnect(self, error):
+        return False
+
+    def close(self):
+        """Drop the in-memory database"""
+        with self._lock:
+            if self._memory is not None:
+                self._memory.close()
+                self._memory = None
+
+
+BACKENDS = {'mssql': SQLServerBackend, 'sqlite': SQLiteBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The backend ``config.BACKEND`` names, made on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None or _backend.name != config.BACKEND:
+            if config.BACKEND not in BACKENDS:
+                raise ValueError('Unknown backend %r' % config.BACKEND)
+            if config.BACKEND == 'sqlite':
+                _backend = SQLiteBackend(config.SQLITE_PATH)
+            else:
+                _backend = SQLServerBackend(config.DB_CONN_STR)
+        return _backend
+
+
+_queries = {}
+
+
+def read_query(name, default=None):
+    """The text of the query file ``name``
+
+    The backend's own version in ``queries/<backend>`` is preferred. Without
+    one ``default`` is returned if given, for statements kept in the code,
+    and the file in ``queries`` otherwise.
+    """
+    path = os.path.join(__QUERIES_DIR__, get_backend().name, name)
+    if not os.path.exists(path):
+        if default is not None:
+            return default
+        path = os.path.join(__QUERIES_DIR__, name)
+    query = _queries.get(path)
+    if query is None:
+        with open(path) as query_file:
+            query = _queries[path] = query_file.read()
+    return query
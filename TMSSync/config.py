@@ -2,7 +2,14 @@ import configparser
 import os
 
 
-__all__ = ['DB_CONN_STR', 'read_config']
+__all__ = ['DB_CONN_STR', 'BACKEND', 'SQLITE_PATH', 'SYNC_BATCH_SIZE',
+           'SYNC_WORKERS', 'SYNC_LOOKBACK_MINUTES', 'SYNC_CHUNK_SIZE',
+           'SYNC_TRANSACTIONAL', 'SYNC_INOUTID_BLOCK_SIZE',
+           'SYNC_MAX_ATTEMPTS', 'POOL_SIZE', 'POOL_HEALTH_CHECK_INTERVAL',
+           'POOL_CURSOR_CACHE_SIZE', 'POOL_TIMEOUT', 'DAEMON_MIN_INTERVAL',
+           'DAEMON_MAX_INTERVAL', 'DAEMON_BACKOFF', 'DAEMON_CACHE_TTL',
+           'STATS_ENABLED', 'STATS_SUMMARY_SIZE', 'STATS_PROMETHEUS_FILE',
+           'read_config']
 
 
 currentdir = os.path.dirname(__file__)
@@ -10,18 +17,112 @@ configfile = os.path.join(currentdir, 'config.ini')
 
 
 DB_CONN_STR = ''
+BACKEND = 'mssql'
+SQLITE_PATH = ''
+SYNC_BATCH_SIZE = 500
+SYNC_WORKERS = 1
+SYNC_LOOKBACK_MINUTES = 60
+SYNC_CHUNK_SIZE = 5000
+SYNC_TRANSACTIONAL = False
+SYNC_INOUTID_BLOCK_SIZE = 16
+SYNC_MAX_ATTEMPTS = 3
+POOL_SIZE = 8
+POOL_HEALTH_CHECK_INTERVAL = 30
+POOL_CURSOR_CACHE_SIZE = 64
+POOL_TIMEOUT = None
+DAEMON_MIN_INTERVAL = 5
+DAEMON_MAX_INTERVAL = 120
+DAEMON_BACKOFF = 2
+DAEMON_CACHE_TTL = 3600
+STATS_ENABLED = False
+STATS_SUMMARY_SIZE = 15
+STATS_PROMETHEUS_FILE = ''
 
 
-def _get_connection_str():
+def _get_connection_str(parser):
     global DB_CONN_STR
-    parser = configparser.ConfigParser()
-    parser.read(configfile)
     DB_CONN_STR = ';'.join(
             '%s=%s' % item for item in parser['Connection'].items())
 
 
+def _get_backend_options(parser):
+    global BACKEND, SQLITE_PATH
+    if parser.has_section('Backend'):
+        section = parser['Backend']
+        BACKEND = section.get('name', BACKEND)
+        SQLITE_PATH = section.get('sqlite_path', SQLITE_PATH)
+    # so the tests and tools can be pointed elsewhere without editing
+    BACKEND = os.environ.get('TMSSYNC_BACKEND', BACKEND)
+    SQLITE_PATH = os.environ.get('TMSSYNC_SQLITE_PATH', SQLITE_PATH)
+
+
+def _get_sync_options(parser):
+    global SYNC_BATCH_SIZE, SYNC_WORKERS, SYNC_LOOKBACK_MINUTES
+    global SYNC_CHUNK_SIZE, SYNC_TRANSACTIONAL, SYNC_INOUTID_BLOCK_SIZE
+    global SYNC_MAX_ATTEMPTS
+    if not parser.has_section('Sync'):
+        return
+    section = parser['Sync']
+    SYNC_BATCH_SIZE = section.getint('batch_size', SYNC_BATCH_SIZE)
+    SYNC_WORKERS = section.getint('workers', SYNC_WORKERS)
+    SYNC_LOOKBACK_MINUTES = section.getint(
+            'lookback_minutes', SYNC_LOOKBACK_MINUTES)
+    SYNC_CHUNK_SIZE = section.getint('chunk_size', SYNC_CHUNK_SIZE)
+    SYNC_TRANSACTIONAL = section.getboolean(
+            'transactional', SYNC_TRANSACTIONAL)
+    SYNC_INOUTID_BLOCK_SIZE = section.getint(
+            'inoutid_block_size', SYNC_INOUTID_BLOCK_SIZE)
+    SYNC_MAX_ATTEMPTS = section.getint('max_attempts', SYNC_MAX_ATTEMPTS)
+
+
+def _get_pool_options(parser):
+    global POOL_SIZE, POOL_HEALTH_CHECK_INTERVAL, POOL_CURSOR_CACHE_SIZE
+    global POOL_TIMEOUT
+    if not parser.has_section('Pool'):
+        return
+    section = parser['Pool']
+    POOL_SIZE = section.getint('size', POOL_SIZE)
+    POOL_HEALTH_CHECK_INTERVAL = section.getfloat(
+            'health_check_interval', POOL_HEALTH_CHECK_INTERVAL)
+    POOL_CURSOR_CACHE_SIZE = section.getint(
+            'cursor_cache_size', POOL_CURSOR_CACHE_SIZE)
+    POOL_TIMEOUT = section.getfloat('timeout', POOL_TIMEOUT)
+
+
+def _get_daemon_options(parser):
+    global DAEMON_MIN_INTERVAL, DAEMON_MAX_INTERVAL, DAEMON_BACKOFF
+    global DAEMON_CACHE_TTL
+    if not parser.has_section('Daemon'):
+        return
+    section = parser['Daemon']
+    DAEMON_MIN_INTERVAL = section.getfloat(
+            'min_interval', DAEMON_MIN_INTERVAL)
+    DAEMON_MAX_INTERVAL = section.getfloat(
+            'max_interval', DAEMON_MAX_INTERVAL)
+    DAEMON_BACKOFF = section.getfloat('backoff', DAEMON_BACKOFF)
+    DAEMON_CACHE_TTL = section.getfloat('cache_ttl', DAEMON_CACHE_TTL)
+
+
+def _get_stats_options(parser):
+    global STATS_ENABLED, STATS_SUMMARY_SIZE, STATS_PROMETHEUS_FILE
+    if not parser.has_section('Stats'):
+        return
+    section = parser['Stats']
+    STATS_ENABLED = section.getboolean('enabled', STATS_ENABLED)
+    STATS_SUMMARY_SIZE = section.getint('summary_size', STATS_SUMMARY_SIZE)
+    STATS_PROMETHEUS_FILE = section.get(
+            'prometheus_file', STATS_PROMETHEUS_FILE)
+
+
 def read_config():
-    _get_connection_str()
+    parser = configparser.ConfigParser()
+    parser.read(configfile)
+    _get_connection_str(parser)
+    _get_backend_options(parser)
+    _get_sync_options(parser)
+    _get_pool_options(parser)
+    _get_daemon_options(parser)
+    _get_stats_options(parser)
 
 
 read_config()
@@ -1,32 +1,305 @@
-import pyodbc
-from .config import DB_CONN_STR
+import contextlib
+import threading
+import time
+from collections import OrderedDict
 
+from . import backend
+from . import config
 
-__all__ = ['Connection']
+
+__all__ = ['Connection', 'ConnectionPool', 'PooledConnection']
+
+
+get_backend = backend.get_backend
+
+
+class PooledConnection(object):
+    """A database connection that reconnects and caches cursors
+
+    ``execute`` keeps one cursor per query string, so running the same
+    fixed query again lets the driver reuse the statement it prepared the
+    first time. The cursor returned is only valid until the next statement
+    runs on this connection: unread rows are discarded then, as they were
+    when the throwaway cursors were collected. Rows read while other
+    statements run, as by a generator, come from ``iterate``, which gives
+    the query a cursor of its own. When the server link drops the
+    connection is reopened and the statement retried once, unless a
+    transaction was open.
+
+    The connection stays in autocommit mode; ``begin``, ``commit``,
+    ``savepoint`` and the rollbacks run explicit T-SQL transactions on it.
+    While a ``QueryStats`` is installed on ``stats`` every cursor handed out
+    is wrapped to be counted and timed by it. What connecting means is up to
+    ``backend``, by default the one the config names.
+    """
+
+    stats = None
+
+    def __init__(self, conn_str, cursor_cache_size=64, backend=None):
+        self.conn_str = conn_str
+        self.backend = backend or get_backend()
+        self.cursor_cache_size = cursor_cache_size
+        self._conn = None
+        self._cursors = OrderedDict()
+        self._active = None
+        self._in_transaction = False
+        self.last_used = 0
+        self.connect()
+
+    def connect(self):
+        self.close()
+        self._conn = self.backend.connect(self.conn_str)
+        self._in_transaction = False
+        self.last_used = time.time()
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    @property
+    def in_transaction(self):
+        return self._in_transaction
+
+    def begin(self):
+        self.execute('BEGIN TRANSACTION')
+        self._in_transaction = True
+
+    def commit(self):
+        self.execute('COMMIT TRANSACTION')
+        self._in_transaction = False
+
+    def rollback(self):
+        try:
+            self.execute('IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION')
+        finally:
+            self._in_transaction = False
+
+    def savepoint(self, name):
+        self.execute('SAVE TRANSACTION %s' % name)
+
+    def rollback_to(self, name):
+        self.execute('ROLLBACK TRANSACTION %s' % name)
+
+    def _release_active(self):
+        # discard unread results but keep the prepared statement
+        cursor, self._active = self._active, None
+        if cursor is not None:
+            try:
+                while cursor.nextset():
+                    pass
+            except self.backend.Error:
+                pass
+
+    def _cursor_for(self, query):
+        self._release_active()
+        cursor = self._cursors.pop(query, None)
+        if cursor is None:
+            cursor = self._conn.cursor()
+            if len(self._cursors) >= self.cursor_cache_size:
+                self._cursors.popitem(last=False)[1].close()
+        self._cursors[query] = cursor
+        self._active = cursor
+        return cursor
+
+    def _retrying(self, func):
+        try:
+            return func()
+        except self.backend.Error as error:
+            if not self.backend.is_disconnect(error) or self.in_transaction:
+                raise
+            self.connect()
+            return func()
+
+    def _wrap(self, cursor):
+        stats = self.stats
+        return cursor if stats is None else stats.wrap(cursor)
+
+    def execute(self, query, *args):
+        self.last_used = time.time()
+        return self._retrying(
+                lambda: self._wrap(self._cursor_for(query)).execute(
+                    query, *args))
+
+    def cursor(self):
+        self.last_used = time.time()
+        self._release_active()
+        return self._retrying(lambda: self._wrap(self._conn.cursor()))
+
+    def iterate(self, query, *args):
+        """Yield the rows of ``query`` from a cursor no other statement
+        discards
+
+        A driver that cannot read two results on one connection at once
+        raises when a statement runs before the rows are all read, rather
+        than leaving them out.
+        """
+        self.last_used = time.time()
+        self._release_active()
+        cursor = self._retrying(
+                lambda: self._wrap(self._conn.cursor()).execute(query, *args))
+        try:
+            for row in cursor:
+                yield row
+        finally:
+            try:
+                cursor.close()
+            except self.backend.Error:
+                pass
+
+    def is_healthy(self):
+        try:
+            self._conn.execute('Select 1').fetchone()
+            return True
+        except self.backend.Error:
+            return False
+
+    def close(self):
+        for cursor in self._cursors.values():
+            try:
+                cursor.close()
+            except self.backend.Error:
+                pass
+        self._cursors.clear()
+        self._active = None
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except self.backend.Error:
+                pass
+            self._conn = None
+
+
+class ConnectionPool(object):
+    """At most ``size`` connections handed out by checkout and checkin
+
+    Connections idle for longer than ``health_check_interval`` seconds are
+    pinged before being handed out again and reopened if the ping fails.
+
+    Every thread using ``Connection`` holds one of the ``size`` until it
+    closes it, the main thread included, and ``iter_new_fp_entries`` takes
+    another for the extraction; a parallel sync has ``size - 2`` left for
+    its workers, and the workers beyond wait for a free one.
+    """
+
+    def __init__(self, conn_str, size=8, health_check_interval=30,
+                 cursor_cache_size=64, timeout=None):
+        self.conn_str = conn_str
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.cursor_cache_size = cursor_cache_size
+        self.timeout = timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def checkout(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RuntimeError(
+                    'No database connection free in a pool of %d' % self.size)
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return PooledConnection(self.conn_str, self.cursor_cache_size)
+            if conn.closed or (
+                    time.time() - conn.last_used >= self.health_check_interval
+                    and not conn.is_healthy()):
+                conn.connect()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, conn):
+        if not conn.closed:
+            with self._lock:
+                self._idle.append(conn)
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
 
 
 class Connection(object):
-    _conn = None
+    # every thread checks out its own connection from the pool
+    pool = None
+    _local = threading.local()
+    _pool_lock = threading.Lock()
 
     def __new__(cls):
-        if cls._conn is None:
-            cls.create_new()
+        if cls._get_conn() is None:
+            cls._local.conn = cls.get_pool().checkout()
         return super(Connection, cls).__new__(cls)
 
+    @classmethod
+    def get_pool(cls):
+        with cls._pool_lock:
+            if cls.pool is None:
+                cls.pool = ConnectionPool(
+                    get_backend().conn_str, size=config.POOL_SIZE,
+                    health_check_interval=config.POOL_HEALTH_CHECK_INTERVAL,
+                    cursor_cache_size=config.POOL_CURSOR_CACHE_SIZE,
+                    timeout=config.POOL_TIMEOUT)
+        return cls.pool
+
+    @classmethod
+    def _get_conn(cls):
+        return getattr(cls._local, 'conn', None)
+
+    @property
+    def _conn(self):
+        return self._get_conn()
+
     @classmethod
     def create_new(cls):
-        if cls._conn is not None:
-            cls.close()
-        cls._conn = pyodbc.connect(DB_CONN_STR)
-        cls._conn.autocommit = True
+        conn = cls._get_conn()
+        if conn is None:
+            cls._local.conn = cls.get_pool().checkout()
+        else:
+            conn.connect()
 
     def execute(self, query, *args):
         return self._conn.execute(query, *args)
 
+    def iterate(self, query, *args):
+        return self._conn.iterate(query, *args)
+
     def cursor(self):
         return self._conn.cursor()
 
+    def begin(self):
+        self._conn.begin()
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def savepoint(self, name):
+        self._conn.savepoint(name)
+
+    def rollback_to(self, name):
+        self._conn.rollback_to(name)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Commit the statements run inside, or roll them all back"""
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
     @classmethod
     def close(cls):
-        cls._conn.close()
-        cls._conn = None
+        """Give this thread's connection back to the pool"""
+        conn = cls._get_conn()
+        if conn is not None:
+            cls._local.conn = None
+            cls.get_pool().checkin(conn)
@@ -0,0 +1,126 @@
+from __future__ import print_function
+from . import backend
+from . import config
+from . import connection
+from . import daycalendar
+from . import fpsync
+from . import unitofwork
+import signal
+import threading
+import time
+import traceback
+
+
+__all__ = ['SyncDaemon']
+
+
+Connection = connection.Connection
+
+
+class SyncDaemon(object):
+    """Keeps syncing new entries until it is told to stop
+
+    The database is set up and the caches are installed once. New entries
+    are then polled for every ``min_interval`` seconds while they keep
+    coming; every poll that finds nothing, or fails, multiplies the interval
+    by ``backoff`` up to ``max_interval``. The session timelines and the
+    calendar are read again every ``cache_ttl`` seconds, which picks up rows
+    changed by hand; the employee directory checks itself. ``stop``, which
+    ``run`` installs as the SIGTERM and SIGINT handler, lets the current
+    chunk finish and its watermarks be advanced before the loop ends. With
+    query stats enabled their Prometheus file is written after every poll.
+    The writes of the run are counted and printed when it ends.
+    """
+
+    def __init__(self, workers=None, chunk_size=None, min_interval=None,
+                 max_interval=None, backoff=None, cache_ttl=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.min_interval = (config.DAEMON_MIN_INTERVAL
+                             if min_interval is None else min_interval)
+        self.max_interval = (config.DAEMON_MAX_INTERVAL
+                             if max_interval is None else max_interval)
+        self.backoff = config.DAEMON_BACKOFF if backoff is None else backoff
+        self.cache_ttl = (config.DAEMON_CACHE_TTL
+                          if cache_ttl is None else cache_ttl)
+        self.interval = self.min_interval
+        self._stopping = threading.Event()
+        self._caches = None
+        self._stats = None
+        self._loaded = 0
+
+    def stopping(self):
+        return self._stopping.is_set()
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def next_interval(self, count):
+        """How long to wait after a poll that recorded ``count`` entries"""
+        if count:
+            return self.min_interval
+        return min(self.interval * self.backoff, self.max_interval)
+
+    def refresh(self):
+        """Forget the session timelines and read the calendar again"""
+        emp_directory, calendar, timelines, inOutIds = self._caches
+        timelines.clear()
+        calendar = daycalendar.DayCalendar().install()
+        self._caches = (emp_directory, calendar, timelines, inOutIds)
+        self._loaded = time.time()
+
+    def poll(self):
+        """Record what is new once, return the number of entries"""
+        try:
+            if time.time() - self._loaded >= self.cache_ttl:
+                self.refresh()
+            count = fpsync.sync_new_entries(
+                    self.workers, self.chunk_size, self.stopping)
+        except Exception as error:
+            if isinstance(error, backend.get_backend().Error):
+                print('sync failed: ', str(error))
+            else:
+                traceback.print_exc()
+            # what the timelines hold may not have been written
+            self._loaded = 0
+            count = 0
+        self.interval = self.next_interval(count)
+        fpsync.report_query_stats(self._stats, summary=False)
+        return count
+
+    def _handle_signals(self):
+        previous = {}
+        for name in ('SIGTERM', 'SIGINT', 'SIGBREAK'):
+            signum = getattr(signal, name, None)
+            if signum is not None:
+                previous[signum] = signal.signal(signum, self.stop)
+        return previous
+
+    def run(self):
+        previous = {}
+        if threading.current_thread() is threading.main_thread():
+            previous = self._handle_signals()
+        self._stats = fpsync.install_query_stats()
+        counts = unitofwork.WriteCounts().install()
+        try:
+            fpsync.setup_database()
+            self._caches = fpsync.install_caches()
+            self._loaded = time.time()
+            while not self.stopping():
+                self.poll()
+                if not self.stopping():
+                    self._stopping.wait(self.interval)
+            print('Stopped')
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            if self._caches is not None:
+                fpsync.uninstall_caches(self._caches)
+                self._caches = None
+            counts.uninstall()
+            print(counts.summary())
+            if self._stats is not None:
+                self._stats.uninstall()
+                fpsync.report_query_stats(self._stats)
+                self._stats = None
+            Connection.close()
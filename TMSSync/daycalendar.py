@@ -0,0 +1,136 @@
+import threading
+from datetime import date, datetime, timedelta
+
+from . import connection
+from . import attendance
+
+
+__all__ = ['DayCalendar']
+
+
+Connection = connection.Connection
+
+
+DAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+             'saturday', 'sunday')
+
+
+class DayCalendar(object):
+    """Company wide holiday and weekend calendar answered from memory
+
+    ``DayDetails`` and ``Weekend`` are read once and every loaded year is kept
+    as a bytearray of day codes indexed by day of year, with holiday
+    descriptions in a side map. Years outside the initial range are loaded on
+    first use. ``get`` answers exactly what ``DayDetail.get`` would.
+    """
+
+    WORKING = 0
+    HOLIDAY = 1
+    WEEKEND = 2
+    OPTIONAL = 3
+
+    def __init__(self, date_from=None, date_to=None, saturday_optional=None):
+        if saturday_optional is None:
+            saturday_optional = attendance.DayDetail.saturday_optional
+        self.saturday_optional = saturday_optional
+        self._years = {}
+        self._descriptions = {}
+        self._lock = threading.Lock()
+        self._weekend = self._get_weekend_days()
+        if date_from is not None:
+            self.load(date_from, date_to or date_from)
+
+    @staticmethod
+    def _get_weekend_days():
+        query = 'Select Weekend from Weekend'
+        names = set(str(row[0]).strip().lower()
+                    for row in Connection().execute(query))
+        return frozenset(
+                i for i, name in enumerate(DAY_NAMES) if name in names)
+
+    def load(self, date_from, date_to):
+        with self._lock:
+            years = [year for year in range(date_from.year, date_to.year + 1)
+                     if year not in self._years]
+            if years:
+                self._load_years(years[0], years[-1])
+
+    def _load_years(self, first, last):
+        query = '''
+            Select todayDate, Description
+            From DayDetails
+            Where todayDate >= ? and todayDate < ?'''
+        years = {}
+        for year in range(first, last + 1):
+            years[year] = self._make_year(year)
+
+        for todayDate, description in Connection().execute(
+                query, datetime(first, 1, 1), datetime(last + 1, 1, 1)):
+            key = (todayDate.year, todayDate.timetuple().tm_yday - 1)
+            codes = years.get(key[0])
+            if codes is None or codes[key[1]] == self.HOLIDAY:
+                continue
+            codes[key[1]] = self.HOLIDAY
+            self._descriptions[key] = description
+
+        self._years.update(years)
+
+    def _make_year(self, year):
+        start = date(year, 1, 1)
+        days = (date(year + 1, 1, 1) - start).days
+        first_weekday = start.weekday()
+        codes = bytearray(days)
+        for doy in range(days):
+            weekday = (first_weekday + doy) % 7
+            if weekday in self._weekend:
+                codes[doy] = self.WEEKEND
+            elif self.saturday_optional and weekday == 5:
+                codes[doy] = self.OPTIONAL
+        return codes
+
+    def _codes(self, year):
+        codes = self._years.get(year)
+        if codes is None:
+            self.load(date(year, 1, 1), date(year, 1, 1))
+            codes = self._years[year]
+        return codes
+
+    def _describe(self, year, doy, code):
+        if code == self.HOLIDAY:
+            return self._descriptions[(year, doy)]
+        if code == self.WEEKEND:
+            return attendance.DayDetail.WEEKEND
+        if code == self.OPTIONAL:
+            return attendance.DayDetail.OPTIONAL
+        return ''
+
+    def code(self, day):
+        doy = day.timetuple().tm_yday - 1
+        return self._codes(day.year)[doy]
+
+    def get(self, day):
+        doy = day.timetuple().tm_yday - 1
+        return self._describe(day.year, doy,
+                              self._codes(day.year)[doy])
+
+    def classify(self, date_from, date_to):
+        """Yield ``(date, description)`` for every day from ``date_from`` to
+        ``date_to`` inclusive"""
+        day = datetime(date_from.year, date_from.month, date_from.day)
+        end = datetime(date_to.year, date_to.month, date_to.day)
+        one_day = timedelta(days=1)
+        while day <= end:
+            codes = self._codes(day.year)
+            doy = day.timetuple().tm_yday - 1
+            while doy < len(codes) and day <= end:
+                yield day, self._describe(day.year, doy, codes[doy])
+                day += one_day
+                doy += 1
+
+    def install(self):
+        attendance.DayDetail.calendar = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        attendance.DayDetail.calendar = None
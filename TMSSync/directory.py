@@ -0,0 +1,125 @@
+import threading
+import time
+
+from . import backend
+from . import connection
+from . import attendance
+
+
+__all__ = ['EmployeeDirectory']
+
+
+Connection = connection.Connection
+
+
+class EmployeeDirectory(object):
+    """In-memory employee and shift lookups for a sync run
+
+    The whole employee table and the shift history of every employee are
+    read with two set-based queries. A cheap version query is re-run at
+    most every ``check_interval`` seconds, and on the first miss of a key
+    until then, and the directory reloads itself when employees or shifts
+    have changed underneath it.
+    """
+
+    check_interval = 60
+
+    version_query = '''
+        Select
+            (Select Count(*) From Employee),
+            (Select CHECKSUM_AGG(BINARY_CHECKSUM(
+                employeeId, employeecode, employeename, employeestatus))
+             From Employee),
+            (Select Count(*) From ShiftDetails),
+            (Select Max(SDID) From ShiftDetails),
+            (Select CHECKSUM_AGG(BINARY_CHECKSUM(
+                SDID, timeFrom, timeTo, EmployeeID, EffectiveFrom))
+             From ShiftDetails)
+    '''
+
+    def __init__(self):
+        self._by_code = {}
+        self._by_id = {}
+        self._shifts = {}
+        self._version = None
+        self._checked = 0
+        self._misses = set()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    @classmethod
+    def load(cls):
+        directory = cls()
+        directory.refresh(force=True)
+        return directory
+
+    def version(self):
+        query = backend.read_query('DirectoryVersion.sql', self.version_query)
+        return tuple(Connection().execute(query).fetchone())
+
+    def refresh(self, force=False):
+        """Reload if forced or the rows changed, return True if reloaded"""
+        with self._lock:
+            version = self.version()
+            self._checked = time.time()
+            self._misses = set()
+            if not force and version == self._version:
+                return False
+
+            employees = attendance.Employee.get_all()
+            by_id = dict((emp.employeeId, emp) for emp in employees)
+            shifts = attendance.ShiftDetails.get_all_history()
+            for emp_id, history in shifts.items():
+                emp = by_id.get(emp_id)
+                if emp is None:
+                    continue
+                for shift in history.shifts:
+                    shift._employee = emp
+                emp._shifts = history
+
+            self._by_id = by_id
+            self._by_code = dict(
+                    (emp.employeeCode, emp) for emp in employees)
+            self._shifts = shifts
+            self._version = version
+            return True
+
+    def _check(self):
+        if time.time() - self._checked >= self.check_interval:
+            self.refresh()
+
+    def _lookup(self, name, key):
+        self._check()
+        found = getattr(self, name).get(key)
+        if found is None and (name, key) not in self._misses:
+            if self.refresh():
+                found = getattr(self, name).get(key)
+            if found is None:
+                self._misses.add((name, key))
+        return found
+
+    def get_by_code(self, code):
+        return self._lookup('_by_code', int(code))
+
+    def get(self, id):
+        return self._lookup('_by_id', int(id))
+
+    def get_shifts(self, employee):
+        self._check()
+        history = self._shifts.get(employee.employeeId)
+        if history is None:
+            history = attendance.ShiftHistory([])
+        return history
+
+    def get_shift(self, employee):
+        return self.get_shifts(employee).current()
+
+    def install(self):
+        attendance.Employee.directory = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        attendance.Employee.directory = None
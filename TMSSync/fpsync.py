@@ -1,49 +1,320 @@
 from __future__ import print_function
 from . import config
 from . import attendance
+from . import backend
 from . import connection
-import pyodbc
-import os
+from . import daycalendar
+from . import directory
+from . import punches
+from . import querystats
+from . import sequence
+from . import timeline
+from . import unitofwork
+from .workers import run_in_batches, run_parallel
 
 
 Connection = connection.Connection
-__DIR__ = os.path.dirname(__file__)
-__FPSYNC_QUERY_FILE__ = os.path.join(__DIR__, 'queries', 'FPSync.sql')
+read_query = backend.read_query
+
+
+__ADVANCE_WATERMARKS_QUERY__ = '''
+    MERGE dbo.FPSyncState AS S
+    USING (VALUES %s) AS N(Source, C_Date, C_Time, L_UID)
+    ON S.Source = N.Source
+    WHEN MATCHED AND (
+            N.C_Date + N.C_Time > S.C_Date + S.C_Time OR (
+            N.C_Date + N.C_Time = S.C_Date + S.C_Time AND N.L_UID > S.L_UID))
+        THEN UPDATE SET
+            C_Date = N.C_Date, C_Time = N.C_Time, L_UID = N.L_UID,
+            UpdatedAt = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (Source, C_Date, C_Time, L_UID, UpdatedAt)
+        VALUES (N.Source, N.C_Date, N.C_Time, N.L_UID, GETDATE());
+'''
+
+__RECORD_REJECT_QUERY__ = '''
+    SET NOCOUNT ON;
+    MERGE dbo.FPSyncRejects WITH (HOLDLOCK) AS R
+    USING (Select ? AS Source, ? AS C_Date, ? AS C_Time, ? AS L_UID,
+                  ? AS L_TID, ? AS Error, ? AS Attempts) AS N
+    ON R.Source = N.Source AND R.C_Date = N.C_Date
+        AND R.C_Time = N.C_Time AND R.L_UID = N.L_UID
+    WHEN MATCHED THEN UPDATE SET
+        L_TID = N.L_TID, Error = N.Error,
+        Attempts = R.Attempts + N.Attempts, UpdatedAt = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (Source, C_Date, C_Time, L_UID, L_TID, Error, Attempts,
+                UpdatedAt)
+        VALUES (N.Source, N.C_Date, N.C_Time, N.L_UID, N.L_TID, N.Error,
+                N.Attempts, GETDATE())
+    OUTPUT INSERTED.Attempts;
+'''
 
 
 def get_fpsync_query():
-    with open(__FPSYNC_QUERY_FILE__) as query_file:
-        return query_file.read()
+    return read_query('FPSync.sql')
+
+
+def setup_database():
+    """Create the tables, columns and indexes the sync relies on, and
+    fill in when the shifts given since the last run apply from"""
+    Connection().execute(read_query('Setup.sql'))
+    Connection().execute(read_query('EffectiveDates.sql'))
+
 
+def hold_watermarks(failed, held=None):
+    """Add the ``(C_Date, C_Time)`` of the first of the ``failed`` entries
+    of every source to ``held``, which is returned"""
+    if held is None:
+        held = {}
+    for entry in failed:
+        stop = (str(entry[0]), str(entry[1]))
+        source = entry[4] if len(entry) > 4 else None
+        if source not in held or stop < held[source]:
+            held[source] = stop
+    return held
 
-def get_new_fp_entries():
 
+def record_rejects(rejects):
+    """Count the runs every entry of ``(entry, error, permanent)`` failed
+    in ``dbo.FPSyncRejects`` and return the entries to try again
+
+    An entry is tried again until it has failed ``SYNC_MAX_ATTEMPTS``
+    runs, a ``permanent`` one never; after that it stays in the table and
+    no longer holds its source back.
+    """
+    query = read_query('RecordReject.sql', __RECORD_REJECT_QUERY__)
     conn = Connection()
-    new_fp_entries = None
-    cur = conn.cursor()
-    cur.execute(get_fpsync_query())
+    retry = []
+    for entry, error, permanent in rejects:
+        attempts = config.SYNC_MAX_ATTEMPTS if permanent else 1
+        total = conn.execute(
+                query, entry[4], str(entry[0]), str(entry[1]), entry[3],
+                entry[2], str(error)[:400], attempts).fetchone()[0]
+        if total < config.SYNC_MAX_ATTEMPTS:
+            retry.append(entry)
+    return retry
+
+
+def get_watermarks(entries, held=None):
+    """The last ``(C_Date, C_Time, L_UID)`` of every source in entries
+
+    With ``held`` a source only gets as far as the last entry before the
+    time ``held`` has for it.
+    """
+    marks = {}
+    for entry in entries:
+        if held and entry[4] in held and (
+                (entry[0], entry[1]) >= held[entry[4]]):
+            continue
+        mark = (entry[0], entry[1], entry[3])
+        if mark > marks.get(entry[4], ('', '', -1)):
+            marks[entry[4]] = mark
+    return marks
+
+
+def advance_watermarks(entries, failed=(), held=None):
+    """Move the watermark of every source past the processed entries
+
+    The watermark of a source stops before the first of its entries that
+    is ``failed``, or that ``held`` already stops at, so they are read
+    again by the next run. All sources are updated by one MERGE, or upsert
+    on SQLite, and a watermark never moves back.
+    """
+    marks = get_watermarks(entries, hold_watermarks(failed, held))
+    if not marks:
+        return
+    params = []
+    for source, mark in sorted(marks.items()):
+        params.append(source)
+        params.extend(mark)
+    query = read_query('AdvanceWatermarks.sql', __ADVANCE_WATERMARKS_QUERY__)
+    Connection().execute(
+            query % ', '.join(['(?, ?, ?, ?)'] * len(marks)), *params)
+
+
+def iter_new_fp_entries(chunk_size=None, lookback_minutes=None):
+    """Yield the new entries in chunks of at most ``chunk_size`` rows
+
+    The extraction runs on a connection of its own, so the entries of a
+    chunk can be recorded while the rest are still waiting on the server.
+    """
+    if chunk_size is None:
+        chunk_size = config.SYNC_CHUNK_SIZE
+    if lookback_minutes is None:
+        lookback_minutes = config.SYNC_LOOKBACK_MINUTES
+
+    pool = Connection.get_pool()
+    conn = pool.checkout()
+    try:
+        cur = conn.cursor()
+        cur.execute(get_fpsync_query(), lookback_minutes)
+
+        while True:
+            try:
+                chunk = cur.fetchmany(chunk_size)
+                break
+            except backend.get_backend().ProgrammingError:
+                pass
+            if not cur.nextset():
+                return
+
+        while chunk:
+            yield chunk
+            chunk = cur.fetchmany(chunk_size)
+    finally:
+        pool.checkin(conn)
 
-    while True:
-        try:
-            new_fp_entries = cur.fetchall()
-            break
-        except pyodbc.ProgrammingError:
-            pass
-        if not cur.nextset():
-            break
 
+def get_new_fp_entries(lookback_minutes=None):
+    new_fp_entries = []
+    for chunk in iter_new_fp_entries(lookback_minutes=lookback_minutes):
+        new_fp_entries.extend(chunk)
     return new_fp_entries
 
 
-def perform_sync():
+def record_entry(entry):
+    attendance.FPEntry.from_punch(entry).record()
+    print (entry, 'success')
+
+
+def report_failure(entry, error):
+    # what the index holds for the employee may not have been written
+    timelines = attendance.Session.timelines
+    if timelines is not None:
+        employee = attendance.Employee.get_by_code(entry[3])
+        if employee is not None:
+            timelines.discard(employee)
+    print (entry, 'failed: ', str(error))
+
+
+def record_entries(entries, workers, transactional=None,
+                   on_error=report_failure, on_commit=None):
+    """Record decoded entries, the ``Punch`` records ``punches.decode``
+    makes of the rows
+
+    An entry that fails has the timeline of its employee dropped by
+    ``report_failure``; when a whole batch fails every timeline goes, as
+    any of them may hold sessions that were not written. ``on_commit`` is
+    called once all are recorded, in the transaction of the last batch
+    when one worker records them transactionally.
+    """
+    if transactional is None:
+        transactional = config.SYNC_TRANSACTIONAL
+    try:
+        if workers > 1:
+            run_parallel(entries, record_entry, config.SYNC_BATCH_SIZE,
+                         workers, on_error, transactional)
+            if on_commit is not None:
+                on_commit()
+        else:
+            run_in_batches(entries, record_entry, config.SYNC_BATCH_SIZE,
+                           on_error, transactional, on_commit)
+    except BaseException:
+        if attendance.Session.timelines is not None:
+            attendance.Session.timelines.clear()
+        raise
+
+
+def install_caches():
+    """Install the lookups the models answer from while syncing
+
+    Returns the installed objects, to be given to ``uninstall_caches``.
+    """
+    print('Loading employees and shifts ...')
+    return (directory.EmployeeDirectory.load().install(),
+            daycalendar.DayCalendar().install(),
+            timeline.TimelineIndex().install(),
+            sequence.InOutIdAllocator().install())
+
+
+def uninstall_caches(caches):
+    emp_directory, calendar, timelines, inOutIds = caches
+    inOutIds.uninstall()
+    inOutIds.close()
+    timelines.uninstall()
+    calendar.uninstall()
+    emp_directory.uninstall()
+
+
+def sync_new_entries(workers=None, chunk_size=None, stopping=None):
+    """Record new entries chunk by chunk with the caches installed
+
+    Every chunk is recorded and flushed before the watermarks are advanced
+    past it, in the same transaction in transactional mode, so a run that
+    stops half way resumes from the last finished chunk. Entries the model
+    rejected hold the watermark of their source back for the rest of the
+    run, so they are tried again by the next one, until ``record_rejects``
+    gives up on them. Rows that cannot be decoded, such as the punches of
+    an unknown employee, are given up on at once; a rebuild of the
+    employee picks them up once it is added. ``stopping``
+    is asked after every chunk and ends the run early when it returns
+    True. Returns the number of entries recorded.
+    """
+    if workers is None:
+        workers = config.SYNC_WORKERS
+    calendar = attendance.DayDetail.calendar
+
     print('Getting new entries ...')
-    entries = get_new_fp_entries()
+    total = 0
+    held = {}
+    for chunk in iter_new_fp_entries(chunk_size):
+        entries, rejected = punches.decode(chunk)
+        failed = []
+        for entry, error in rejected:
+            failed.append((entry, error, True))
+            report_failure(entry, error)
+
+        def on_error(entry, error):
+            failed.append((entry, error, False))
+            report_failure(entry, error)
+
+        def on_commit():
+            advance_watermarks(chunk, record_rejects(failed), held)
+        if calendar is not None and entries:
+            calendar.load(entries[0].datetime, entries[-1].datetime)
+        if workers > 1:
+            print('Making %d Entries on %d workers' % (len(chunk), workers))
+        else:
+            print('Making %d Entries one by one' % len(chunk))
+        record_entries(entries, workers, on_error=on_error,
+                       on_commit=on_commit)
+        total += len(chunk)
+        if stopping is not None and stopping():
+            break
+    print('Made %d Entries' % total)
+    return total
+
+
+def install_query_stats():
+    """Start counting queries if the config asks for it"""
+    if config.STATS_ENABLED:
+        return querystats.QueryStats().install()
+
+
+def report_query_stats(stats, summary=True):
+    if stats is None:
+        return
+    if summary:
+        print(stats.summary(config.STATS_SUMMARY_SIZE))
+    if config.STATS_PROMETHEUS_FILE:
+        stats.write_prometheus(config.STATS_PROMETHEUS_FILE)
+
 
-    print('Making %d Entries one by one' % len(entries))
-    for entry in (entries if entries else []):
+def perform_sync(workers=None, chunk_size=None):
+    """Set the database up and record all new entries once"""
+    stats = install_query_stats()
+    counts = unitofwork.WriteCounts().install()
+    try:
+        setup_database()
+        caches = install_caches()
         try:
-            attendance.FPEntry(
-                    entry[3], entry[2], entry[0], entry[1]).record()
-            print (entry, 'success')
-        except ValueError as ve:
-            print (entry, 'failed: ', str(ve))
+            return sync_new_entries(workers, chunk_size)
+        finally:
+            uninstall_caches(caches)
+    finally:
+        counts.uninstall()
+        print(counts.summary())
+        if stats is not None:
+            stats.uninstall()
+            report_query_stats(stats)
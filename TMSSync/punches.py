@@ -0,0 +1,104 @@
+from collections import namedtuple
+from datetime import datetime
+
+from . import attendance
+
+
+__all__ = ['Punch', 'decode']
+
+
+FPEntry = attendance.FPEntry
+ADStatus = attendance.ADStatus
+ADTypes = attendance.ADTypes
+
+
+_Punch = namedtuple('_Punch', [
+    'date', 'time', 'tid', 'code', 'source', 'datetime', 'inOutStatus',
+    'typ', 'employeeId'])
+
+
+class Punch(_Punch):
+    """A punch row decoded for recording
+
+    The first five fields are the row as ``FPSync.sql`` gives it, so a
+    punch goes wherever a row did and prints as one. The rest are worked
+    out once: the time of the punch, the IN/OUT status and entry type its
+    TID stands for and the id of the employee, None when not looked up.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return repr(tuple(self[:5]))
+
+
+def _number(text, width):
+    # the value of a fixed width run of digits, None if it is not one
+    if len(text) != width or not text.isdigit():
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def decode(rows, resolve=True):
+    """Decode ``(C_Date, C_Time, L_TID, L_UID[, source])`` rows in one pass
+
+    Returns the ``Punch`` of every row that can be recorded, in order, and
+    ``(row, error)`` for the rest, the ``ValueError`` telling why. With
+    ``resolve`` the employee of every code is looked up, once a code, and
+    rows of codes without one are set aside as ``FPEntry.record`` would
+    fail them.
+    """
+    punches, rejected = [], []
+    days, employees = {}, {}
+    to_inout = FPEntry.__tid_to_inout__
+    to_type = FPEntry.__tid_to_type__
+    for row in rows:
+        date, time = str(row[0]), str(row[1])
+        day = days.get(date)
+        if day is None:
+            value = _number(date, 8)
+            if value is not None:
+                day = (value // 10000, value // 100 % 100, value % 100)
+                try:
+                    datetime(*day)
+                except ValueError:
+                    day = None
+            days[date] = day or False
+        if not day:
+            rejected.append((row, ValueError('Bad C_Date %r' % (row[0],))))
+            continue
+        value = _number(time, 6)
+        try:
+            punched = datetime(day[0], day[1], day[2], value // 10000,
+                               value // 100 % 100, value % 100)
+        except (TypeError, ValueError):
+            rejected.append((row, ValueError('Bad C_Time %r' % (row[1],))))
+            continue
+        try:
+            tid = int(row[2])
+        except (TypeError, ValueError):
+            rejected.append((row, ValueError('Bad L_TID %r' % (row[2],))))
+            continue
+        try:
+            code = int(row[3])
+        except (TypeError, ValueError):
+            rejected.append((row, ValueError('Bad L_UID %r' % (row[3],))))
+            continue
+        employeeId = None
+        if resolve:
+            employeeId = employees.get(code)
+            if employeeId is None:
+                employee = attendance.Employee.get_by_code(code)
+                employeeId = employees[code] = (
+                        employee.employeeId if employee else False)
+            if not employeeId:
+                rejected.append((row, ValueError('No Employee')))
+                continue
+        punches.append(Punch(
+            date, time, tid, code, row[4] if len(row) > 4 else None, punched,
+            to_inout.get(tid, ADStatus.IN), to_type.get(tid, ADTypes.BIOM),
+            employeeId))
+    return punches, rejected
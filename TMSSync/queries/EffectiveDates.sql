@@ -0,0 +1,45 @@
+-- FILLING IN THE EffectiveFrom OF SHIFTS GIVEN WITHOUT ONE: A SHIFT APPLIES
+-- FROM THE DAY AFTER THE LAST DAY THE EMPLOYEE CAME IN NEARER THE START OF
+-- THE SHIFT GIVEN BEFORE IT. THE FIRST SHIFT OF AN EMPLOYEE IS LEFT
+-- WITHOUT ONE, AS IS A SHIFT STARTING WHEN THE ONE BEFORE IT DID OR ONE NO
+-- SUCH DAY IS FOUND FOR; THEY APPLY UNTIL THE NEXT SHIFT WITH A DATE DOES
+SET NOCOUNT ON;
+
+WITH Shifts AS (
+    SELECT
+        SDID, EmployeeID,
+        DATEPART(hour, timeFrom) * 60 + DATEPART(minute, timeFrom) AS Starts,
+        LAG(DATEPART(hour, timeFrom) * 60 + DATEPART(minute, timeFrom))
+            OVER (PARTITION BY EmployeeID ORDER BY SDID) AS StartsBefore
+    FROM dbo.ShiftDetails
+),
+Days AS (
+    SELECT
+        EmployeeID, TrackDate,
+        DATEPART(hour, Min(InOutTime)) * 60
+            + DATEPART(minute, Min(InOutTime)) AS CameIn
+    FROM dbo.AttendanceDetails
+    WHERE InOutStatus = 'In'
+    GROUP BY EmployeeID, TrackDate
+)
+UPDATE SD SET EffectiveFrom = F.Since
+FROM dbo.ShiftDetails AS SD
+JOIN Shifts AS S ON S.SDID = SD.SDID
+CROSS APPLY (
+    SELECT DATEADD(day, 1, Max(D.TrackDate)) AS Since
+    FROM Days AS D
+    CROSS APPLY (
+        SELECT
+            ABS(D.CameIn - S.StartsBefore) AS ToBefore,
+            ABS(D.CameIn - S.Starts) AS ToNew
+    ) AS X
+    WHERE
+        D.EmployeeID = S.EmployeeID
+        AND CASE WHEN X.ToBefore > 720 THEN 1440 - X.ToBefore
+                 ELSE X.ToBefore END
+            < CASE WHEN X.ToNew > 720 THEN 1440 - X.ToNew ELSE X.ToNew END
+) AS F
+WHERE
+    SD.EffectiveFrom IS NULL
+    AND S.StartsBefore <> S.Starts
+    AND F.Since IS NOT NULL
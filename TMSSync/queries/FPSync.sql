@@ -1,44 +1,57 @@
--- CREATING THE TABLE IF IT DOES NOT EXIST
-IF  NOT EXISTS (
-    SELECT * FROM sys.objects 
-    WHERE object_id = OBJECT_ID(N'dbo.FPEntries') AND type in (N'U')
-)
-BEGIN
-CREATE TABLE dbo.FPEntries (
-    C_Date char(8),
-    C_Time char(6),
-    L_TID int,
-    L_UID int
+-- HOW FAR BEHIND THE WATERMARK TO LOOK FOR LATE DEVICE UPLOADS
+DECLARE @LookbackMinutes int = ?
+
+-- WHERE TO START READING EACH SOURCE: THE WATERMARK MINUS THE LOOKBACK,
+-- OR EVERYTHING WHEN THERE IS NO WATERMARK YET
+DECLARE @Watermarks TABLE(
+    Source varchar(20),
+    ScanFrom varchar(14),
+    ScanUID int
 )
-END
 
--- CREATING COLUMN inOutType
-IF NOT EXISTS (
-      SELECT * 
-      FROM   sys.columns 
-      WHERE  object_id = OBJECT_ID(N'[dbo].[AttendanceDetails]') 
-             AND name = 'inOutType'
-            ) BEGIN
-    ALTER TABLE [dbo].[AttendanceDetails]
-    ADD inOutType Varchar(10) Default 'biometric'
-END
+INSERT INTO @Watermarks
+    SELECT
+        Source,
+        CASE WHEN @LookbackMinutes > 0 THEN
+            CONVERT(char(8), Since, 112)
+            + REPLACE(CONVERT(char(8), Since, 108), ':', '')
+        ELSE C_Date + C_Time END,
+        CASE WHEN @LookbackMinutes > 0 THEN -1 ELSE L_UID END
+    FROM (
+        SELECT
+            Source, C_Date, C_Time, L_UID,
+            DATEADD(minute, -@LookbackMinutes, CONVERT(datetime,
+                C_Date + ' ' + STUFF(STUFF(C_Time, 5, 0, ':'), 3, 0, ':')))
+                AS Since
+        FROM dbo.FPSyncState
+    ) AS W
+
+DECLARE @UnisFrom varchar(14) = '', @UnisUID int = -1
+SELECT @UnisFrom = ScanFrom, @UnisUID = ScanUID
+FROM @Watermarks WHERE Source = 'UNIS'
 
--- 
+DECLARE @ManualFrom varchar(14) = '', @ManualUID int = -1
+SELECT @ManualFrom = ScanFrom, @ManualUID = ScanUID
+FROM @Watermarks WHERE Source = 'Manual'
 
 -- ALL NEW ENTRIES WILL BE ADDED TO THIS TABLE
 DECLARE @NewFPEntries TABLE(
     C_Date char(8),
     C_Time char(6),
     L_TID int,
-    L_UID int
+    L_UID int,
+    Source varchar(20)
 )
 
 -- GET FROM UNIS
 INSERT INTO @NewFPEntries 
-    SELECT DISTINCT C_Date, C_Time, L_TID, L_UID
+    SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'UNIS'
     FROM UNIS.dbo.tEnter as TE
     WHERE 
         L_UID <> -1
+        AND C_Date >= LEFT(@UnisFrom, 8)
+        AND (C_Date + C_Time > @UnisFrom OR (
+            C_Date + C_Time = @UnisFrom AND L_UID > @UnisUID))
         AND NOT EXISTS ( 
             SELECT *
             FROM dbo.FPEntries
@@ -50,10 +63,13 @@ INSERT INTO @NewFPEntries
 -- GET FROM Manual
 IF DB_ID('TMSManualRegistry') IS NOT NULL
 INSERT INTO @NewFPEntries
-    SELECT DISTINCT C_Date, C_Time, L_TID, L_UID
+    SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'Manual'
     FROM TMSManualRegistry.dbo.ManualEntry as ME
     WHERE
         L_UID <> -1
+        AND C_Date >= LEFT(@ManualFrom, 8)
+        AND (C_Date + C_Time > @ManualFrom OR (
+            C_Date + C_Time = @ManualFrom AND L_UID > @ManualUID))
         AND NOT EXISTS(
             SELECT *
             FROM dbo.FPEntries
@@ -62,11 +78,4 @@ INSERT INTO @NewFPEntries
                 C_Time=ME.C_Time AND
                 L_UID=ME.L_UID )
 
-DECLARE @NewFPEntriesOrdered TABLE(
-    C_Date char(8),
-    C_Time char(6),
-    L_TID int,
-    L_UID int
-)
-
-SELECT * FROM @NewFPEntries ORDER BY C_Date ASC, C_Time ASC
+SELECT * FROM @NewFPEntries ORDER BY C_Date ASC, C_Time ASC, L_UID ASC
@@ -0,0 +1,38 @@
+SET NOCOUNT ON
+
+-- THE EMPLOYEE AND THE C_Date + C_Time RANGE [@From, @To) TO READ
+DECLARE @UID int = ?, @From varchar(14) = ?, @To varchar(14) = ?
+
+-- ALL PUNCHES OF THE EMPLOYEE IN THE RANGE WILL BE ADDED TO THIS TABLE
+DECLARE @Punches TABLE(
+    C_Date char(8),
+    C_Time char(6),
+    L_TID int,
+    L_UID int,
+    Source varchar(20)
+)
+
+-- GET FROM UNIS
+INSERT INTO @Punches
+    SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'UNIS'
+    FROM UNIS.dbo.tEnter
+    WHERE
+        L_UID = @UID
+        AND C_Date >= LEFT(@From, 8) AND C_Date <= LEFT(@To, 8)
+        AND C_Date + C_Time >= @From AND C_Date + C_Time < @To
+
+-- GET FROM Manual, UNLESS THE DEVICE HAS THE SAME PUNCH
+IF DB_ID('TMSManualRegistry') IS NOT NULL
+INSERT INTO @Punches
+    SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'Manual'
+    FROM TMSManualRegistry.dbo.ManualEntry as ME
+    WHERE
+        L_UID = @UID
+        AND C_Date >= LEFT(@From, 8) AND C_Date <= LEFT(@To, 8)
+        AND C_Date + C_Time >= @From AND C_Date + C_Time < @To
+        AND NOT EXISTS (
+            SELECT *
+            FROM @Punches
+            WHERE C_Date=ME.C_Date AND C_Time=ME.C_Time )
+
+SELECT * FROM @Punches ORDER BY C_Date ASC, C_Time ASC
@@ -0,0 +1,13 @@
+-- CREATING THE TABLE AN INTERRUPTED REBUILD RESUMES FROM
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects 
+    WHERE object_id = OBJECT_ID(N'dbo.RebuildProgress') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.RebuildProgress (
+    RunKey varchar(40),
+    EmployeeID int,
+    FinishedAt datetime,
+    PRIMARY KEY (RunKey, EmployeeID)
+)
+END
@@ -0,0 +1,91 @@
+-- CREATING THE TABLE IF IT DOES NOT EXIST
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects 
+    WHERE object_id = OBJECT_ID(N'dbo.FPEntries') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.FPEntries (
+    C_Date char(8),
+    C_Time char(6),
+    L_TID int,
+    L_UID int
+)
+END
+
+-- CREATING COLUMN inOutType
+IF NOT EXISTS (
+      SELECT * 
+      FROM   sys.columns 
+      WHERE  object_id = OBJECT_ID(N'[dbo].[AttendanceDetails]') 
+             AND name = 'inOutType'
+            ) BEGIN
+    ALTER TABLE [dbo].[AttendanceDetails]
+    ADD inOutType Varchar(10) Default 'biometric'
+END
+
+-- CREATING COLUMN EffectiveFrom, THE TIME A SHIFT APPLIES FROM; THE
+-- APPLICATION GIVING SHIFTS MAY SET IT, EffectiveDates.sql FILLS IT IN
+IF NOT EXISTS (
+      SELECT * 
+      FROM   sys.columns 
+      WHERE  object_id = OBJECT_ID(N'[dbo].[ShiftDetails]') 
+             AND name = 'EffectiveFrom'
+            ) BEGIN
+    ALTER TABLE [dbo].[ShiftDetails]
+    ADD EffectiveFrom datetime NULL
+END
+
+-- CREATING THE INDEX USED TO SKIP ENTRIES ALREADY SYNCED
+IF NOT EXISTS (
+    SELECT * FROM sys.indexes
+    WHERE object_id = OBJECT_ID(N'dbo.FPEntries') AND name = 'IX_FPEntries_Entry'
+)
+BEGIN
+CREATE INDEX IX_FPEntries_Entry ON dbo.FPEntries (C_Date, C_Time, L_UID)
+END
+
+-- CREATING THE SYNC STATE TABLE HOLDING THE WATERMARK OF EACH SOURCE
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects 
+    WHERE object_id = OBJECT_ID(N'dbo.FPSyncState') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.FPSyncState (
+    Source varchar(20) PRIMARY KEY,
+    C_Date char(8),
+    C_Time char(6),
+    L_UID int,
+    UpdatedAt datetime
+)
+END
+
+-- CREATING THE TABLE COUNTING THE RUNS EACH ENTRY FAILED IN
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects 
+    WHERE object_id = OBJECT_ID(N'dbo.FPSyncRejects') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.FPSyncRejects (
+    Source varchar(20),
+    C_Date char(8),
+    C_Time char(6),
+    L_UID int,
+    L_TID int,
+    Error nvarchar(400),
+    Attempts int NOT NULL,
+    UpdatedAt datetime,
+    PRIMARY KEY (Source, C_Date, C_Time, L_UID)
+)
+END
+
+-- CREATING THE TABLE THE INOUTID BLOCKS OF EVERY EMPLOYEE ARE RESERVED FROM
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects 
+    WHERE object_id = OBJECT_ID(N'dbo.InOutIdBlocks') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.InOutIdBlocks (
+    EmployeeID int PRIMARY KEY,
+    NextInOutID int NOT NULL
+)
+END
@@ -0,0 +1,9 @@
+INSERT INTO FPSyncState (Source, C_Date, C_Time, L_UID)
+VALUES %s
+ON CONFLICT (Source) DO UPDATE SET
+    C_Date = excluded.C_Date, C_Time = excluded.C_Time,
+    L_UID = excluded.L_UID, UpdatedAt = datetime('now', 'localtime')
+WHERE
+    excluded.C_Date || excluded.C_Time > C_Date || C_Time OR (
+    excluded.C_Date || excluded.C_Time = C_Date || C_Time
+    AND excluded.L_UID > L_UID)
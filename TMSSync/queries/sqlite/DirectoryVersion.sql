@@ -0,0 +1,8 @@
+SELECT
+    (SELECT Count(*) FROM Employee),
+    (SELECT group_concat(employeeId || ':' || employeecode || ':' ||
+        employeename || ':' || employeestatus, ',') FROM Employee),
+    (SELECT Count(*) FROM ShiftDetails),
+    (SELECT Max(SDID) FROM ShiftDetails),
+    (SELECT group_concat(SDID || ':' || timeFrom || ':' || timeTo || ':' ||
+        EmployeeID || ':' || IfNull(EffectiveFrom, ''), ',') FROM ShiftDetails)
@@ -0,0 +1,41 @@
+-- FILLING IN THE EffectiveFrom OF SHIFTS GIVEN WITHOUT ONE: A SHIFT APPLIES
+-- FROM THE DAY AFTER THE LAST DAY THE EMPLOYEE CAME IN NEARER THE START OF
+-- THE SHIFT GIVEN BEFORE IT
+WITH Shifts AS (
+    SELECT
+        SDID, EmployeeID,
+        strftime('%H', timeFrom) * 60 + strftime('%M', timeFrom) AS Starts,
+        LAG(strftime('%H', timeFrom) * 60 + strftime('%M', timeFrom))
+            OVER (PARTITION BY EmployeeID ORDER BY SDID) AS StartsBefore
+    FROM ShiftDetails
+),
+Days AS (
+    SELECT
+        EmployeeID, TrackDate,
+        strftime('%H', Min(InOutTime)) * 60
+            + strftime('%M', Min(InOutTime)) AS CameIn
+    FROM AttendanceDetails
+    WHERE InOutStatus = 'In'
+    GROUP BY EmployeeID, TrackDate
+),
+Distances AS (
+    SELECT
+        S.SDID, D.TrackDate,
+        abs(D.CameIn - S.StartsBefore) AS ToBefore,
+        abs(D.CameIn - S.Starts) AS ToNew
+    FROM Shifts AS S
+    JOIN Days AS D ON D.EmployeeID = S.EmployeeID
+    WHERE S.StartsBefore <> S.Starts
+),
+Since AS (
+    SELECT SDID, datetime(Max(TrackDate), '+1 day') AS Since
+    FROM Distances
+    WHERE min(ToBefore, 1440 - ToBefore) < min(ToNew, 1440 - ToNew)
+    GROUP BY SDID
+)
+UPDATE ShiftDetails
+SET EffectiveFrom = (
+    SELECT Since FROM Since WHERE Since.SDID = ShiftDetails.SDID)
+WHERE
+    EffectiveFrom IS NULL
+    AND SDID IN (SELECT SDID FROM Since);
@@ -0,0 +1,59 @@
+-- ?1 IS HOW MANY MINUTES BEHIND THE WATERMARK TO LOOK FOR LATE UPLOADS;
+-- EACH SOURCE IS READ FROM ITS WATERMARK MINUS THAT, OR FROM THE START
+-- WHEN THERE IS NO WATERMARK YET
+WITH Marks AS (
+    SELECT
+        Source,
+        CASE WHEN ?1 > 0 THEN strftime('%Y%m%d%H%M%S', datetime(
+            substr(C_Date, 1, 4) || '-' || substr(C_Date, 5, 2) || '-' ||
+            substr(C_Date, 7, 2) || ' ' || substr(C_Time, 1, 2) || ':' ||
+            substr(C_Time, 3, 2) || ':' || substr(C_Time, 5, 2),
+            '-' || ?1 || ' minutes'))
+        ELSE C_Date || C_Time END AS ScanFrom,
+        CASE WHEN ?1 > 0 THEN -1 ELSE L_UID END AS ScanUID
+    FROM FPSyncState
+),
+Unis AS (
+    SELECT
+        IfNull((SELECT ScanFrom FROM Marks WHERE Source = 'UNIS'), '')
+            AS ScanFrom,
+        IfNull((SELECT ScanUID FROM Marks WHERE Source = 'UNIS'), -1)
+            AS ScanUID
+),
+Manual AS (
+    SELECT
+        IfNull((SELECT ScanFrom FROM Marks WHERE Source = 'Manual'), '')
+            AS ScanFrom,
+        IfNull((SELECT ScanUID FROM Marks WHERE Source = 'Manual'), -1)
+            AS ScanUID
+)
+SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'UNIS' AS Source
+FROM tEnter AS TE, Unis AS W
+WHERE
+    L_UID <> -1
+    AND C_Date >= substr(W.ScanFrom, 1, 8)
+    AND (C_Date || C_Time > W.ScanFrom OR (
+        C_Date || C_Time = W.ScanFrom AND L_UID > W.ScanUID))
+    AND NOT EXISTS (
+        SELECT *
+        FROM FPEntries
+        WHERE
+            C_Date = TE.C_Date AND
+            C_Time = TE.C_Time AND
+            L_UID = TE.L_UID)
+UNION ALL
+SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'Manual' AS Source
+FROM ManualEntry AS ME, Manual AS W
+WHERE
+    L_UID <> -1
+    AND C_Date >= substr(W.ScanFrom, 1, 8)
+    AND (C_Date || C_Time > W.ScanFrom OR (
+        C_Date || C_Time = W.ScanFrom AND L_UID > W.ScanUID))
+    AND NOT EXISTS (
+        SELECT *
+        FROM FPEntries
+        WHERE
+            C_Date = ME.C_Date AND
+            C_Time = ME.C_Time AND
+            L_UID = ME.L_UID)
+ORDER BY C_Date ASC, C_Time ASC, L_UID ASC
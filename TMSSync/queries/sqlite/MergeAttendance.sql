@@ -0,0 +1,26 @@
+-- SQLITE HAS NO MERGE: THE ROWS OF THE DAYS ARE WRITTEN AGAIN UNDER THEIR
+-- EAID, OR A NEW ONE FOR DAYS WITHOUT A ROW
+WITH M (EmployeeId, AttendanceDate, AttendanceStatus, TimeStatus,
+        Description, MergeRule) AS (VALUES %s)
+INSERT OR REPLACE INTO EmployeeAttendance (
+    EAID, employeeId, attendanceDate, attendanceStatus, timeStatus,
+    description)
+SELECT
+    E.EAID, M.EmployeeId, M.AttendanceDate,
+    CASE
+        WHEN E.EAID IS NULL OR M.MergeRule = 'present'
+            OR E.attendanceStatus IN ('Holiday', 'A')
+        THEN M.AttendanceStatus ELSE E.attendanceStatus END,
+    CASE
+        WHEN E.EAID IS NULL OR M.MergeRule = 'present' AND (
+            M.TimeStatus = 'OverTime'
+            OR M.TimeStatus = 'Late' AND E.timeStatus = ''
+            OR M.TimeStatus = 'InTime' AND E.timeStatus IN ('Late', ''))
+        THEN M.TimeStatus ELSE E.timeStatus END,
+    CASE
+        WHEN E.EAID IS NULL OR M.MergeRule = 'absent'
+            AND E.description IN ('Optional', '')
+        THEN M.Description ELSE E.description END
+FROM M
+LEFT JOIN EmployeeAttendance AS E
+    ON E.employeeId = M.EmployeeId AND E.attendanceDate = M.AttendanceDate
@@ -0,0 +1,20 @@
+-- THE PUNCHES OF EMPLOYEE ?1 WITH A C_Date + C_Time IN [?2, ?3), FROM THE
+-- DEVICES AND BY HAND UNLESS A DEVICE HAS THE SAME PUNCH
+SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'UNIS' AS Source
+FROM tEnter
+WHERE
+    L_UID = ?1
+    AND C_Date >= substr(?2, 1, 8) AND C_Date <= substr(?3, 1, 8)
+    AND C_Date || C_Time >= ?2 AND C_Date || C_Time < ?3
+UNION ALL
+SELECT DISTINCT C_Date, C_Time, L_TID, L_UID, 'Manual' AS Source
+FROM ManualEntry AS ME
+WHERE
+    L_UID = ?1
+    AND C_Date >= substr(?2, 1, 8) AND C_Date <= substr(?3, 1, 8)
+    AND C_Date || C_Time >= ?2 AND C_Date || C_Time < ?3
+    AND NOT EXISTS (
+        SELECT *
+        FROM tEnter
+        WHERE L_UID = ME.L_UID AND C_Date = ME.C_Date AND C_Time = ME.C_Time)
+ORDER BY C_Date ASC, C_Time ASC
@@ -0,0 +1,7 @@
+-- CREATING THE TABLE AN INTERRUPTED REBUILD RESUMES FROM
+CREATE TABLE IF NOT EXISTS RebuildProgress (
+    RunKey varchar(40),
+    EmployeeID int,
+    FinishedAt datetime,
+    PRIMARY KEY (RunKey, EmployeeID)
+);
@@ -0,0 +1,10 @@
+-- COUNTS THE LAST OF THE ARGUMENTS MORE FAILED RUNS FOR AN ENTRY AND
+-- RETURNS HOW MANY IT HAS NOW
+INSERT INTO FPSyncRejects
+    (Source, C_Date, C_Time, L_UID, L_TID, Error, Attempts)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (Source, C_Date, C_Time, L_UID) DO UPDATE SET
+    L_TID = excluded.L_TID, Error = excluded.Error,
+    Attempts = Attempts + excluded.Attempts,
+    UpdatedAt = datetime('now', 'localtime')
+RETURNING Attempts
@@ -0,0 +1,12 @@
+-- ?1 IS THE EMPLOYEE AND ?2 THE NUMBER OF IDS TO RESERVE
+INSERT INTO InOutIdBlocks (EmployeeID, NextInOutID)
+VALUES (?1, (
+    SELECT IfNull(Max(InOutID), 0) + 1
+    FROM AttendanceDetails
+    WHERE EmployeeID = ?1) + ?2)
+ON CONFLICT (EmployeeID) DO UPDATE SET
+    NextInOutID = Max(NextInOutID, (
+        SELECT IfNull(Max(InOutID), 0) + 1
+        FROM AttendanceDetails
+        WHERE EmployeeID = ?1)) + ?2
+RETURNING NextInOutID - ?2
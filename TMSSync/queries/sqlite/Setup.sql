@@ -0,0 +1,101 @@
+-- EVERY TABLE THE ENGINE READS OR WRITES, SO AN EMPTY DATABASE CAN BE USED
+CREATE TABLE IF NOT EXISTS Employee (
+    employeeId integer PRIMARY KEY AUTOINCREMENT,
+    employeecode varchar(20),
+    employeename varchar(100),
+    employeestatus bit
+);
+
+CREATE TABLE IF NOT EXISTS ShiftDetails (
+    SDID integer PRIMARY KEY AUTOINCREMENT,
+    timeFrom datetime,
+    timeTo datetime,
+    EmployeeID int,
+    EffectiveFrom datetime
+);
+
+CREATE TABLE IF NOT EXISTS DayDetails (
+    todayDate datetime,
+    Description varchar(100)
+);
+
+CREATE TABLE IF NOT EXISTS Weekend (
+    Weekend varchar(20)
+);
+
+CREATE TABLE IF NOT EXISTS AttendanceDetails (
+    ADID integer PRIMARY KEY AUTOINCREMENT,
+    InOutID int,
+    EmployeeID int,
+    TrackDate datetime,
+    InOutTime datetime,
+    InOutStatus varchar(10),
+    inOutType varchar(10) DEFAULT 'biometric'
+);
+
+CREATE INDEX IF NOT EXISTS IX_AttendanceDetails_Employee
+    ON AttendanceDetails (EmployeeID, InOutTime);
+
+CREATE TABLE IF NOT EXISTS EmployeeAttendance (
+    EAID integer PRIMARY KEY AUTOINCREMENT,
+    employeeId int,
+    attendanceDate datetime,
+    attendanceStatus varchar(20),
+    timeStatus varchar(20),
+    description varchar(100)
+);
+
+CREATE INDEX IF NOT EXISTS IX_EmployeeAttendance_Employee
+    ON EmployeeAttendance (employeeId, attendanceDate);
+
+-- THE PUNCHES OF THE DEVICES AND THE ONES PUT IN BY HAND
+CREATE TABLE IF NOT EXISTS tEnter (
+    C_Date char(8),
+    C_Time char(6),
+    L_TID int,
+    L_UID int
+);
+
+CREATE INDEX IF NOT EXISTS IX_tEnter_Entry ON tEnter (C_Date, C_Time, L_UID);
+
+CREATE TABLE IF NOT EXISTS ManualEntry (
+    C_Date char(8),
+    C_Time char(6),
+    L_TID int,
+    L_UID int
+);
+
+CREATE TABLE IF NOT EXISTS FPEntries (
+    C_Date char(8),
+    C_Time char(6),
+    L_TID int,
+    L_UID int
+);
+
+CREATE INDEX IF NOT EXISTS IX_FPEntries_Entry
+    ON FPEntries (C_Date, C_Time, L_UID);
+
+CREATE TABLE IF NOT EXISTS FPSyncState (
+    Source varchar(20) PRIMARY KEY,
+    C_Date char(8),
+    C_Time char(6),
+    L_UID int,
+    UpdatedAt datetime DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS FPSyncRejects (
+    Source varchar(20),
+    C_Date char(8),
+    C_Time char(6),
+    L_UID int,
+    L_TID int,
+    Error varchar(400),
+    Attempts int NOT NULL,
+    UpdatedAt datetime DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (Source, C_Date, C_Time, L_UID)
+);
+
+CREATE TABLE IF NOT EXISTS InOutIdBlocks (
+    EmployeeID int PRIMARY KEY,
+    NextInOutID int NOT NULL
+);
@@ -0,0 +1,260 @@
+from __future__ import print_function
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+
+from . import connection
+
+
+__all__ = ['QueryStat', 'QueryStats', 'normalize']
+
+
+# upper bounds of the latency buckets in seconds, the last one open
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+# modules whose frames are passed over when working out who ran a query
+_PLUMBING = frozenset([connection.__name__, __name__, 'contextlib'])
+
+_SPACES = re.compile(r'\s+')
+_ROWS = re.compile(r'\((?:\?, )*\?\)(?:, \((?:\?, )*\?\))+')
+_LIST = re.compile(r'\?(?:, \?)+')
+
+
+def normalize(query):
+    """The text queries are counted under
+
+    Whitespace is collapsed and the placeholder rows and lists of the
+    statements built for a number of rows are shrunk to one, so every size
+    of a multi-row insert or ``In`` list counts as the same query.
+    """
+    query = _SPACES.sub(' ', query).strip()
+    query = _ROWS.sub('(...)', query)
+    return _LIST.sub('?...', query)
+
+
+def _caller():
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') in _PLUMBING:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    code = frame.f_code
+    return '%s.%s' % (frame.f_globals.get('__name__', '?').rpartition('.')[2],
+                      getattr(code, 'co_qualname', code.co_name))
+
+
+class QueryStat(object):
+    """Calls, latency and rows of one normalized query
+
+    ``site`` is the function that ran the query first. Latencies are kept as
+    counts per bucket of ``BUCKETS``, so percentiles are estimates.
+    """
+
+    def __init__(self, query, site):
+        self.query = query
+        self.site = site
+        self.key = '%08x' % (zlib.crc32(query.encode('utf-8')) & 0xffffffff)
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    @property
+    def mean(self):
+        return self.seconds / self.calls if self.calls else 0.0
+
+    def percentile(self, p):
+        """Estimate the ``p``th percentile latency, ``p`` from 0 to 100"""
+        if not self.calls:
+            return 0.0
+        rank = self.calls * p / 100.0
+        seen = 0
+        lower = 0.0
+        for count, bound in zip(self.buckets, BUCKETS):
+            if count and seen + count >= rank:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+
+class _Cursor(object):
+    # times the statements run on a cursor and counts the rows read off it
+
+    def __init__(self, stats, cursor, stat=None):
+        self.__dict__['_stats'] = stats
+        self.__dict__['_cursor'] = cursor
+        self.__dict__['_stat'] = stat
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def _fetched(self, count):
+        if count and self._stat is not None:
+            self._stats.add_rows(self._stat, count)
+
+    def execute(self, query, *args):
+        start = time.time()
+        try:
+            self._cursor.execute(query, *args)
+        finally:
+            self.__dict__['_stat'] = self._stats.add(
+                    query, time.time() - start, self._cursor)
+        return self
+
+    def executemany(self, query, params):
+        params = list(params)
+        start = time.time()
+        try:
+            self._cursor.executemany(query, params)
+        finally:
+            stat = self._stats.add(query, time.time() - start)
+            self._stats.add_rows(stat, len(params))
+        return self
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._fetched(row is not None)
+        return row
+
+    def fetchmany(self, size):
+        rows = self._cursor.fetchmany(size)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        count = 0
+        try:
+            for row in self._cursor:
+                count += 1
+                yield row
+        finally:
+            self._fetched(count)
+
+
+class QueryStats(object):
+    """Counts and times every statement run through ``PooledConnection``
+
+    Installed on ``PooledConnection.stats`` it is handed every cursor a
+    statement runs on. Statements are grouped by ``normalize``; the rows of
+    a query are the rows read off its cursor, or the rows a statement
+    changed when it returns none. ``summary`` gives the queries taking the
+    most time in all and ``write_prometheus`` writes everything for the node
+    exporter's text file collector.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._normalized = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._stats)
+
+    def wrap(self, cursor):
+        return _Cursor(self, cursor)
+
+    def add(self, query, seconds, cursor=None):
+        normalized = self._normalized.get(query)
+        if normalized is None:
+            normalized = self._normalized[query] = normalize(query)
+        with self._lock:
+            stat = self._stats.get(normalized)
+            if stat is None:
+                stat = self._stats[normalized] = QueryStat(
+                        normalized, _caller())
+            stat.add(seconds)
+            if cursor is not None and cursor.description is None:
+                stat.rows += max(cursor.rowcount, 0)
+        return stat
+
+    def add_rows(self, stat, count):
+        with self._lock:
+            stat.rows += count
+
+    def get(self, query):
+        return self._stats.get(normalize(query))
+
+    def queries(self):
+        """Every query seen, the one taking the most time in all first"""
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=lambda stat: stat.seconds, reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+            self._normalized.clear()
+
+    def summary(self, limit=15):
+        lines = ['%-8s %-40s %8s %9s %8s %8s %8s %9s' % (
+            'id', 'query', 'calls', 'total s', 'mean ms', 'p50 ms', 'p95 ms',
+            'rows')]
+        for stat in self.queries()[:limit]:
+            lines.append('%-8s %-40s %8d %9.3f %8.2f %8.2f %8.2f %9d' % (
+                stat.key, stat.site[-40:], stat.calls, stat.seconds,
+                stat.mean * 1000, stat.percentile(50) * 1000,
+                stat.percentile(95) * 1000, stat.rows))
+        return '\n'.join(lines)
+
+    def prometheus(self, prefix='tmssync_query'):
+        """The stats in the Prometheus text format"""
+        lines = [
+            '# HELP %s_duration_seconds Time spent running a query' % prefix,
+            '# TYPE %s_duration_seconds histogram' % prefix]
+        rows = [
+            '# HELP %s_rows_total Rows read or changed by a query' % prefix,
+            '# TYPE %s_rows_total counter' % prefix]
+        for stat in self.queries():
+            labels = 'query="%s",id="%s"' % (
+                stat.site.replace('\\', '\\\\').replace('"', '\\"'),
+                stat.key)
+            seen = 0
+            for count, bound in zip(stat.buckets, BUCKETS):
+                seen += count
+                lines.append('%s_duration_seconds_bucket{%s,le="%s"} %d' % (
+                    prefix, labels,
+                    '+Inf' if bound == float('inf') else repr(bound), seen))
+            lines.append('%s_duration_seconds_sum{%s} %f' % (
+                prefix, labels, stat.seconds))
+            lines.append('%s_duration_seconds_count{%s} %d' % (
+                prefix, labels, stat.calls))
+            rows.append('%s_rows_total{%s} %d' % (prefix, labels, stat.rows))
+        return '\n'.join(lines + rows) + '\n'
+
+    def write_prometheus(self, path, prefix='tmssync_query'):
+        """Replace the file at ``path`` in one go, as the collector needs"""
+        temp = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp, 'w') as prom_file:
+            prom_file.write(self.prometheus(prefix))
+        os.replace(temp, path)
+
+    def install(self):
+        connection.PooledConnection.stats = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        connection.PooledConnection.stats = None
@@ -0,0 +1,166 @@
+from __future__ import print_function
+from . import attendance
+from . import backend
+from . import connection
+from . import daycalendar
+from . import replay
+from . import sequence
+import multiprocessing
+import traceback
+
+
+__all__ = ['rebuild', 'rebuild_employee', 'get_punches', 'run_key']
+
+
+Connection = connection.Connection
+read_query = backend.read_query
+
+
+__DELETE_FPENTRIES_QUERY__ = '''
+    Delete From FPEntries
+    Where L_UID = ? and C_Date + C_Time >= ? and C_Date + C_Time < ?'''
+
+__INSERT_FPENTRIES_QUERY__ = ('insert into '
+                              'FPEntries(C_Date, C_Time, L_TID, L_UID) '
+                              'Values(?, ?, ?, ?)')
+
+__FINISHED_QUERY__ = '''
+    Insert Into RebuildProgress(RunKey, EmployeeID, FinishedAt)
+    Values (?, ?, GETDATE())'''
+
+__NEXT_INOUTID_QUERY__ = '''
+    Select IsNull(Max(InOutID), 0) + 1
+    From AttendanceDetails
+    Where EmployeeID = ?'''
+
+# the calendar of a worker process, made on first use
+_calendar = None
+
+
+def run_key(date_from, date_to=None):
+    """What the progress of a rebuild over a range is kept under"""
+    return '%s-%s' % (date_from.strftime('%Y%m%d%H%M%S'),
+                      date_to.strftime('%Y%m%d%H%M%S') if date_to else '')
+
+
+def get_punches(code, punch_from, punch_to):
+    """The punches of an employee in ``[punch_from, punch_to)`` from the
+    device and manual registries, ordered as the sync records them"""
+    return [tuple(data) for data in Connection().execute(
+        read_query('Punches.sql'), code, punch_from, punch_to)]
+
+
+def _get_calendar():
+    global _calendar
+    if _calendar is None:
+        _calendar = daycalendar.DayCalendar()
+    return _calendar
+
+
+def rebuild_employee(task):
+    """Rebuild one employee in a transaction of its own
+
+    ``task`` is ``(code, date_from, date_to, key)``. Returns ``(code,
+    written, deleted, error)``, error being None unless the employee's
+    transaction was rolled back, and then the traceback of what failed.
+    """
+    code, date_from, date_to, key = task
+    conn = Connection()
+    try:
+        employee = attendance.Employee.get_by_code(code)
+        if employee is None:
+            return code, 0, 0, 'No Employee'
+        calendar = _get_calendar()
+        with conn.transaction():
+            reconciler = replay.Reconciler(employee, date_from, date_to)
+            reconciler.load()
+            punch_from, punch_to = reconciler.punch_range()
+            punches = get_punches(code, punch_from, punch_to)
+            result = reconciler.replay(calendar, punches)
+            # new sessions count up from the ids stored before the deletes
+            nextId = conn.execute(__NEXT_INOUTID_QUERY__,
+                                  employee.employeeId).fetchone()[0]
+            counter = sequence.InOutIdCounter({employee.employeeId: nextId})
+            with attendance.overriding(inOutIds=counter):
+                reconciler.apply(result)
+
+            # FPEntries marks what the sync must not record again
+            failed = set(punch for punch, error in result.failed)
+            conn.execute(__DELETE_FPENTRIES_QUERY__,
+                         code, punch_from, punch_to)
+            rows = [tuple(punch[:4]) for punch in punches
+                    if tuple(punch[:4]) not in failed]
+            if rows:
+                cursor = conn.cursor()
+                cursor.fast_executemany = True
+                cursor.executemany(__INSERT_FPENTRIES_QUERY__, rows)
+            conn.execute(__FINISHED_QUERY__, key, employee.employeeId)
+        return code, reconciler.written, reconciler.deleted, None
+    except Exception:
+        return code, 0, 0, traceback.format_exc()
+    finally:
+        Connection.close()
+
+
+def rebuild(date_from, date_to=None, employees=None, workers=1,
+            restart=False):
+    """Work out sessions and attendance from ``date_from`` up to
+    ``date_to`` again from the raw punches
+
+    Every employee, or the employees with the codes given, is rebuilt in a
+    transaction of its own on a pool of ``workers`` processes. Finished
+    employees are recorded in ``dbo.RebuildProgress``, so running the same
+    range again after an interruption skips them, unless ``restart`` is
+    given. New InOutIDs are counted in memory from the largest one the
+    employee had. The sync must not run at the same time. Returns the
+    number of employees that failed.
+    """
+    key = run_key(date_from, date_to)
+    conn = Connection()
+    conn.execute(read_query('Rebuild.sql'))
+    if restart:
+        conn.execute('Delete From RebuildProgress Where RunKey = ?', key)
+    done = set(row[0] for row in conn.execute(
+        'Select EmployeeID From RebuildProgress Where RunKey = ?', key))
+
+    failures = 0
+    if employees:
+        emps = []
+        for code in employees:
+            emp = attendance.Employee.get_by_code(code)
+            if emp is None:
+                failures += 1
+                print(code, 'failed: ', 'No Employee')
+            else:
+                emps.append(emp)
+    else:
+        emps = attendance.Employee.get_all()
+    tasks = [(emp.employeeCode, date_from, date_to, key)
+             for emp in emps if emp.employeeId not in done]
+    print('Rebuilding %d Employees (%d done before)' % (
+        len(tasks), len(emps) - len(tasks)))
+
+    pool = None
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.get_context('spawn').Pool(
+                min(workers, len(tasks)))
+        results = pool.imap_unordered(rebuild_employee, tasks)
+    else:
+        results = (rebuild_employee(task) for task in tasks)
+    try:
+        for count, (code, written, deleted, error) in enumerate(results, 1):
+            if error is not None:
+                failures += 1
+                print(code, 'failed: ', error)
+            else:
+                print('%d/%d %s: %d rows written, %d deleted' % (
+                    count, len(tasks), code, written, deleted))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if not failures:
+        Connection().execute(
+            'Delete From RebuildProgress Where RunKey = ?', key)
+    return failures
@@ -0,0 +1,342 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from . import connection
+from . import attendance
+from . import punches as decoding
+from . import sequence
+from . import timeline
+from . import unitofwork
+
+
+__all__ = ['MemoryUnitOfWork', 'Replay', 'Reconciler']
+
+
+Connection = connection.Connection
+AttendanceDetail = attendance.AttendanceDetail
+EmployeeAttendance = attendance.EmployeeAttendance
+EAStatus = attendance.EAStatus
+ADStatus = attendance.ADStatus
+
+# statuses worked out from the punches, any other was entered by hand
+COMPUTED_STATUSES = frozenset([EAStatus.P, EAStatus.A, EAStatus.H])
+
+
+def _day(dt):
+    return datetime(dt.year, dt.month, dt.day)
+
+
+class MemoryUnitOfWork(unitofwork.UnitOfWork):
+    """A complete unit of work that never writes
+
+    Rows given to ``load`` stand for what is stored. Saves stay pending on
+    top of them for good and ``flush`` does nothing.
+    """
+
+    complete = True
+
+    def __init__(self):
+        super(MemoryUnitOfWork, self).__init__()
+        self._stored = {}
+
+    def load(self, table, key, row):
+        self._stored.setdefault(table, OrderedDict())[key] = row
+
+    def get(self, table, key):
+        row = super(MemoryUnitOfWork, self).get(table, key)
+        if row is None:
+            row = self._stored.get(table, {}).get(key)
+        return row
+
+    def rows(self, table):
+        pending = self._tables.get(table, {})
+        return [row for key, row in self._stored.get(table, {}).items()
+                if key not in pending] + super(
+                        MemoryUnitOfWork, self).rows(table)
+
+    def flush(self):
+        pass
+
+
+class Replay(object):
+    """Records the punches of one employee entirely in memory
+
+    ``FPEntry.record`` runs unchanged against a session timeline filled
+    with ``details``, a ``MemoryUnitOfWork`` holding the ``attendance`` rows
+    and an ``InOutIdCounter``, while ``calendar`` answers the day lookups.
+    ``details`` are session rows as ``SessionTimeline.fill`` takes them and
+    must be all the sessions from the last one before ``since``. The
+    hooks are installed for the running thread alone while ``record``
+    runs and the employee's shift history is read up front, so a replay
+    reads nothing from the database and other threads may sync or replay
+    at the same time.
+    """
+
+    def __init__(self, employee, calendar, details=(), attendance=(),
+                 since=datetime.min):
+        self.employee = employee
+        self.calendar = calendar
+        employee.shifts  # read once, before any hook is installed
+        self.timeline = timeline.SessionTimeline(employee)
+        self.timeline.fill(details, since)
+        self.uow = MemoryUnitOfWork()
+        for row in attendance:
+            self.uow.load(EmployeeAttendance.table,
+                          (employee.employeeId, _day(row[0])), row)
+        last = max([ses.in_entry.inOutId
+                    for ses in self.timeline.sessions()] + [0])
+        self.inOutIds = sequence.InOutIdCounter(
+                {employee.employeeId: last + 1})
+        self.failed = []
+
+    def record(self, punches):
+        """Record ``(C_Date, C_Time, L_TID, L_UID)`` punches in order
+
+        Punches that cannot be decoded or that the model rejects with a
+        ``ValueError`` are kept in ``failed`` with the error, as the sync
+        reports them.
+        """
+        decoded, rejected = decoding.decode(punches, resolve=False)
+        self.failed.extend((tuple(punch[:4]), error)
+                           for punch, error in rejected)
+        index = timeline.TimelineIndex()
+        index.add(self.timeline)
+        hooks = attendance.overriding(calendar=self.calendar,
+                                      timelines=index,
+                                      inOutIds=self.inOutIds)
+        with hooks, self.uow:
+            for punch in decoded:
+                entry = attendance.FPEntry.from_punch(punch, self.employee)
+                try:
+                    entry.record()
+                except ValueError as error:
+                    self.failed.append((tuple(punch[:4]), error))
+
+    def sessions(self):
+        return self.timeline.sessions()
+
+    def details(self):
+        """The resulting ``AttendanceDetails`` rows by in-time"""
+        return [entry._row()
+                for ses in self.sessions()
+                for entry in (ses.in_entry, ses.out_entry)
+                if entry is not None]
+
+    def attendance(self):
+        """The resulting ``EmployeeAttendance`` rows by date"""
+        return sorted(self.uow.rows(EmployeeAttendance.table),
+                      key=lambda row: row[0])
+
+
+class Reconciler(object):
+    """Works out an employee's attendance from ``date_from`` on again and
+    writes only what changed
+
+    Sessions with an in-time from ``date_from`` up to ``date_to``, the out
+    entry of a session running into ``date_from`` and the attendance of
+    those days are replayed from the punches, except for attendance rows
+    entered by hand (leaves and the like). Everything else stored is the
+    starting state of the replay, which may change it as the sync would.
+    ``apply`` matches replayed sessions to stored ones by in-time and
+    attendance rows by date, then deletes what is gone and saves what is
+    new or different in one unit of work.
+    """
+
+    punches_query = '''
+        Select C_Date, C_Time, L_TID, L_UID
+        From FPEntries
+        Where L_UID = ? and C_Date + C_Time >= ? and C_Date + C_Time < ?
+        Order By C_Date, C_Time
+    '''
+
+    attendance_query = '''
+        Select
+            AttendanceDate, AttendanceStatus, timeStatus,
+            description, EmployeeId, eaid
+        From EmployeeAttendance
+        Where employeeId = ? and AttendanceDate >= ?
+        Order by AttendanceDate
+    '''
+
+    def __init__(self, employee, date_from, date_to=None):
+        self.employee = employee
+        self.date_from = date_from
+        self.date_to = date_to or datetime.max
+        self.details = []
+        self.attendance = []
+        self.written = 0
+        self.deleted = 0
+
+    def _replaced(self, time):
+        return self.date_from <= time < self.date_to
+
+    def _reopened(self, data):
+        return (data[0] < self.date_from and data[7] is not None and
+                data[7] >= self.date_from)
+
+    def _punches_to(self):
+        """Up to where punches are replayed: ``date_to`` or past the out
+        entries of the sessions replayed"""
+        ends = [data[7] + timedelta(seconds=1) for data in self.details
+                if data[7] is not None and (
+                    self._replaced(data[0]) or self._reopened(data))]
+        return max([self.date_to] + ends)
+
+    def _load_details(self, since):
+        employeeId = self.employee.employeeId
+        return [tuple(data) for data in Connection().execute(
+            timeline.SessionTimeline.query, ADStatus.OUT, employeeId,
+            ADStatus.IN, since, employeeId, ADStatus.IN, since)]
+
+    def load(self):
+        """Read what is stored from the second last session before
+        ``date_from``, which the last one may be recorded again after, and
+        the employee's shift history"""
+        self.employee.shifts
+        self.details = self._load_details(self.date_from)
+        if self.details and self.details[0][0] < self.date_from:
+            self.details = self._load_details(self.details[0][0])
+        since = self.date_from
+        employeeId = self.employee.employeeId
+        start = min([_day(data[4]) for data in self.details
+                     if data[4] is not None] + [_day(since)])
+        self.attendance = [tuple(data) for data in Connection().execute(
+            self.attendance_query, employeeId, start)]
+        return self
+
+    def punch_range(self):
+        """``C_Date + C_Time`` from and up to which punches are replayed"""
+        date_to = self._punches_to()
+        if date_to == datetime.max:
+            date_to = '99999999999999'
+        else:
+            date_to = date_to.strftime('%Y%m%d%H%M%S')
+        return self.date_from.strftime('%Y%m%d%H%M%S'), date_to
+
+    def get_punches(self):
+        return [tuple(data) for data in Connection().execute(
+            self.punches_query, self.employee.employeeCode,
+            *self.punch_range())]
+
+    def replay(self, calendar, punches=None):
+        if punches is None:
+            punches = self.get_punches()
+        details = []
+        for data in self.details:
+            if self._reopened(data):
+                data = data[:7] + (None,) * 7
+            if not self._replaced(data[0]):
+                details.append(data)
+        replay = Replay(
+            self.employee, calendar, details,
+            [row for row in self.attendance
+             if not self._replaced(row[0]) or
+             row[1] not in COMPUTED_STATUSES])
+        replay.record(punches)
+        return replay
+
+    def _delete(self, table, column, ids):
+        ids = list(ids)
+        size = unitofwork.MAX_PARAMS
+        for start in range(0, len(ids), size):
+            part = ids[start:start + size]
+            Connection().execute(
+                'Delete From %s Where %s In (%s)' % (
+                    table, column, ', '.join(['?'] * len(part))), *part)
+        self.deleted += len(ids)
+
+    def _details_changes(self, replay):
+        stored_rows = {}
+        replaced = OrderedDict()
+        reopened = {}
+        for data in self.details:
+            in_row = tuple(data[:7])
+            out_row = tuple(data[7:]) if data[7] is not None else None
+            for row in (in_row, out_row):
+                if row is not None:
+                    stored_rows[row[5]] = row
+            if self._replaced(in_row[0]):
+                replaced.setdefault(in_row[0], []).append((in_row, out_row))
+            elif self._reopened(data):
+                reopened[in_row[5]] = out_row
+
+        saves, deletes = [], []
+        for ses in replay.sessions():
+            if ses.in_entry._adid in reopened:
+                out_row = reopened.pop(ses.in_entry._adid)
+                if ses.out_entry is not None:
+                    ses.out_entry._adid = out_row[5]
+                else:
+                    deletes.append(out_row[5])
+            elif ses.in_entry._adid is None:
+                matches = replaced.get(ses.inTime)
+                if matches:
+                    in_row, out_row = matches.pop(0)
+                    ses.in_entry._adid = in_row[5]
+                    ses.in_entry.inOutId = in_row[6]
+                    if out_row is not None:
+                        if ses.out_entry is not None:
+                            ses.out_entry._adid = out_row[5]
+                        else:
+                            deletes.append(out_row[5])
+                else:
+                    # the id the replay counted out is only provisional
+                    ses.in_entry.inOutId = None
+                if ses.out_entry is not None:
+                    ses.out_entry.inOutId = ses.in_entry.inOutId
+            entries = [entry for entry in (ses.in_entry, ses.out_entry)
+                       if entry is not None and (
+                           entry._adid is None or
+                           entry._row() != stored_rows[entry._adid])]
+            if entries:
+                saves.append((ses, entries))
+
+        for matches in replaced.values():
+            for in_row, out_row in matches:
+                deletes.extend(row[5] for row in (in_row, out_row)
+                               if row is not None)
+        deletes.extend(out_row[5] for out_row in reopened.values())
+        return saves, deletes
+
+    def _attendance_changes(self, replay):
+        stored = dict((_day(row[0]), row) for row in self.attendance)
+        saves = []
+        for row in replay.attendance():
+            old = stored.pop(_day(row[0]), None)
+            eaid = row[5]
+            if eaid is None and old is not None:
+                eaid = old[5]
+            if old is not None and eaid == old[5] and row[1:4] == old[1:4]:
+                continue
+            saves.append(EmployeeAttendance(
+                *row[:5], eaid=eaid, employee=self.employee))
+        return saves, [row[5] for row in stored.values()]
+
+    def apply(self, replay):
+        """Write the difference between ``replay`` and what was loaded"""
+        with unitofwork.UnitOfWork():
+            detail_saves, detail_deletes = self._details_changes(replay)
+            att_saves, att_deletes = self._attendance_changes(replay)
+            self._delete(AttendanceDetail.table, 'ADID', detail_deletes)
+            self._delete(EmployeeAttendance.table, 'EAID', att_deletes)
+            # what the replay saved is clean in memory alone, so every
+            # row that differs is written in full
+            for ses, entries in detail_saves:
+                for entry in entries:
+                    if entry is ses.out_entry:
+                        entry.inOutId = ses.in_entry.inOutId
+                    entry._clean = None
+                    entry.save()
+                    self.written += 1
+            for att in att_saves:
+                att._clean = None
+                att.save()
+                self.written += 1
+        if attendance.Session.timelines is not None:
+            attendance.Session.timelines.discard(self.employee)
+
+    def run(self, calendar, punches=None):
+        self.load()
+        replay = self.replay(calendar, punches)
+        self.apply(replay)
+        return replay
@@ -0,0 +1,152 @@
+"""Attendance of many employees over many days, for monthly reporting"""
+from __future__ import print_function
+import csv
+from datetime import datetime, timedelta
+
+from . import attendance
+
+
+__all__ = ['AttendanceMatrix', 'CODES', 'TOTALS', 'code', 'label']
+
+
+EAStatus = attendance.EAStatus
+TimeStatus = attendance.TimeStatus
+
+STATUSES = (EAStatus.P, EAStatus.A, EAStatus.AL, EAStatus.SL, EAStatus.CL,
+            EAStatus.C, EAStatus.OL, EAStatus.GL, EAStatus.O, EAStatus.H,
+            EAStatus.OT, EAStatus.ML)
+TIME_STATUSES = (TimeStatus.NONE, TimeStatus.LATE, TimeStatus.INTIME,
+                 TimeStatus.OVERTIME, TimeStatus.COMPENSATE)
+LEAVES = frozenset([EAStatus.AL, EAStatus.SL, EAStatus.CL, EAStatus.C,
+                    EAStatus.OL, EAStatus.GL, EAStatus.ML])
+
+# the code of a day without a row and of a row with a status not listed
+NONE = 0
+UNKNOWN = 255
+
+# (attendanceStatus, timeStatus) of every code
+CODES = [(None, None)] + [(status, time_status) for status in STATUSES
+                          for time_status in TIME_STATUSES]
+_CODES = dict((pair, i) for i, pair in enumerate(CODES) if i)
+
+TOTALS = ('present', 'absent', 'late', 'overtime', 'leave', 'holiday')
+
+
+def _day(date):
+    # the rows may carry a date rather than a datetime
+    return datetime(date.year, date.month, date.day)
+
+
+def code(attendanceStatus, timeStatus):
+    """The code an ``EmployeeAttendance`` row is kept as"""
+    return _CODES.get((attendanceStatus, timeStatus or ''), UNKNOWN)
+
+
+def label(day_code):
+    """``P``, ``P/Late`` and the like for a code"""
+    if day_code == UNKNOWN:
+        return '?'
+    status, time_status = CODES[day_code]
+    if status is None:
+        return ''
+    return '%s/%s' % (status, time_status) if time_status else status
+
+
+def _counts(day_code):
+    if day_code in (NONE, UNKNOWN):
+        return ()
+    status, time_status = CODES[day_code]
+    return tuple(i for i, counted in enumerate((
+        status == EAStatus.P, status == EAStatus.A,
+        time_status == TimeStatus.LATE,
+        time_status == TimeStatus.OVERTIME,
+        status in LEAVES, status == EAStatus.H)) if counted)
+
+
+# which of TOTALS every code adds to
+_TOTALS_OF = [()] * 256
+for _code in range(1, len(CODES)):
+    _TOTALS_OF[_code] = _counts(_code)
+
+
+class AttendanceMatrix(object):
+    """A code per employee and day, with totals per employee
+
+    The codes of the days from ``date_from`` up to ``date_to`` of every
+    employee of ``employee_ids`` are kept in one bytearray, row by row;
+    ``CODES`` tells what each stands for. ``totals`` are the counts of
+    ``TOTALS`` per employee, in the order of ``employee_ids``.
+    """
+
+    def __init__(self, date_from, date_to, employee_ids):
+        self.date_from = datetime(
+                date_from.year, date_from.month, date_from.day)
+        self.days = max((date_to - self.date_from).days, 0)
+        self.employee_ids = list(employee_ids)
+        self.index = dict(
+                (emp_id, i) for i, emp_id in enumerate(self.employee_ids))
+        self.codes = bytearray(len(self.employee_ids) * self.days)
+        self.totals = dict(
+                (name, [0] * len(self.employee_ids)) for name in TOTALS)
+
+    @classmethod
+    def load(cls, date_from, date_to, employee_ids=None):
+        """Everyone's attendance in ``[date_from, date_to)``, or that of
+        ``employee_ids``, read in one query"""
+        if employee_ids is None:
+            employee_ids = sorted(
+                    emp.employeeId for emp in attendance.Employee.get_all())
+        matrix = cls(date_from, date_to, employee_ids)
+        matrix.fill(attendance.EmployeeAttendance.iter_rows(
+                date_from, date_to, employee_ids))
+        return matrix
+
+    def fill(self, rows):
+        """Put in the attendance rows, as ``EmployeeAttendance.iter_rows``
+        gives them"""
+        totals = [self.totals[name] for name in TOTALS]
+        for attendanceDate, status, time_status, _, emp_id, _ in rows:
+            i = self.index.get(emp_id)
+            day = (_day(attendanceDate) - self.date_from).days
+            if i is None or not 0 <= day < self.days:
+                continue
+            cell = i * self.days + day
+            old = self.codes[cell]
+            new = self.codes[cell] = code(status, time_status)
+            for total in _TOTALS_OF[old]:
+                totals[total][i] -= 1
+            for total in _TOTALS_OF[new]:
+                totals[total][i] += 1
+        return self
+
+    def date(self, day):
+        return self.date_from + timedelta(days=day)
+
+    def row(self, employee_id):
+        """The codes of an employee's days"""
+        start = self.index[employee_id] * self.days
+        return self.codes[start:start + self.days]
+
+    def get(self, employee_id, date):
+        return self.row(employee_id)[(_day(date) - self.date_from).days]
+
+    def array(self):
+        """The codes as an employees by days NumPy uint8 array, sharing
+        their memory"""
+        import numpy
+        return numpy.frombuffer(self.codes, dtype=numpy.uint8).reshape(
+                len(self.employee_ids), self.days)
+
+    def write_csv(self, out, names=None):
+        """Write a line per employee: the id, or ``names[id]``, the label
+        of every day and the totals"""
+        writer = csv.writer(out)
+        writer.writerow(
+                ['employee'] +
+                [self.date(day).strftime('%Y-%m-%d')
+                 for day in range(self.days)] + list(TOTALS))
+        for i, emp_id in enumerate(self.employee_ids):
+            writer.writerow(
+                    [names[emp_id] if names else emp_id] +
+                    [label(day_code) for day_code in self.row(emp_id)] +
+                    [self.totals[name][i] for name in TOTALS])
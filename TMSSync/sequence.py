@@ -0,0 +1,111 @@
+import threading
+
+from . import backend
+from . import config
+from . import connection
+from . import attendance
+
+
+__all__ = ['InOutIdAllocator', 'InOutIdCounter']
+
+
+Connection = connection.Connection
+
+
+class InOutIdAllocator(object):
+    """Hands out InOutIDs from blocks reserved per employee
+
+    ``dbo.InOutIdBlocks`` holds the next free InOutID of every employee. A
+    block of ``block_size`` ids is reserved there with a single MERGE, which
+    never goes below ``Max(InOutID) + 1`` of the employee, and then given
+    out from memory. Reservations run on the connection of the calling
+    thread, inside its transaction, so they never wait for rows that
+    transaction has not committed yet. A block whose reservation is rolled
+    back stays in memory and its ids are still given out; the seed keeps
+    the next reservation above every committed id, which is enough while a
+    single sync writes the attendance of an employee at a time.
+    """
+
+    reserve_query = '''
+        SET NOCOUNT ON;
+        DECLARE @EmployeeID int = ?, @BlockSize int = ?;
+        DECLARE @Seed int = (
+            Select IsNull(Max(InOutID), 0) + 1
+            From AttendanceDetails
+            Where EmployeeID = @EmployeeID);
+        MERGE dbo.InOutIdBlocks WITH (HOLDLOCK) AS B
+        USING (Select @EmployeeID AS EmployeeID) AS N
+        ON B.EmployeeID = N.EmployeeID
+        WHEN MATCHED THEN UPDATE SET
+            NextInOutID = CASE
+                WHEN B.NextInOutID > @Seed THEN B.NextInOutID
+                ELSE @Seed END + @BlockSize
+        WHEN NOT MATCHED THEN
+            INSERT (EmployeeID, NextInOutID)
+            VALUES (@EmployeeID, @Seed + @BlockSize)
+        OUTPUT INSERTED.NextInOutID - @BlockSize;
+    '''
+
+    def __init__(self, block_size=None):
+        if block_size is None:
+            block_size = config.SYNC_INOUTID_BLOCK_SIZE
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, employeeId):
+        query = backend.read_query('ReserveInOutIds.sql', self.reserve_query)
+        first = Connection().execute(
+                query, employeeId, self.block_size).fetchone()[0]
+        return [first, first + self.block_size]
+
+    def next(self, employeeId):
+        while True:
+            with self._lock:
+                block = self._blocks.get(employeeId)
+                if block is not None and block[0] < block[1]:
+                    block[0] += 1
+                    return block[0] - 1
+            # not under the lock, the reservation may wait for the database
+            block = self._reserve(employeeId)
+            with self._lock:
+                self._blocks[employeeId] = block
+
+    def close(self):
+        with self._lock:
+            self._blocks.clear()
+
+    def install(self):
+        attendance.AttendanceDetail.inOutIds = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        attendance.AttendanceDetail.inOutIds = None
+
+
+class InOutIdCounter(object):
+    """Hands out InOutIDs counting up in memory from ``next_ids``
+
+    ``next_ids`` maps employee ids to the first id to give out, employees
+    not in it start at 1. Meant for replays that are not written as they
+    go; nothing stops another writer from taking the same ids.
+    """
+
+    def __init__(self, next_ids=None):
+        self._next = dict(next_ids or {})
+        self._lock = threading.Lock()
+
+    def next(self, employeeId):
+        with self._lock:
+            inOutId = self._next.get(employeeId, 1)
+            self._next[employeeId] = inOutId + 1
+            return inOutId
+
+    def install(self):
+        attendance.AttendanceDetail.inOutIds = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        attendance.AttendanceDetail.inOutIds = None
@@ -0,0 +1,212 @@
+import bisect
+import threading
+from datetime import timedelta
+
+from . import connection
+from . import attendance
+from . import unitofwork
+
+
+__all__ = ['SessionTimeline', 'TimelineIndex']
+
+
+Connection = connection.Connection
+ADStatus = attendance.ADStatus
+
+_LAST = float('inf')
+
+
+class SessionTimeline(object):
+    """Sorted in-time index of one employee's sessions
+
+    Sessions are kept as the raw ``AttendanceDetails`` rows of their IN and
+    OUT entries and handed out as fresh ``Session`` objects, so callers can
+    modify what they get without touching the index. Everything from the
+    last session before ``since`` onwards is held, which makes previous and
+    next lookups for any time after ``since`` exact. Rows of sessions saved
+    through the index refer back to the saved entries, which get their
+    ``adid`` once a deferred insert is flushed.
+    """
+
+    query = '''
+        Select
+            I.inOutTime, I.inOutStatus, I.inOutType, I.employeeId,
+            I.trackDate, I.adid, I.inOutId,
+            O.inOutTime, O.inOutStatus, O.inOutType, O.employeeId,
+            O.trackDate, O.adid, O.inOutId
+        From AttendanceDetails I
+        Left Join AttendanceDetails O
+            On O.employeeId = I.employeeId and O.inOutId = I.inOutId
+            and O.inOutStatus = ?
+        Where
+            I.employeeId = ? and I.inOutStatus = ? and I.inOutTime >= (
+                Select IsNull(Max(inOutTime), ?)
+                From AttendanceDetails
+                Where employeeId = ? and inOutStatus = ? and inOutTime < ?)
+    '''
+
+    def __init__(self, employee):
+        self.employee = employee
+        self.since = None
+        self._keys = []
+        self._times = {}
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self, since):
+        unitofwork.sync(attendance.AttendanceDetail.table)
+        employeeId = self.employee.employeeId
+        self.fill(Connection().execute(
+                self.query, ADStatus.OUT, employeeId, ADStatus.IN, since,
+                employeeId, ADStatus.IN, since), since)
+
+    def fill(self, rows, since):
+        """Hold the sessions of ``rows``, each the IN row columns followed by
+        the OUT row columns, as all there are from the last one before
+        ``since``"""
+        self._keys, self._times, self._rows = [], {}, {}
+        for data in rows:
+            in_row = (tuple(data[:7]), None)
+            out_row = (tuple(data[7:]), None) if data[7] is not None else None
+            self._put(in_row, out_row)
+        self.since = since
+
+    def covers(self, time):
+        return self.since is not None and time >= self.since
+
+    def _put(self, in_row, out_row):
+        inOutId = in_row[0][6]
+        self._drop(inOutId)
+        key = (in_row[0][0], inOutId)
+        bisect.insort(self._keys, key)
+        self._times[inOutId] = key
+        self._rows[inOutId] = (in_row, out_row)
+
+    def _drop(self, inOutId):
+        key = self._times.pop(inOutId, None)
+        if key is not None:
+            del self._keys[bisect.bisect_left(self._keys, key)]
+            del self._rows[inOutId]
+
+    def _entry(self, row):
+        if row is None:
+            return None
+        data, saved = row
+        entry = attendance.AttendanceDetail(*data, employee=self.employee)
+        if saved is not None:
+            if entry._adid is None:
+                # the insert of a saved entry may have been flushed since
+                entry._adid = saved._adid
+            # and what it was saved with is written or waiting to be
+            entry._clean = entry._fields()
+        return entry
+
+    def sessions(self):
+        """Every session held, by in-time"""
+        return [self.session(key[1]) for key in self._keys]
+
+    def session(self, inOutId):
+        rows = self._rows.get(inOutId)
+        if rows is None:
+            return None
+        return attendance.Session(self._entry(rows[0]), self._entry(rows[1]))
+
+    def _at(self, index):
+        if 0 <= index < len(self._keys):
+            return self.session(self._keys[index][1])
+
+    def previous(self, time):
+        """The session with the latest in-time before ``time``"""
+        return self._at(bisect.bisect_left(self._keys, (time,)) - 1)
+
+    def next(self, time):
+        """The session with the earliest in-time after ``time``"""
+        return self._at(bisect.bisect_right(self._keys, (time, _LAST)))
+
+    def overlapping(self, time_from, time_to):
+        """Sessions with any part between ``time_from`` and ``time_to``"""
+        index = max(bisect.bisect_left(self._keys, (time_from,)) - 1, 0)
+        sessions = []
+        while index < len(self._keys) and self._keys[index][0] < time_to:
+            ses = self.session(self._keys[index][1])
+            if ses.outTime is None or ses.outTime > time_from:
+                sessions.append(ses)
+            index += 1
+        return sessions
+
+    @staticmethod
+    def _snapshot(entry):
+        if entry is None:
+            return None
+        return ((entry.inOutTime, entry.inOutStatus, entry.inOutType,
+                 entry.employeeId, entry.trackDate, entry._adid,
+                 entry.inOutId), entry)
+
+    def update(self, session):
+        """Record the state of a session that has just been saved"""
+        self._put(self._snapshot(session.in_entry),
+                  self._snapshot(session.out_entry))
+
+
+class TimelineIndex(object):
+    """Per employee ``SessionTimeline`` objects loaded on first use
+
+    A timeline is loaded from ``window`` before the first time it is asked
+    about and reloaded from further back when asked about an earlier time.
+    Installed on ``Session.timelines`` it answers the previous and next
+    session lookups of ``FPEntry.record`` and is kept current by
+    ``Session.save``.
+    """
+
+    window = timedelta(days=31)
+
+    def __init__(self, window=None):
+        if window is not None:
+            self.window = window
+        self._timelines = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._timelines)
+
+    def get(self, employee, time=None):
+        timeline = self._timelines.get(employee.employeeId)
+        if timeline is None:
+            with self._lock:
+                timeline = self._timelines.setdefault(
+                        employee.employeeId, SessionTimeline(employee))
+        if time is not None and not timeline.covers(time):
+            timeline.load(time - self.window)
+        return timeline
+
+    def previous(self, employee, time):
+        return self.get(employee, time).previous(time)
+
+    def next(self, employee, time):
+        return self.get(employee, time).next(time)
+
+    def add(self, timeline):
+        """Answer for the employee of ``timeline`` from it"""
+        self._timelines[timeline.employee.employeeId] = timeline
+        return timeline
+
+    def update(self, session):
+        timeline = self._timelines.get(session.employee.employeeId)
+        if timeline is not None and timeline.since is not None:
+            timeline.update(session)
+
+    def discard(self, employee):
+        self._timelines.pop(employee.employeeId, None)
+
+    def clear(self):
+        self._timelines.clear()
+
+    def install(self):
+        attendance.Session.timelines = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        attendance.Session.timelines = None
@@ -0,0 +1,362 @@
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from . import connection
+
+
+__all__ = ['UnitOfWork', 'WriteCounts', 'current', 'pending', 'identity',
+           'sync', 'values', 'narrowed', 'count']
+
+
+Connection = connection.Connection
+
+_local = threading.local()
+
+# SQL Server takes at most 2100 parameters and 1000 rows of VALUES
+MAX_PARAMS = 2000
+MAX_ROWS = 1000
+
+
+def current():
+    """The unit of work active on this thread, if any"""
+    return getattr(_local, 'uow', None)
+
+
+def pending(table, key):
+    """The row pending for ``key`` in this thread's unit of work, if any"""
+    uow = current()
+    return uow.get(table, key) if uow is not None else None
+
+
+def identity(table, key):
+    """The identity this thread's unit of work got back for ``key``"""
+    uow = current()
+    return uow.identity(table, key) if uow is not None else None
+
+
+def values(width, count=1):
+    """``count`` rows of ``width`` placeholders for a VALUES clause"""
+    return ', '.join(['(%s)' % ', '.join(['?'] * width)] * count)
+
+
+def _like(value, like):
+    # an output column as the key it is matched to has it, a date coming
+    # back for a datetime or a Decimal or str for an int
+    if value is None or like is None or type(value) is type(like):
+        return value
+    if isinstance(like, datetime):
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+        value = str(value)
+        for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+        return value
+    if isinstance(like, str):
+        return str(value).rstrip()
+    try:
+        return type(like)(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _output_key(output, like):
+    # the key columns of an output row with the types of like
+    return tuple(_like(value, key) for value, key in zip(output, like))
+
+
+def narrowed(table, id_column, columns, fields, clean=None):
+    """An update of the ``columns`` whose ``fields`` differ from ``clean``,
+    or of all of them without it, and its params
+
+    The row is the one ``id_column`` matches, whose value is left for the
+    caller to add to the params.
+    """
+    changed = [i for i, field in enumerate(fields)
+               if clean is None or field != clean[i]]
+    return ('Update %s Set %s Where %s = ?' % (
+                table, ', '.join('%s=?' % columns[i] for i in changed),
+                id_column),
+            tuple(fields[i] for i in changed))
+
+
+def count(table, written):
+    """Count a save of a row of ``table`` as written or skipped with
+    the installed ``WriteCounts``"""
+    counts = UnitOfWork.counts
+    if counts is not None:
+        counts.add(table, written)
+
+
+def sync(table, forget=False):
+    """Flush pending writes to ``table`` before a query that cannot be
+    answered from the pending state
+
+    Statements that delete rows pass ``forget`` so identities handed out
+    for the table are not used again.
+    """
+    uow = current()
+    if uow is not None:
+        if uow.has_pending(table):
+            uow.flush()
+        if forget:
+            uow.forget(table)
+
+
+class UnitOfWork(object):
+    """Write-behind buffer for the inserts and updates of a batch
+
+    Writes are collected per table and keyed by the natural key of the row,
+    so saving the same row twice leaves one pending statement; rows saved
+    with a key of None (plain appends) are never merged. ``flush``
+    sends them grouped by statement text with ``fast_executemany``. The
+    pending rows can be read back with ``get`` and ``rows``.
+
+    Merges are changes the database works out from the row it has, so the
+    row is not read first. On flush every one is handed to its ``apply``
+    function with the others queued for it, at most one per key and call,
+    so the merges of a key are applied in the order they came. While a key
+    has a merge pending ``get`` flushes and returns None and the row is
+    read back from the database.
+
+    Inserts given an ``on_insert`` callback are into tables with an identity
+    column. Their query is a template whose ``%s`` takes the VALUES rows and
+    which outputs the identity followed by the key columns; they are sent as
+    multi-row inserts and every callback gets the output row of its key.
+    The identities stay available from ``identity`` until the unit of work
+    is discarded. An update never stands for a pending insert of its key,
+    as it can only come from an identity that was rolled back.
+
+    Used as a context manager it becomes the ``current`` unit of work of the
+    thread and flushes on a clean exit; when an exception escapes the
+    pending writes are dropped.
+
+    A ``complete`` unit of work holds every row of the tables it is asked
+    about, so a key it does not have is not in the database either.
+    """
+
+    INSERT = 'insert'
+    UPDATE = 'update'
+    MERGE = 'merge'
+
+    complete = False
+    # a WriteCounts installed here counts the saves of every thread
+    counts = None
+
+    def __init__(self):
+        self._tables = OrderedDict()
+        self._identities = {}
+        # the callbacks handed an identity since the last savepoint
+        self._given = None
+        self.statements = 0
+        self.rows_written = 0
+
+    def __len__(self):
+        return sum(len(pending) for pending in self._tables.values())
+
+    def __enter__(self):
+        self._previous = current()
+        _local.uow = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            _local.uow = self._previous
+
+    def savepoint(self):
+        """A copy of the pending writes and the identities got so far that
+        ``restore`` can go back to, as long as no later savepoint is taken"""
+        self._given = []
+        return (OrderedDict((table, OrderedDict(pending))
+                            for table, pending in self._tables.items()),
+                dict((table, dict(identities))
+                     for table, identities in self._identities.items()))
+
+    def restore(self, savepoint):
+        # identities got since belong to rows that were rolled back, also
+        # those of inserts queued before the savepoint and flushed after it;
+        # their callbacks are given None and the inserts are queued again
+        tables, identities = savepoint
+        for callback in reversed(self._given or ()):
+            callback(None)
+        self._given = []
+        self._tables = OrderedDict(
+                (table, OrderedDict(pending))
+                for table, pending in tables.items())
+        self._identities = dict(
+                (table, dict(table_identities))
+                for table, table_identities in identities.items())
+
+    def _put(self, kind, table, key, query, params, row, callbacks=None):
+        pending = self._tables.setdefault(table, OrderedDict())
+        if key is None:
+            key = object()
+        previous = pending.get(key)
+        if (previous is not None and previous[0] == self.INSERT and
+                kind == self.UPDATE):
+            raise RuntimeError(
+                    'Update of %s row %r while its insert is pending' % (
+                        table, key))
+        if previous is not None and (previous[0] == self.MERGE) != (
+                kind == self.MERGE):
+            # neither can stand for the other, so the first goes out now
+            self.flush()
+            pending = self._tables.setdefault(table, OrderedDict())
+            previous = None
+        if callbacks is not None and previous is not None and previous[4]:
+            # whoever saved the row before wants its identity as well
+            callbacks = previous[4] + callbacks
+        pending[key] = (kind, query, tuple(params), row, callbacks)
+
+    def insert(self, table, key, query, params, row=None, on_insert=None):
+        callbacks = [on_insert] if on_insert is not None else None
+        self._put(self.INSERT, table, key, query, params, row, callbacks)
+
+    def update(self, table, key, query, params, row=None):
+        self._put(self.UPDATE, table, key, query, params, row)
+
+    def merge(self, table, key, params, apply):
+        """Queue a change of the row of ``key`` for ``apply``, which is
+        called with the params of many such changes and writes them with
+        one statement"""
+        params = tuple(params)
+        previous = self._tables.get(table, {}).get(key)
+        merges = previous[2] if previous and previous[0] == self.MERGE else ()
+        if merges and merges[-1] == params:
+            # a change merged again right away changes nothing more
+            count(table, False)
+            return
+        count(table, True)
+        self._put(self.MERGE, table, key, apply, merges + (params,), None)
+
+    def identity(self, table, key):
+        return self._identities.get(table, {}).get(key)
+
+    def forget(self, table):
+        self._identities.pop(table, None)
+
+    def has_pending(self, table):
+        return bool(self._tables.get(table))
+
+    def get(self, table, key):
+        """The pending row stored for ``key`` or None"""
+        write = self._tables.get(table, {}).get(key)
+        if write is not None and write[0] == self.MERGE:
+            self.flush()
+            return None
+        return write[3] if write is not None else None
+
+    def rows(self, table):
+        return [write[3] for write in self._tables.get(table, {}).values()
+                if write[3] is not None]
+
+    def flush(self):
+        if not self._tables:
+            return
+        tables, self._tables = self._tables, OrderedDict()
+
+        batches = OrderedDict()
+        returning = OrderedDict()
+        merges = OrderedDict()
+        for table, pending in tables.items():
+            for key, (kind, query, params, row, callbacks) in pending.items():
+                if kind == self.MERGE:
+                    merges.setdefault(query, []).append(params)
+                elif callbacks is None:
+                    batches.setdefault(query, []).append(params)
+                else:
+                    returning.setdefault((table, query), []).append(
+                            (key, params, callbacks))
+
+        cursor = Connection().cursor()
+        cursor.fast_executemany = True
+        for query, params in batches.items():
+            cursor.executemany(query, params)
+            self.statements += 1
+            self.rows_written += len(params)
+        for (table, query), writes in returning.items():
+            self._insert_returning(cursor, table, query, writes)
+        for apply, merged in merges.items():
+            self._merge(apply, merged)
+
+    def _merge(self, apply, merged):
+        # the n-th merges of the keys go out after the (n-1)-th ones
+        for n in range(max(len(params) for params in merged)):
+            batch = [params[n] for params in merged if len(params) > n]
+            size = max(1, min(MAX_ROWS, MAX_PARAMS // len(batch[0])))
+            for start in range(0, len(batch), size):
+                apply(batch[start:start + size])
+                self.statements += 1
+                self.rows_written += len(batch[start:start + size])
+
+    def _insert_returning(self, cursor, table, query, writes):
+        width = len(writes[0][1])
+        size = max(1, min(MAX_ROWS, MAX_PARAMS // width))
+        identities = self._identities.setdefault(table, {})
+        for start in range(0, len(writes), size):
+            part = OrderedDict(
+                    (key, (params, callbacks))
+                    for key, params, callbacks in writes[start:start + size])
+            params = [param for row in part.values() for param in row[0]]
+            cursor.execute(query % values(width, len(part)), *params)
+            outputs = cursor.fetchall()
+            self.statements += 1
+            self.rows_written += len(part)
+            like = next(iter(part))
+            for output in outputs:
+                key = _output_key(output[1:], like)
+                identities[key] = output[0]
+                for callback in part.pop(key, ((), ()))[1]:
+                    callback(output[0])
+                    if self._given is not None:
+                        self._given.append(callback)
+            if part:
+                raise RuntimeError(
+                        'No identity returned for %s rows %s' % (
+                            table, list(part)))
+
+
+class WriteCounts(object):
+    """The saves of a run per table, those written and those skipped
+
+    A save is written when it sends or queues a statement, however the unit
+    of work folds them together, and skipped when the row is known to hold
+    what it would write already.
+    """
+
+    def __init__(self):
+        self.written = {}
+        self.skipped = {}
+        self._lock = threading.Lock()
+
+    def add(self, table, written):
+        counts = self.written if written else self.skipped
+        with self._lock:
+            counts[table] = counts.get(table, 0) + 1
+
+    def totals(self):
+        with self._lock:
+            return (sum(self.written.values()), sum(self.skipped.values()))
+
+    def summary(self):
+        lines = ['%-20s %8s %8s' % ('writes', 'written', 'skipped')]
+        with self._lock:
+            for table in sorted(set(self.written) | set(self.skipped)):
+                lines.append('%-20s %8d %8d' % (
+                    table, self.written.get(table, 0),
+                    self.skipped.get(table, 0)))
+        return '\n'.join(lines)
+
+    def install(self):
+        UnitOfWork.counts = self
+        return self
+
+    @staticmethod
+    def uninstall():
+        UnitOfWork.counts = None
@@ -0,0 +1,256 @@
+"""What the attendance would have been under other lateness rules
+
+HR asks what a different ``LATE_GRACE_TIME`` or ``MAX_EARLY_START_OFFSET``
+would have done to the attendance of a period. ``WhatIf`` reads the stored
+sessions and shifts of the period into arrays once and works out every
+variant in one pass with NumPy, which is only needed here::
+
+    outcome = WhatIf.load(date_from, date_to).evaluate(
+        [Policy(grace_time=timedelta(minutes=m)) for m in (15, 30, 45)])
+    print(outcome.summary())
+"""
+from __future__ import print_function
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import attendance
+from . import connection
+from . import daycalendar
+
+
+__all__ = ['Policy', 'WhatIf', 'Outcome']
+
+
+Connection = connection.Connection
+
+DAY = 86400
+
+# what a day counts as when someone is present on it
+WORKING, OPTIONAL, OFFDAY = 0, 1, 2
+
+__SESSIONS_QUERY__ = '''
+    Select i.EmployeeID, i.InOutTime, o.InOutTime
+    From AttendanceDetails i
+    Left Join AttendanceDetails o
+        On o.EmployeeID = i.EmployeeID and o.InOutID = i.InOutID
+        and o.InOutStatus = 'Out'
+    Where i.InOutStatus = 'In' and i.InOutTime >= ? and i.InOutTime < ?
+    Order By i.EmployeeID, i.InOutTime'''
+
+
+class Policy(object):
+    """A variant of the lateness rules
+
+    ``grace_time`` is ``ShiftDetails.grace_time`` and ``early_offset``
+    ``Session.early_offset``, both defaulting to what the sync uses.
+    """
+
+    def __init__(self, grace_time=None, early_offset=None, name=None):
+        if grace_time is None:
+            grace_time = attendance.ShiftDetails.grace_time
+        if early_offset is None:
+            early_offset = attendance.Session.early_offset
+        self.grace_time = grace_time
+        self.early_offset = early_offset
+        self.name = name or 'grace %dm, early %dm' % (
+            grace_time.total_seconds() // 60,
+            early_offset.total_seconds() // 60)
+
+    def __repr__(self):
+        return '<Policy %s>' % self.name
+
+
+def _seconds(times):
+    return np.array(times, dtype='datetime64[s]').astype(np.int64)
+
+
+def _track_day(times, shift_from):
+    # ShiftDetails.get_track_date as days since the epoch
+    return (times - shift_from) // DAY
+
+
+class WhatIf(object):
+    """Sessions and shifts as arrays, evaluated under many policies at once
+
+    ``sessions`` are ``(employeeId, inTime, outTime)``, ``outTime`` None
+    for an open session, and ``shifts`` maps employee ids to their
+    ``ShiftHistory``; every session is worked out with the shift that
+    applied when it started, and sessions without one are left out.
+    ``calendar`` answers ``get`` as ``DayDetail`` does and defaults to it.
+
+    ``evaluate`` follows ``Session.record`` and
+    ``EmployeeAttendance.mark_present``: the days employees are present on
+    and whether each is in time, late or overtime. The absences the sync
+    marks between sessions are not worked out.
+    """
+
+    def __init__(self, sessions, shifts, calendar=None):
+        if np is None:
+            raise ImportError('numpy is needed for what-if evaluation')
+        self.calendar = calendar or attendance.DayDetail
+        at = [(session, shifts[session[0]].shift_at(session[1]))
+              for session in sessions if session[0] in shifts]
+        at = [(session, shift) for session, shift in at if shift is not None]
+        sessions = [session for session, _ in at]
+        self.employee_ids = sorted(set(session[0] for session in sessions))
+        index = dict((emp_id, i) for i, emp_id in enumerate(self.employee_ids))
+
+        self.employees = np.array(
+            [index[session[0]] for session in sessions], dtype=np.int64)
+        self.in_times = _seconds([session[1] for session in sessions])
+        self.has_out = np.array(
+            [session[2] is not None for session in sessions], dtype=bool)
+        self.out_times = _seconds(
+            [session[2] or session[1] for session in sessions])
+        self.shift_from = np.array(
+            [shift.timeFrom.hour * 3600 + shift.timeFrom.minute * 60
+             for _, shift in at], dtype=np.int64)
+        self.shift_to = np.array(
+            [shift.timeTo.hour * 3600 + shift.timeTo.minute * 60
+             for _, shift in at], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.in_times)
+
+    @classmethod
+    def load(cls, date_from, date_to):
+        """The sessions starting in ``[date_from, date_to)`` with the
+        shifts and the holidays of the period"""
+        sessions = [tuple(data) for data in Connection().execute(
+            __SESSIONS_QUERY__, date_from, date_to)]
+        shifts = attendance.ShiftDetails.get_all_history()
+        calendar = daycalendar.DayCalendar(
+            date_from - timedelta(days=1), date_to + timedelta(days=1))
+        return cls(sessions, shifts, calendar)
+
+    def day_kinds(self, first, last):
+        """``WORKING``, ``OPTIONAL`` or ``OFFDAY`` for the days ``first`` to
+        ``last``, counted since the epoch"""
+        kinds = np.zeros(last - first + 1, dtype=np.int8)
+        epoch = datetime(1970, 1, 1)
+        for i in range(len(kinds)):
+            offday = self.calendar.get(epoch + timedelta(days=first + i))
+            if offday == attendance.DayDetail.OPTIONAL:
+                kinds[i] = OPTIONAL
+            elif offday:
+                kinds[i] = OFFDAY
+        return kinds
+
+    def evaluate(self, policies):
+        """The ``Outcome`` of every policy in ``policies``"""
+        policies = list(policies)
+        grace = np.array([policy.grace_time.total_seconds()
+                          for policy in policies], dtype=np.int64)[:, None]
+        early = np.array([policy.early_offset.total_seconds()
+                          for policy in policies], dtype=np.int64)[:, None]
+        t_in, t_out, has_out = self.in_times, self.out_times, self.has_out
+        start, end = self.shift_from, self.shift_to
+
+        # Session.trackDate, one row per policy
+        out_day = _track_day(t_out, start)
+        track = _track_day(t_in + early, start)
+        track = np.where(has_out, np.minimum(track, out_day), track)
+
+        # present as Session.record finds it, late as ShiftDetails.is_late
+        in_day = _track_day(t_in, start)
+        in_between = ((t_in >= in_day * DAY + start) &
+                      (t_in < in_day * DAY + end))
+        out_start, out_end = out_day * DAY + start, out_day * DAY + end
+        out_later = (t_out >= out_end) | (
+            (t_out >= out_start) & (t_out < out_end))
+        start_time = track * DAY + start
+        present = in_between | (has_out & (t_in < start_time) & out_later)
+        late = t_in >= start_time + grace
+
+        # the days through to the end of a session are present too
+        spans = np.where(has_out, np.maximum(out_day - track, 0), 0)
+
+        if len(self):
+            first = int(track.min())
+            last = int(max(track.max(), out_day[has_out].max()
+                           if has_out.any() else first))
+        else:
+            first = last = 0
+        days = last - first + 1
+        shape = (len(policies), len(self.employee_ids), days)
+        cells = ((np.arange(len(policies))[:, None] * shape[1] +
+                  self.employees) * days + track - first)
+
+        marked = np.zeros(shape, dtype=bool).ravel()
+        marked[cells[present]] = True
+        on_time = np.zeros_like(marked)
+        on_time[cells[present & ~late]] = True
+        continued = np.zeros_like(marked)
+        spans = spans.ravel()
+        steps = np.arange(spans.sum()) - np.repeat(
+            np.cumsum(spans) - spans, spans) + 1
+        continued[np.repeat(cells.ravel(), spans) + steps] = True
+
+        marked, on_time, continued = (
+            marked.reshape(shape), on_time.reshape(shape),
+            continued.reshape(shape))
+        kinds = self.day_kinds(first, last)
+        offday, optional = kinds == OFFDAY, kinds == OPTIONAL
+        # mark_present: overtime on an off day, never late on an optional
+        # one and in time once any session of the day is
+        days_present = marked | continued
+        days_marked = marked & ~offday
+        return Outcome(
+            policies, self.employee_ids,
+            track_dates=(track * DAY).astype('datetime64[s]').astype(
+                'datetime64[D]'),
+            session_present=present, session_late=present & late,
+            present=days_present.sum(axis=2),
+            in_time=(days_marked & (optional | on_time)).sum(axis=2),
+            late=(days_marked & ~optional & ~on_time).sum(axis=2),
+            overtime=(days_present & offday).sum(axis=2))
+
+
+class Outcome(object):
+    """What ``WhatIf.evaluate`` worked out
+
+    ``track_dates``, ``session_present`` and ``session_late`` have a row
+    per policy and a column per session. ``present``, ``in_time``, ``late``
+    and ``overtime`` count days, with a row per policy and a column per
+    employee of ``employee_ids``.
+    """
+
+    COUNTS = ('present', 'in_time', 'late', 'overtime')
+
+    def __init__(self, policies, employee_ids, track_dates, session_present,
+                 session_late, present, in_time, late, overtime):
+        self.policies = policies
+        self.employee_ids = employee_ids
+        self.track_dates = track_dates
+        self.session_present = session_present
+        self.session_late = session_late
+        self.present = present
+        self.in_time = in_time
+        self.late = late
+        self.overtime = overtime
+
+    def totals(self, policy):
+        """The day counts of all employees under the ``policy``th policy"""
+        return dict((name, int(getattr(self, name)[policy].sum()))
+                    for name in self.COUNTS)
+
+    def by_employee(self, policy):
+        """Yield ``(employeeId, present, in_time, late, overtime)`` under
+        the ``policy``th policy"""
+        for i, emp_id in enumerate(self.employee_ids):
+            yield (emp_id,) + tuple(int(getattr(self, name)[policy, i])
+                                    for name in self.COUNTS)
+
+    def summary(self):
+        lines = ['%-30s %8s %8s %8s %8s' % (
+            'policy', 'present', 'in time', 'late', 'overtime')]
+        for i, policy in enumerate(self.policies):
+            totals = self.totals(i)
+            lines.append('%-30s %8d %8d %8d %8d' % (
+                policy.name[:30], totals['present'], totals['in_time'],
+                totals['late'], totals['overtime']))
+        return '\n'.join(lines)
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+
+from . import connection
+from . import unitofwork
+
+
+__all__ = ['partition_by_employee', 'run_in_batches', 'run_parallel']
+
+
+Connection = connection.Connection
+
+SAVEPOINT = 'fpentry'
+
+
+def partition_by_employee(entries, uid_index=3):
+    """Split ordered entries into one ordered stream per ``L_UID``
+
+    Streams come out in order of the first entry of every employee and
+    keep the relative order of that employee's entries.
+    """
+    streams = OrderedDict()
+    for entry in entries:
+        streams.setdefault(entry[uid_index], []).append(entry)
+    return list(streams.values())
+
+
+def run_in_batches(entries, record, batch_size, on_error=None,
+                   transactional=False, on_commit=None):
+    """Record entries in order, flushing writes every ``batch_size``
+
+    A ``ValueError`` raised by ``record`` is handed to ``on_error`` with the
+    entry, or raised when there is no ``on_error``. In transactional mode
+    every ``batch_size`` entries are committed as one transaction and each
+    entry runs under a savepoint, so any error of a single entry rolls back
+    that entry's writes alone before it is handed on; ``on_error`` is the
+    place to forget what was cached from them. ``on_commit`` is called
+    after the last entry, before the last commit.
+    """
+    if transactional:
+        errors = (Exception,)
+    else:
+        errors = (ValueError,)
+
+    conn = Connection()
+    if transactional:
+        conn.begin()
+    try:
+        with unitofwork.UnitOfWork() as uow:
+            for count, entry in enumerate(entries, 1):
+                if transactional:
+                    conn.savepoint(SAVEPOINT)
+                    state = uow.savepoint()
+                try:
+                    record(entry)
+                except errors as error:
+                    if on_error is None:
+                        raise
+                    if transactional:
+                        conn.rollback_to(SAVEPOINT)
+                        uow.restore(state)
+                    on_error(entry, error)
+                if count % batch_size == 0:
+                    uow.flush()
+                    if transactional:
+                        conn.commit()
+                        conn.begin()
+        if on_commit is not None:
+            on_commit()
+        if transactional:
+            conn.commit()
+    except BaseException:
+        if transactional:
+            conn.rollback()
+        raise
+
+
+def _work(streams, record, batch_size, on_error, transactional):
+    def entries():
+        while True:
+            try:
+                stream = streams.get_nowait()
+            except Empty:
+                return
+            for entry in stream:
+                yield entry
+
+    try:
+        run_in_batches(entries(), record, batch_size, on_error,
+                       transactional)
+    finally:
+        Connection.close()
+
+
+def run_parallel(entries, record, batch_size, workers, on_error=None,
+                 transactional=False):
+    """Record entries on a pool of ``workers`` threads
+
+    Entries are partitioned by employee and each employee's stream is
+    handled start to end by a single worker, on that worker's own
+    connection and unit of work, so per employee ordering is the same as
+    in a sequential run. The connections come from the pool, which the
+    calling thread and the extraction of new entries draw from as well, so
+    no more than ``config.POOL_SIZE - 2`` workers run at once.
+    """
+    streams = Queue()
+    for stream in partition_by_employee(entries):
+        streams.put(stream)
+
+    workers = max(1, min(workers, streams.qsize()))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_work, streams, record, batch_size,
+                               on_error, transactional)
+                   for _ in range(workers)]
+    for future in futures:
+        future.result()
@@ -0,0 +1,350 @@
+"""Measure the sync on a synthetic workforce
+
+    python -m benchmarks.run --conn "DRIVER=...;DATABASE=TMSBench;..."
+    python -m benchmarks.run --sqlite bench.db
+
+``--conn`` must point at a scratch database, never at the one the sync
+writes to, and ``--sqlite`` runs on an embedded database instead: the TMS
+tables are created there when missing and the rows of the generated
+employees are deleted before every scenario. Two scenarios are run by
+default:
+
+``sync``
+    the punches reach ``record_entries`` in the chunks a sync polling every
+    ``--poll`` minutes would find, with the caches of ``perform_sync``
+    installed
+``replay``
+    the attendance of every employee is worked out again from all their
+    punches by ``Reconciler``, as the rebuild does
+
+Punches per second, queries per punch and peak memory are reported for
+each, ``units`` being the chunks recorded or the employees replayed, and
+the results are written as JSON to ``--output``, by default
+``benchmarks/results/<time>.json``. ``--compare`` prints the ratios to an
+earlier result file.
+"""
+from __future__ import print_function
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from TMSSync import attendance
+from TMSSync import backend
+from TMSSync import config
+from TMSSync import connection
+from TMSSync import daycalendar
+from TMSSync import fpsync
+from TMSSync import punches as decoding
+from TMSSync import querystats
+from TMSSync import replay
+from TMSSync import unitofwork
+
+from .workforce import Workforce
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+__DIR__ = os.path.dirname(__file__)
+__SCHEMA_QUERY_FILE__ = os.path.join(__DIR__, 'schema.sql')
+__RESULTS_DIR__ = os.path.join(__DIR__, 'results')
+
+SCENARIOS = ('sync', 'replay')
+
+
+Connection = connection.Connection
+
+
+def use_database(conn_str=None, sqlite_path=None):
+    if sqlite_path is not None:
+        if config.BACKEND == 'sqlite' and sqlite_path == config.SQLITE_PATH:
+            raise SystemExit(
+                    'refusing to run on the database the sync writes to')
+        config.BACKEND = 'sqlite'
+        config.SQLITE_PATH = sqlite_path
+    else:
+        if conn_str == config.DB_CONN_STR:
+            raise SystemExit(
+                    'refusing to run on the database the sync writes to')
+        config.BACKEND = 'mssql'
+        config.DB_CONN_STR = conn_str
+
+
+def setup_database():
+    # the sqlite Setup.sql has the TMS tables already
+    if backend.get_backend().name == 'mssql':
+        with open(__SCHEMA_QUERY_FILE__) as query_file:
+            Connection().execute(query_file.read())
+    fpsync.setup_database()
+    Connection().execute(
+            "Insert Into Weekend Select 'Sunday' "
+            "Where Not Exists (Select * From Weekend)")
+
+
+def _in(column, values):
+    return '%s In (%s)' % (column, ', '.join(['?'] * len(values)))
+
+
+def _parts(values, size=1000):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def get_employee_ids(workforce):
+    ids = {}
+    for part in _parts(str(code) for code in workforce.codes):
+        for row in Connection().execute(
+                'Select employeecode, employeeId From Employee Where %s' %
+                _in('employeecode', part), *part):
+            ids[int(row[0])] = row[1]
+    return ids
+
+
+def reset(workforce):
+    """Leave only the employees and shifts of ``workforce`` behind"""
+    conn = Connection()
+    ids = get_employee_ids(workforce)
+    for part in _parts(ids.values()):
+        for table, column in (('AttendanceDetails', 'EmployeeID'),
+                              ('EmployeeAttendance', 'employeeId'),
+                              ('InOutIdBlocks', 'EmployeeID'),
+                              ('ShiftDetails', 'EmployeeID')):
+            conn.execute('Delete From %s Where %s' % (
+                table, _in(column, part)), *part)
+    for part in _parts(workforce.codes):
+        conn.execute('Delete From FPEntries Where %s' % _in('L_UID', part),
+                     *part)
+
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    missing = [(str(code), 'Bench %d' % code) for code in workforce.codes
+               if code not in ids]
+    if missing:
+        cursor.executemany(
+                'Insert Into Employee(employeecode, employeename, '
+                'employeestatus) Values (?, ?, 1)', missing)
+        ids = get_employee_ids(workforce)
+    cursor.executemany(
+            'Insert Into ShiftDetails(timeFrom, timeTo, EmployeeID) '
+            'Values (?, ?, ?)',
+            [(time_from, time_to, ids[code])
+             for code, time_from, time_to in workforce.shift_rows()])
+
+
+class Measure(object):
+    """Time, queries, writes and peak memory of what runs inside"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.seconds = 0.0
+        self.queries = 0
+        self.peak_traced_kb = None
+        self.stats = None
+        self.counts = None
+
+    def __enter__(self):
+        self.stats = querystats.QueryStats().install()
+        self.counts = unitofwork.WriteCounts().install()
+        if self.trace_memory:
+            tracemalloc.start()
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.time() - self._start
+        if self.trace_memory:
+            self.peak_traced_kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        self.stats.uninstall()
+        self.counts.uninstall()
+        self.queries = sum(stat.calls for stat in self.stats.queries())
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_sync(workforce, args):
+    chunks = workforce.deliveries(timedelta(minutes=args.poll))
+    caches = fpsync.install_caches()
+    calendar = attendance.DayDetail.calendar
+    try:
+        with Measure(args.trace_memory) as measure:
+            for chunk in chunks:
+                entries, _ = decoding.decode(chunk)
+                calendar.load(entries[0].datetime, entries[-1].datetime)
+                fpsync.record_entries(entries, args.workers)
+    finally:
+        fpsync.uninstall_caches(caches)
+    return sum(len(chunk) for chunk in chunks), len(chunks), measure
+
+
+def run_replay(workforce, args):
+    punches = workforce.employee_punches()
+    calendar = daycalendar.DayCalendar(workforce.start, workforce.end)
+    employees = [emp for emp in attendance.Employee.get_all()
+                 if emp.employeeCode in punches]
+    with Measure(args.trace_memory) as measure:
+        for emp in employees:
+            reconciler = replay.Reconciler(emp, workforce.start)
+            reconciler.run(calendar, punches[emp.employeeCode])
+    return (sum(len(punches[emp.employeeCode]) for emp in employees),
+            len(employees), measure)
+
+
+RUNNERS = {'sync': run_sync, 'replay': run_replay}
+
+
+def run_scenario(name, workforce, args):
+    reset(workforce)
+    print('Running %s ...' % name)
+    if args.verbose:
+        punches, units, measure = RUNNERS[name](workforce, args)
+    else:
+        # what every entry prints is left out of the timing
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            punches, units, measure = RUNNERS[name](workforce, args)
+    rate = per_punch = None
+    if measure.seconds:
+        rate = round(punches / measure.seconds, 1)
+    if punches:
+        per_punch = round(measure.queries / float(punches), 3)
+    result = {
+        'scenario': name,
+        'punches': punches,
+        'units': units,
+        'seconds': round(measure.seconds, 3),
+        'punches_per_sec': rate,
+        'queries': measure.queries,
+        'queries_per_punch': per_punch,
+        'writes': measure.counts.totals()[0],
+        'writes_skipped': measure.counts.totals()[1],
+        'peak_traced_kb': measure.peak_traced_kb,
+        'peak_rss_kb': peak_rss_kb(),
+        'slowest_queries': [
+            {'query': stat.site, 'id': stat.key, 'calls': stat.calls,
+             'seconds': round(stat.seconds, 3)}
+            for stat in measure.stats.queries()[:5]],
+    }
+    print('%(scenario)s: %(punches)d punches in %(seconds).2fs, '
+          '%(punches_per_sec)s/s, %(queries_per_punch)s queries each, '
+          '%(writes)d writes, %(writes_skipped)d skipped' % result)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+                ['git', 'describe', '--always', '--dirty'],
+                cwd=__DIR__, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    with open(path) as result_file:
+        earlier = dict((result['scenario'], result)
+                       for result in json.load(result_file)['results'])
+    for result in results:
+        old = earlier.get(result['scenario'])
+        if not old or not old['punches_per_sec']:
+            continue
+        print('%s: %.2fx punches/sec, %+.3f queries/punch against %s' % (
+            result['scenario'],
+            result['punches_per_sec'] / old['punches_per_sec'],
+            result['queries_per_punch'] - old['queries_per_punch'], path))
+
+
+def parse_date(text):
+    return datetime.strptime(text, '%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument('--conn', default=os.environ.get('TMSSYNC_BENCH_CONN'),
+                        help='ODBC connection string of a scratch database '
+                        '(default $TMSSYNC_BENCH_CONN)')
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='run on a SQLite database file instead')
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--start', type=parse_date,
+                        default=datetime(2024, 1, 1), metavar='YYYY-MM-DD')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--poll', type=float, default=15,
+                        help='minutes between the polls of the sync scenario')
+    parser.add_argument('--workers', type=int, default=config.SYNC_WORKERS)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='trace peak Python memory, slowing the run')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print every entry as the sync does')
+    parser.add_argument('--label', default='')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='earlier results to compare with')
+    args = parser.parse_args(argv)
+    if not args.conn and args.sqlite is None:
+        parser.error('--conn, --sqlite or $TMSSYNC_BENCH_CONN is required')
+
+    use_database(args.conn, args.sqlite)
+    setup_database()
+    workforce = Workforce(args.employees, args.days, args.start, args.seed)
+    print('%d employees, %d punches over %d days' % (
+        args.employees, len(workforce.punches()), args.days))
+
+    try:
+        results = [run_scenario(name, workforce, args)
+                   for name in args.scenarios]
+    finally:
+        Connection.close()
+
+    report = {
+        'label': args.label,
+        'created': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'backend': config.BACKEND,
+            'employees': args.employees, 'days': args.days,
+            'start': args.start.strftime('%Y-%m-%d'), 'seed': args.seed,
+            'poll': args.poll, 'workers': args.workers,
+            'batch_size': config.SYNC_BATCH_SIZE,
+            'transactional': config.SYNC_TRANSACTIONAL,
+        },
+        'results': results,
+    }
+    output = args.output
+    if output is None:
+        if not os.path.isdir(__RESULTS_DIR__):
+            os.makedirs(__RESULTS_DIR__)
+        output = os.path.join(__RESULTS_DIR__, '%s%s.json' % (
+            datetime.now().strftime('%Y%m%d-%H%M%S'),
+            '-' + args.label if args.label else ''))
+    with open(output, 'w') as result_file:
+        json.dump(report, result_file, indent=2)
+    print('Results written to %s' % output)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
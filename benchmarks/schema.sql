@@ -0,0 +1,83 @@
+-- THE TABLES OF THE TMS DATABASE THE SYNC READS AND WRITES, FOR A SCRATCH
+-- DATABASE THE BENCHMARKS CAN FILL AND EMPTY AS THEY LIKE
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects
+    WHERE object_id = OBJECT_ID(N'dbo.Employee') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.Employee (
+    employeeId int IDENTITY PRIMARY KEY,
+    employeecode varchar(20),
+    employeename varchar(100),
+    employeestatus bit
+)
+END
+
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects
+    WHERE object_id = OBJECT_ID(N'dbo.ShiftDetails') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.ShiftDetails (
+    SDID int IDENTITY PRIMARY KEY,
+    timeFrom datetime,
+    timeTo datetime,
+    EmployeeID int
+)
+END
+
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects
+    WHERE object_id = OBJECT_ID(N'dbo.DayDetails') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.DayDetails (
+    todayDate datetime,
+    Description varchar(100)
+)
+END
+
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects
+    WHERE object_id = OBJECT_ID(N'dbo.Weekend') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.Weekend (
+    Weekend varchar(20)
+)
+INSERT INTO dbo.Weekend VALUES ('Sunday')
+END
+
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects
+    WHERE object_id = OBJECT_ID(N'dbo.AttendanceDetails') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.AttendanceDetails (
+    ADID int IDENTITY PRIMARY KEY,
+    InOutID int,
+    EmployeeID int,
+    TrackDate datetime,
+    InOutTime datetime,
+    InOutStatus varchar(10)
+)
+CREATE INDEX IX_AttendanceDetails_Employee
+    ON dbo.AttendanceDetails (EmployeeID, InOutTime)
+END
+
+IF  NOT EXISTS (
+    SELECT * FROM sys.objects
+    WHERE object_id = OBJECT_ID(N'dbo.EmployeeAttendance') AND type in (N'U')
+)
+BEGIN
+CREATE TABLE dbo.EmployeeAttendance (
+    EAID int IDENTITY PRIMARY KEY,
+    employeeId int,
+    attendanceDate datetime,
+    attendanceStatus varchar(20),
+    timeStatus varchar(20),
+    description varchar(100)
+)
+CREATE INDEX IX_EmployeeAttendance_Employee
+    ON dbo.EmployeeAttendance (employeeId, attendanceDate)
+END
@@ -0,0 +1,157 @@
+"""Synthetic employees, shifts and punches for the benchmarks"""
+import random
+from datetime import datetime, timedelta
+
+
+__all__ = ['SHIFTS', 'Workforce']
+
+
+# (start, end, weight) of the shifts employees are given
+SHIFTS = [
+    ((9, 0), (18, 0), 5),
+    ((10, 0), (19, 0), 3),
+    ((8, 0), (17, 0), 2),
+    ((14, 0), (23, 0), 1),
+    ((22, 0), (7, 0), 1),
+]
+
+# the device, manual, self service and software (in, out) TIDs
+DEVICE_TIDS = [(1, 2), (3, 4)]
+MANUAL_TIDS = [(101, 102), (201, 202), (301, 302)]
+
+
+def _minutes(rand, mean, deviation):
+    return timedelta(minutes=rand.gauss(mean, deviation))
+
+
+class Workforce(object):
+    """``employees`` people punching in and out for ``days`` from ``start``
+
+    Everything is drawn from a generator seeded with ``seed``, so the same
+    arguments give the same workforce. Employees work their shift on week
+    days and sometimes on Saturdays, arrive and leave around its ends, take
+    breaks, forget to punch, punch twice and have punches put in by hand a
+    day later. A few devices upload hours late, so punches reach the sync
+    out of order.
+    """
+
+    absent = 0.04
+    saturday = 0.2
+    breaks = 0.3
+    missed_in = 0.02
+    missed_out = 0.04
+    double = 0.03
+    manual = 0.5
+    late_upload = 0.05
+
+    def __init__(self, employees=100, days=30, start=datetime(2024, 1, 1),
+                 seed=0, code_base=99000000):
+        self.employees = employees
+        self.days = days
+        self.start = datetime(start.year, start.month, start.day)
+        self.seed = seed
+        self.codes = [code_base + i + 1 for i in range(employees)]
+        rand = random.Random(seed)
+        weights = [weight for _, _, weight in SHIFTS]
+        self.shifts = dict(
+                (code, rand.choices(SHIFTS, weights)[0][:2])
+                for code in self.codes)
+        self._punches = None
+
+    @property
+    def end(self):
+        return self.start + timedelta(days=self.days)
+
+    def shift_rows(self):
+        """``(code, timeFrom, timeTo)`` as ``ShiftDetails`` keeps them"""
+        return [(code, datetime(1900, 1, 1, *start),
+                 datetime(1900, 1, 1, *end))
+                for code, (start, end) in sorted(self.shifts.items())]
+
+    def _day(self, rand, code, day, punches):
+        (start_h, start_m), (end_h, end_m) = self.shifts[code]
+        start = day + timedelta(hours=start_h, minutes=start_m)
+        end = day + timedelta(hours=end_h, minutes=end_m)
+        if end <= start:
+            end += timedelta(days=1)
+        device_in, device_out = rand.choice(DEVICE_TIDS)
+        times = [(start + _minutes(rand, -5, 20), device_in),
+                 (end + _minutes(rand, 15, 40), device_out)]
+        if rand.random() < self.breaks:
+            out = start + (end - start) / 2 + _minutes(rand, 0, 30)
+            times[1:1] = [(out, device_out),
+                          (out + _minutes(rand, 45, 10), device_in)]
+        for i in range(len(times)):
+            time, tid = times[i]
+            missed = self.missed_in if tid == device_in else self.missed_out
+            if rand.random() < missed:
+                if rand.random() >= self.manual:
+                    times[i] = None
+                    continue
+                # put in by hand the next day
+                manual_in, manual_out = rand.choice(MANUAL_TIDS)
+                tid = manual_in if tid == device_in else manual_out
+                times[i] = (time, tid, 'Manual',
+                            time + timedelta(days=1, hours=rand.random()))
+                continue
+            times[i] = (time, tid, 'UNIS', time + timedelta(
+                    seconds=rand.randint(5, 60)))
+        late = rand.random() < self.late_upload
+        for punch in times:
+            if punch is None:
+                continue
+            time, tid, source, arrival = punch
+            time = time.replace(microsecond=0)
+            if late and source == 'UNIS':
+                arrival += timedelta(hours=rand.uniform(1, 8))
+            punches.append((time, tid, code, source, arrival))
+            if source == 'UNIS' and rand.random() < self.double:
+                again = time + timedelta(seconds=rand.randint(1, 20))
+                punches.append((again, tid, code, source,
+                                arrival + (again - time)))
+
+    def punches(self):
+        """``(time, tid, code, source, arrival)`` of every punch by time"""
+        if self._punches is None:
+            rand = random.Random(self.seed + 1)
+            punches = []
+            for code in self.codes:
+                for offset in range(self.days):
+                    day = self.start + timedelta(days=offset)
+                    weekday = day.weekday()
+                    if weekday == 6 or rand.random() < self.absent or (
+                            weekday == 5 and rand.random() >= self.saturday):
+                        continue
+                    self._day(rand, code, day, punches)
+            punches.sort()
+            self._punches = punches
+        return self._punches
+
+    @staticmethod
+    def entry(punch):
+        """A punch as the sync extracts it: C_Date, C_Time, L_TID, L_UID
+        and source"""
+        time, tid, code, source, _ = punch
+        return (time.strftime('%Y%m%d'), time.strftime('%H%M%S'), tid, code,
+                source)
+
+    def deliveries(self, poll=timedelta(minutes=15)):
+        """The entries a sync polling every ``poll`` would find, in chunks
+        ordered as ``FPSync.sql`` orders them"""
+        chunks = {}
+        for punch in self.punches():
+            arrival = punch[4]
+            if arrival >= self.end:
+                continue
+            slot = (arrival - self.start) // poll
+            chunks.setdefault(slot, []).append(self.entry(punch))
+        return [sorted(chunks[slot], key=lambda entry: (
+                    entry[0], entry[1], entry[3]))
+                for slot in sorted(chunks)]
+
+    def employee_punches(self):
+        """Every employee's punches as the rebuild reads them"""
+        punches = dict((code, []) for code in self.codes)
+        for punch in self.punches():
+            punches[punch[2]].append(self.entry(punch)[:4])
+        return punches
@@ -1,9 +1,53 @@
 from __future__ import print_function
 
+import sqlite3
+import threading
 import unittest
 from datetime import datetime, timedelta
 
 from TMSSync import attendance as att
+from TMSSync import backend
+from TMSSync import config
+from TMSSync import connection
+from TMSSync import daemon
+from TMSSync import daycalendar
+from TMSSync import directory
+from TMSSync import fpsync
+from TMSSync import punches
+from TMSSync import querystats
+from TMSSync import rebuild
+from TMSSync import replay
+from TMSSync import report
+from TMSSync import sequence
+from TMSSync import timeline
+from TMSSync import unitofwork
+from TMSSync import whatif
+from TMSSync import workers
+
+
+def setUpModule():
+    # an empty SQLite database gets what the tests expect to find
+    if backend.get_backend().name == 'sqlite':
+        fpsync.setup_database()
+        if att.Employee.get_by_code(AttendanceTest.uid) is None:
+            seed_database()
+
+
+def seed_database():
+    conn = connection.Connection()
+    conn.execute("Insert Into Weekend Values ('Sunday')")
+    for uid in (AttendanceTest.uid, AttendanceTest.other_uid):
+        conn.execute(
+            'Insert Into Employee(employeecode, employeename, employeestatus) '
+            'Values (?, ?, 1)', str(uid), 'Test')
+        conn.execute(
+            'Insert Into ShiftDetails(timeFrom, timeTo, EmployeeID) '
+            'Values (?, ?, ?)', datetime(1900, 1, 1, 10),
+            datetime(1900, 1, 1, 19), att.Employee.get_by_code(uid).employeeId)
+    emp = att.Employee.get_by_code(AttendanceTest.uid)
+    # a session from before the entries the tests make
+    att.Session.make(employee=emp, inTime=datetime(2018, 8, 20, 10),
+                     outTime=datetime(2018, 8, 20, 18)).save()
 
 
 class AttendanceTest(unittest.TestCase):
@@ -12,6 +56,7 @@ class AttendanceTest(unittest.TestCase):
     OUT = 2
 
     uid = 9600509
+    other_uid = uid + 1
     start = datetime(2018, 8, 25)
 
     emp = None
@@ -50,6 +95,22 @@ class AttendanceTest(unittest.TestCase):
                 attendanceStatus='A').save()
 
         print ('Making Entries ', end='')
+        cls.make_entries()
+        print (' Done!')
+
+        print ('Gettings Sessions and Attendances ...')
+        # get all session and attendance entries after start
+
+        cls.sessions = att.Session.get_latest_by_emp(cls.emp, cls.start)
+        cls.atts = att.EmployeeAttendance.get_latest_by_emp(cls.emp, cls.start)
+
+        cls.print_sessions()
+        cls.print_attendances()
+
+        print ('Running Tests ', end='')
+
+    @classmethod
+    def make_entries(cls):
         # two hours session on a saturday (25th)
         cls.make_entry(cls.IN, days=0, hours=11, minutes=30)
         cls.make_entry(cls.OUT, days=0, hours=13, minutes=30)
@@ -86,18 +147,6 @@ class AttendanceTest(unittest.TestCase):
         # delayed addition for tuesday (4th)
         cls.make_entry(cls.IN, days=10, hours=10)
         cls.make_entry(cls.OUT, days=10, hours=19)
-        print (' Done!')
-
-        print ('Gettings Sessions and Attendances ...')
-        # get all session and attendance entries after start
-
-        cls.sessions = att.Session.get_latest_by_emp(cls.emp, cls.start)
-        cls.atts = att.EmployeeAttendance.get_latest_by_emp(cls.emp, cls.start)
-
-        cls.print_sessions()
-        cls.print_attendances()
-
-        print ('Running Tests ', end='')
 
     @classmethod
     def tearDownClass(cls):
@@ -235,5 +284,1129 @@ class AttendanceTest(unittest.TestCase):
         self.assertIsNone(thursday_after.outTime)
 
 
+class ReplayTest(AttendanceTest):
+    """The same entries replayed in memory must give the same results"""
+
+    punches = None
+
+    @classmethod
+    def make_entry(cls, status=AttendanceTest.IN, **kwargs):
+        t = cls.start + timedelta(**kwargs)
+        cls.punches.append(
+                (t.strftime('%Y%m%d'), t.strftime('%H%M%S'), status, cls.uid))
+
+    @classmethod
+    def setUpClass(cls):
+        cls.get_employee()
+        cls.delete_stuff()
+
+        att.EmployeeAttendance(
+                cls.start + timedelta(days=7),
+                employee=cls.get_employee(),
+                attendanceStatus='A').save()
+
+        print ('Replaying Entries ...')
+        cls.punches = []
+        cls.make_entries()
+        reconciler = replay.Reconciler(cls.emp, cls.start).load()
+        result = reconciler.replay(daycalendar.DayCalendar(), cls.punches)
+
+        cls.sessions = [ses for ses in result.sessions()
+                        if ses.inTime >= cls.start]
+        cls.atts = [att.EmployeeAttendance(*row, employee=cls.emp)
+                    for row in result.attendance() if row[0] >= cls.start]
+
+        cls.print_sessions()
+        cls.print_attendances()
+
+    def test_replay_reads_nothing(self):
+        emp = att.Employee.get_by_code(self.uid)
+        reconciler = replay.Reconciler(emp, self.start).load()
+        calendar = daycalendar.DayCalendar(
+                self.start, self.start + timedelta(days=40))
+        index = att.Session.timelines
+        results = []
+        stats = querystats.QueryStats().install()
+        try:
+            # in a thread of its own, the hooks of this one stay as they are
+            thread = threading.Thread(target=lambda: results.append(
+                reconciler.replay(calendar, self.punches)))
+            thread.start()
+            thread.join()
+        finally:
+            stats.uninstall()
+        self.assertEqual(stats.queries(), [])
+        self.assertIs(att.Session.timelines, index)
+        self.assertEqual(
+            [(ses.inTime, ses.outTime) for ses in results[0].sessions()
+             if ses.inTime >= self.start],
+            [(ses.inTime, ses.outTime) for ses in self.sessions])
+
+
+class ReconcileTest(ReplayTest):
+    """Writing what the replay works out must store the same results"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.get_employee()
+        cls.delete_stuff()
+
+        att.EmployeeAttendance(
+                cls.start + timedelta(days=7),
+                employee=cls.get_employee(),
+                attendanceStatus='A').save()
+
+        print ('Reconciling Entries ...')
+        cls.punches = []
+        cls.make_entries()
+        replay.Reconciler(cls.emp, cls.start).run(
+                daycalendar.DayCalendar(), cls.punches)
+
+        cls.sessions = att.Session.get_latest_by_emp(cls.emp, cls.start)
+        cls.atts = att.EmployeeAttendance.get_latest_by_emp(cls.emp, cls.start)
+
+        cls.print_sessions()
+        cls.print_attendances()
+
+
+class SyncTest(AttendanceTest):
+    """The same entries recorded as the sync records them, in batches of a
+    unit of work, must give the same results"""
+
+    rows = None
+    batch_size = 4
+    workers = 1
+    transactional = False
+
+    @classmethod
+    def make_entry(cls, status=AttendanceTest.IN, **kwargs):
+        t = cls.start + timedelta(**kwargs)
+        cls.rows.append((t.strftime('%Y%m%d'), t.strftime('%H%M%S'), status,
+                         cls.uid, 'UNIS'))
+
+    @classmethod
+    def install(cls):
+        """Install what the entries are recorded with, return it"""
+        return []
+
+    @classmethod
+    def uninstall(cls, installed):
+        for hook in installed:
+            hook.uninstall()
+
+    @classmethod
+    def make_entries(cls):
+        cls.rows = []
+        super(SyncTest, cls).make_entries()
+        batch_size = config.SYNC_BATCH_SIZE
+        config.SYNC_BATCH_SIZE = cls.batch_size
+        installed = cls.install()
+        try:
+            cls.record(cls.rows)
+        finally:
+            cls.uninstall(installed)
+            config.SYNC_BATCH_SIZE = batch_size
+
+    @classmethod
+    def record(cls, rows):
+        entries, rejected = punches.decode(rows)
+        fpsync.record_entries(entries, cls.workers, cls.transactional)
+
+
+@unittest.skipUnless(backend.get_backend().name == 'sqlite',
+                     'the device registry is another database')
+class ChunkedSyncTest(unittest.TestCase):
+    """New punches are read in chunks and a run resumes after the last
+    chunk it finished"""
+
+    day = datetime(2019, 5, 27)
+
+    def setUp(self):
+        self.emp = AttendanceTest.get_employee()
+        self.delete_stuff()
+        self.lookback = config.SYNC_LOOKBACK_MINUTES
+        config.SYNC_LOOKBACK_MINUTES = 0
+        conn = connection.Connection()
+        for days, time, status in ((0, '100000', AttendanceTest.IN),
+                                   (0, '190000', AttendanceTest.OUT),
+                                   (1, '100000', AttendanceTest.IN),
+                                   (1, '190000', AttendanceTest.OUT),
+                                   (2, '100000', AttendanceTest.IN)):
+            conn.execute(
+                'Insert Into tEnter(C_Date, C_Time, L_TID, L_UID) '
+                'Values (?, ?, ?, ?)',
+                (self.day + timedelta(days=days)).strftime('%Y%m%d'), time,
+                status, self.emp.employeeCode)
+
+    def tearDown(self):
+        config.SYNC_LOOKBACK_MINUTES = self.lookback
+        self.delete_stuff()
+
+    def delete_stuff(self):
+        conn = connection.Connection()
+        conn.execute('Delete From tEnter Where L_UID = ?',
+                     self.emp.employeeCode)
+        conn.execute('Delete From FPSyncState')
+        att.FPEntry.delete_by_emp(self.emp, self.day)
+        att.AttendanceDetail.delete_by_emp(self.emp, self.day)
+        att.EmployeeAttendance.delete_by_emp(self.emp, AttendanceTest.start)
+
+    def sync(self, stopping=None):
+        caches = fpsync.install_caches()
+        try:
+            return fpsync.sync_new_entries(1, 2, stopping)
+        finally:
+            fpsync.uninstall_caches(caches)
+
+    def watermark(self):
+        return tuple(connection.Connection().execute(
+            'Select C_Date, C_Time From FPSyncState').fetchone() or ())
+
+    def sessions(self):
+        return [(ses.inTime.day, ses.outTime and ses.outTime.hour) for ses in
+                att.Session.get_latest_by_emp(self.emp, self.day)]
+
+    def test_chunks(self):
+        self.assertEqual([len(chunk) for chunk in
+                          fpsync.iter_new_fp_entries(2, 0)], [2, 2, 1])
+
+    def test_resumed(self):
+        self.assertEqual(self.sync(lambda: True), 2)
+        self.assertEqual(self.watermark(), ('20190527', '190000'))
+        self.assertEqual(self.sync(), 3)
+        self.assertEqual(self.watermark(), ('20190529', '100000'))
+        self.assertEqual(self.sessions(), [(27, 19), (28, 19), (29, None)])
+
+    def test_late_upload(self):
+        self.assertEqual(self.sync(), 5)
+        late = ('20190528', '200000', AttendanceTest.OUT,
+                self.emp.employeeCode)
+        connection.Connection().execute(
+            'Insert Into tEnter(C_Date, C_Time, L_TID, L_UID) '
+            'Values (?, ?, ?, ?)', *late)
+        self.assertEqual(fpsync.get_new_fp_entries(0), [])
+        # looking back far enough behind the watermark finds it
+        self.assertEqual(
+            [tuple(row) for row in fpsync.get_new_fp_entries(24 * 60)],
+            [late + ('UNIS',)])
+
+    def test_resumed_after_crash(self):
+        record_entry = fpsync.record_entry
+
+        def crashing(entry):
+            record_entry(entry)
+            if entry.datetime == self.day + timedelta(days=1, hours=10):
+                raise RuntimeError('Crashed on purpose')
+
+        fpsync.record_entry = crashing
+        try:
+            self.assertRaises(RuntimeError, self.sync)
+        finally:
+            fpsync.record_entry = record_entry
+        self.assertEqual(self.watermark(), ('20190527', '190000'))
+        # nothing of the crashed chunk was written, so all of it is read
+        self.assertEqual(self.sync(), 3)
+        self.assertEqual(self.sessions(), [(27, 19), (28, 19), (29, None)])
+
+
+class PunchesTest(unittest.TestCase):
+
+    def test_decode(self):
+        rows = [('20180825', '091500', 1, AttendanceTest.uid, 'UNIS'),
+                ('20180231', '091500', 1, AttendanceTest.uid, 'UNIS'),
+                ('20180825', '096000', 2, AttendanceTest.uid, 'UNIS'),
+                ('2018082', '091500', 2, AttendanceTest.uid, 'UNIS'),
+                ('20180825', '181500', 102, AttendanceTest.uid, 'Manual'),
+                ('20180825', '181500', 2, 1, 'UNIS')]
+        decoded, rejected = punches.decode(rows)
+        self.assertEqual(len(decoded), 2)
+        self.assertEqual(decoded[0].datetime, datetime(2018, 8, 25, 9, 15))
+        self.assertEqual(decoded[0].employeeId,
+                         AttendanceTest.get_employee().employeeId)
+        self.assertEqual((decoded[1].inOutStatus, decoded[1].typ),
+                         ('Out', 'manual'))
+        self.assertEqual(tuple(decoded[1][:5]), rows[4])
+        self.assertEqual([str(error) for row, error in rejected], [
+            "Bad C_Date '20180231'", "Bad C_Time '096000'",
+            "Bad C_Date '2018082'", 'No Employee'])
+
+
+class WatermarkTest(unittest.TestCase):
+
+    rows = [('20180825', '091500', 1, 1, 'UNIS'),
+            ('20180825', '181500', 2, 1, 'UNIS'),
+            ('20180826', '091500', 1, 2, 'UNIS'),
+            ('20180825', '101500', 1, 3, 'Manual'),
+            ('20180826', '101500', 1, 3, 'Manual')]
+
+    def test_all_recorded(self):
+        self.assertEqual(fpsync.get_watermarks(self.rows), {
+            'UNIS': ('20180826', '091500', 2),
+            'Manual': ('20180826', '101500', 3)})
+
+    def test_held_before_failed(self):
+        held = fpsync.hold_watermarks([self.rows[1]])
+        self.assertEqual(fpsync.get_watermarks(self.rows, held), {
+            'UNIS': ('20180825', '091500', 1),
+            'Manual': ('20180826', '101500', 3)})
+        # a later chunk does not move the source past the failure either
+        later = [('20180827', '091500', 1, 1, 'UNIS')]
+        self.assertEqual(fpsync.get_watermarks(later, held), {})
+
+    def test_held_before_rejected(self):
+        rejected = ('2018082', '101500', 1, 3, 'Manual')
+        held = fpsync.hold_watermarks([rejected, self.rows[4]])
+        self.assertEqual(fpsync.get_watermarks(self.rows, held), {
+            'UNIS': ('20180826', '091500', 2)})
+
+
+@unittest.skipUnless(backend.get_backend().name == 'sqlite',
+                     'the device registry is another database')
+class RejectsTest(unittest.TestCase):
+    """Entries that keep failing stop holding their source back"""
+
+    day = datetime(2019, 3, 11)
+    unknown = 9799999
+
+    def setUp(self):
+        self.emp = AttendanceTest.get_employee()
+        self.delete_stuff()
+        self.lookback = config.SYNC_LOOKBACK_MINUTES
+        config.SYNC_LOOKBACK_MINUTES = 0
+
+    def tearDown(self):
+        config.SYNC_LOOKBACK_MINUTES = self.lookback
+        self.delete_stuff()
+
+    def delete_stuff(self):
+        conn = connection.Connection()
+        for uid in (self.emp.employeeCode, self.unknown):
+            conn.execute('Delete From tEnter Where L_UID = ?', uid)
+        for table in ('FPSyncState', 'FPSyncRejects'):
+            conn.execute('Delete From %s' % table)
+        att.FPEntry.delete_by_emp(self.emp, self.day)
+        att.AttendanceDetail.delete_by_emp(self.emp, self.day)
+        att.EmployeeAttendance.delete_by_emp(self.emp, AttendanceTest.start)
+
+    def sync(self, rows):
+        date = self.day.strftime('%Y%m%d')
+        for time, status, uid in rows:
+            connection.Connection().execute(
+                'Insert Into tEnter(C_Date, C_Time, L_TID, L_UID) '
+                'Values (?, ?, ?, ?)', date, time, status, uid)
+        installed = fpsync.install_caches()
+        try:
+            return fpsync.sync_new_entries(1)
+        finally:
+            fpsync.uninstall_caches(installed)
+
+    def test_unknown_employee_passed(self):
+        code = self.emp.employeeCode
+        self.assertEqual(self.sync([('080000', AttendanceTest.IN,
+                                     self.unknown),
+                                    ('090000', AttendanceTest.IN, code)]), 2)
+        # the next run reads the new punch alone
+        self.assertEqual(self.sync([('180000', AttendanceTest.OUT, code)]),
+                         1)
+        conn = connection.Connection()
+        self.assertEqual(
+            [tuple(row) for row in conn.execute(
+                'Select Source, C_Date, C_Time, L_UID From FPSyncState')],
+            [('UNIS', '20190311', '180000', code)])
+        self.assertEqual(
+            [tuple(row) for row in conn.execute(
+                'Select L_UID, Error From FPSyncRejects')],
+            [(self.unknown, 'No Employee')])
+        sessions = att.Session.get_latest_by_emp(self.emp, self.day)
+        self.assertEqual([(ses.inTime.hour, ses.outTime.hour)
+                          for ses in sessions], [(9, 18)])
+
+    def test_retries_counted(self):
+        entry = ('20190311', '090000', 1, self.unknown, 'UNIS')
+        error = ValueError('Rejected')
+        for i in range(config.SYNC_MAX_ATTEMPTS - 1):
+            self.assertEqual(fpsync.record_rejects([(entry, error, False)]),
+                             [entry])
+        self.assertEqual(fpsync.record_rejects([(entry, error, False)]), [])
+
+
+@unittest.skipUnless(backend.get_backend().name == 'sqlite',
+                     'the device and manual registries are other databases')
+class SourcesTest(unittest.TestCase):
+    """What the sync and a rebuild read of a punch made on a device and by
+    hand at the same time"""
+
+    uid = 9700001
+    device = [('20310105', '091500', 1, uid), ('20310105', '181500', 2, uid)]
+    manual = [('20310105', '091500', 101, uid),
+              ('20310106', '093000', 101, uid)]
+
+    def setUp(self):
+        conn = connection.Connection()
+        for table, rows in (('tEnter', self.device),
+                            ('ManualEntry', self.manual)):
+            for row in rows:
+                conn.execute('Insert Into %s(C_Date, C_Time, L_TID, L_UID) '
+                             'Values (?, ?, ?, ?)' % table, *row)
+
+    def tearDown(self):
+        conn = connection.Connection()
+        for table in ('tEnter', 'ManualEntry', 'FPEntries'):
+            conn.execute('Delete From %s Where L_UID = ?' % table, self.uid)
+
+    def synced(self):
+        return [tuple(row) for row in fpsync.get_new_fp_entries()
+                if row[3] == self.uid]
+
+    def test_rebuild_drops_manual_twin(self):
+        self.assertEqual(
+            rebuild.get_punches(self.uid, '20310101', '20310201'),
+            [self.device[0] + ('UNIS',), self.device[1] + ('UNIS',),
+             self.manual[1] + ('Manual',)])
+
+    def test_sync_skips_manual_of_recorded(self):
+        self.assertEqual(len(self.synced()), 4)
+        for row in self.device:
+            connection.Connection().execute(
+                'Insert Into FPEntries(C_Date, C_Time, L_TID, L_UID) '
+                'Values (?, ?, ?, ?)', *row)
+        self.assertEqual(self.synced(), [self.manual[1] + ('Manual',)])
+
+
+class DayCalendarTest(unittest.TestCase):
+    """The calendar answers what the day queries would, a year at a time"""
+
+    holiday = datetime(2032, 3, 15)
+
+    def setUp(self):
+        connection.Connection().execute(
+            'Insert Into DayDetails(todayDate, Description) Values (?, ?)',
+            self.holiday, 'Test Holiday')
+
+    def tearDown(self):
+        connection.Connection().execute(
+            'Delete From DayDetails Where todayDate = ?', self.holiday)
+
+    def test_same_as_queries(self):
+        days = [self.holiday + timedelta(days=days) for days in range(-7, 7)]
+        calendar = daycalendar.DayCalendar(days[0], days[-1])
+        self.assertEqual([calendar.get(day) for day in days],
+                         [att.DayDetail.get(day) for day in days])
+        self.assertEqual(calendar.get(self.holiday), 'Test Holiday')
+
+    def test_years_loaded_once(self):
+        calendar = daycalendar.DayCalendar(
+                datetime(2031, 1, 1), datetime(2031, 12, 31))
+        stats = querystats.QueryStats().install()
+        try:
+            calendar.get(datetime(2031, 6, 1))
+            self.assertEqual(len(stats), 0)
+            # the next year is read on first use and for the range too
+            classified = list(calendar.classify(
+                    datetime(2031, 12, 31), self.holiday))
+            calendar.get(self.holiday + timedelta(days=1))
+        finally:
+            stats.uninstall()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(len(classified), 76)
+        self.assertEqual(classified[-1], (self.holiday, 'Test Holiday'))
+
+
+class TimelineTest(unittest.TestCase):
+    """The timeline answers the neighbour lookups from one load"""
+
+    day = datetime(2019, 5, 6)
+
+    def setUp(self):
+        self.emp = AttendanceTest.get_employee()
+        att.AttendanceDetail.delete_by_emp(self.emp, self.day)
+        self.times = [(self.day + timedelta(days=days, hours=10),
+                       self.day + timedelta(days=days, hours=19))
+                      for days in (0, 1, 3)]
+        for inTime, outTime in self.times:
+            att.Session.make(employee=self.emp, inTime=inTime,
+                             outTime=outTime).save()
+
+    def tearDown(self):
+        att.AttendanceDetail.delete_by_emp(self.emp, self.day)
+
+    @staticmethod
+    def times_of(ses):
+        return ses and (ses.inTime, ses.outTime)
+
+    def test_same_as_queries(self):
+        index = timeline.TimelineIndex()
+        for days in (0, 1, 2, 3, 4):
+            time = self.day + timedelta(days=days, hours=12)
+            for lookup in ('previous', 'next'):
+                self.assertEqual(
+                    self.times_of(getattr(index, lookup)(self.emp, time)),
+                    self.times_of(getattr(
+                        att.Session, 'get_%s_session' % lookup)(
+                            self.emp, time)))
+
+    def test_loaded_once(self):
+        index = timeline.TimelineIndex()
+        stats = querystats.QueryStats().install()
+        try:
+            index.get(self.emp, self.day + timedelta(days=4))
+            self.assertEqual(len(stats), 1)
+            stats.clear()
+            time = self.day + timedelta(days=2)
+            self.assertEqual(self.times_of(index.previous(self.emp, time)),
+                             self.times[1])
+            self.assertEqual(self.times_of(index.next(self.emp, time)),
+                             self.times[2])
+            self.assertEqual(
+                [self.times_of(ses) for ses in index.get(self.emp).overlapping(
+                    self.day + timedelta(hours=18),
+                    self.day + timedelta(days=1, hours=11))],
+                self.times[:2])
+            self.assertEqual(len(stats), 0)
+        finally:
+            stats.uninstall()
+
+    def test_kept_current(self):
+        index = timeline.TimelineIndex().install()
+        try:
+            time = self.day + timedelta(days=2)
+            index.get(self.emp, time)
+            ses = att.Session.make(employee=self.emp, inTime=time,
+                                   outTime=time + timedelta(hours=8))
+            ses.save()
+            saved = (time, time + timedelta(hours=8))
+            self.assertEqual(
+                self.times_of(index.next(self.emp, self.times[1][0])), saved)
+            self.assertEqual(
+                self.times_of(index.previous(self.emp, self.times[2][0])),
+                saved)
+        finally:
+            index.uninstall()
+
+
+class WorkersTest(unittest.TestCase):
+    """Every employee's entries are recorded in order, by one worker"""
+
+    day = datetime(2019, 5, 20)
+
+    def test_partition(self):
+        entries = [(i, None, None, uid) for i, uid in enumerate([2, 1, 2, 3])]
+        self.assertEqual(workers.partition_by_employee(entries), [
+            [entries[0], entries[2]], [entries[1]], [entries[3]]])
+
+    def test_order_across_workers(self):
+        entries = [(i, None, None, uid)
+                   for i, uid in enumerate([1, 2, 1, 2, 1, 3])]
+        # the first entries of two employees wait for each other
+        barrier = threading.Barrier(2, timeout=10)
+        recorded, failed = [], []
+
+        def record(entry):
+            if entry[0] < 2:
+                barrier.wait()
+            if entry[0] == 4:
+                raise ValueError('Rejected on purpose')
+            recorded.append((threading.current_thread().name, entry))
+
+        workers.run_parallel(entries, record, 2, 2,
+                             lambda entry, error: failed.append(entry))
+        self.assertEqual(failed, [entries[4]])
+        for uid, expected in ((1, [0, 2]), (2, [1, 3]), (3, [5])):
+            done = [(thread, entry) for thread, entry in recorded
+                    if entry[3] == uid]
+            self.assertEqual([entry[0] for thread, entry in done], expected)
+            self.assertEqual(len(set(thread for thread, entry in done)), 1)
+
+    def test_employees_recorded(self):
+        emps = [att.Employee.get_by_code(uid) for uid in
+                (AttendanceTest.uid, AttendanceTest.other_uid)]
+        if None in emps:
+            self.skipTest('No employee %d' % AttendanceTest.other_uid)
+        self.delete_stuff(emps)
+        self.addCleanup(self.delete_stuff, emps)
+        date = self.day.strftime('%Y%m%d')
+        rows = [(date, '093000', AttendanceTest.IN, emps[1].employeeCode),
+                (date, '100000', AttendanceTest.IN, emps[0].employeeCode),
+                (date, '183000', AttendanceTest.OUT, emps[1].employeeCode),
+                (date, '190000', AttendanceTest.OUT, emps[0].employeeCode)]
+        caches = fpsync.install_caches()
+        try:
+            entries, rejected = punches.decode(rows)
+            fpsync.record_entries(entries, 3)
+        finally:
+            fpsync.uninstall_caches(caches)
+        self.assertEqual(
+            [[(ses.inTime.hour, ses.outTime.hour) for ses in
+              att.Session.get_latest_by_emp(emp, self.day)] for emp in emps],
+            [[(10, 19)], [(9, 18)]])
+
+    def delete_stuff(self, emps):
+        for emp in emps:
+            att.FPEntry.delete_by_emp(emp, self.day)
+            att.AttendanceDetail.delete_by_emp(emp, self.day)
+            # with the absences marked since the sessions before
+            att.EmployeeAttendance.delete_by_emp(emp, AttendanceTest.start)
+
+
+class DirectoryTest(unittest.TestCase):
+
+    def test_misses_remembered(self):
+        emps = directory.EmployeeDirectory.load()
+        versions = []
+        version = emps.version
+        emps.version = lambda: versions.append(1) or version()
+        self.assertEqual(emps.get_by_code(AttendanceTest.uid).employeeCode,
+                         AttendanceTest.uid)
+        self.assertIsNone(emps.get_by_code(1))
+        self.assertIsNone(emps.get_by_code(1))
+        self.assertIsNone(emps.get(-1))
+        self.assertEqual(len(versions), 2)
+        # until the version is checked again
+        emps._checked = 0
+        self.assertIsNone(emps.get_by_code(1))
+        self.assertEqual(len(versions), 4)
+
+    def test_answered_from_memory(self):
+        emps = directory.EmployeeDirectory.load()
+        stats = querystats.QueryStats().install()
+        try:
+            emp = emps.get_by_code(AttendanceTest.uid)
+            self.assertIs(emps.get(emp.employeeId), emp)
+            self.assertIs(emps.get_shift(emp).employee, emp)
+        finally:
+            stats.uninstall()
+        self.assertEqual(stats.queries(), [])
+
+    def test_reloaded_on_change(self):
+        uid = 9700003
+        emps = directory.EmployeeDirectory.load()
+        conn = connection.Connection()
+        conn.execute(
+            'Insert Into Employee(employeecode, employeename, employeestatus) '
+            'Values (?, ?, 1)', str(uid), 'Test')
+        emp = att.Employee.get_by_code(uid)
+        try:
+            # a miss checks the version and reloads
+            self.assertEqual(emps.get_by_code(uid).employeeId, emp.employeeId)
+            self.assertIsNone(emps.get_shift(emp))
+            conn.execute(
+                'Insert Into ShiftDetails(timeFrom, timeTo, EmployeeID) '
+                'Values (?, ?, ?)', datetime(1900, 1, 1, 7),
+                datetime(1900, 1, 1, 16), emp.employeeId)
+            emps._checked = 0
+            self.assertEqual(emps.get_shift(emp).timeFrom.hour, 7)
+        finally:
+            conn.execute('Delete From ShiftDetails Where EmployeeID = ?',
+                         emp.employeeId)
+            conn.execute('Delete From Employee Where employeeId = ?',
+                         emp.employeeId)
+
+
+class AbsentRangeTest(unittest.TestCase):
+
+    def marked(self, start):
+        emp = AttendanceTest.get_employee()
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+        # a present day and an absence on a Sunday
+        att.EmployeeAttendance(start + timedelta(days=2), employee=emp,
+                               attendanceStatus='P').save()
+        att.EmployeeAttendance(start + timedelta(days=4), employee=emp,
+                               attendanceStatus='A').save()
+        yield emp
+        rows = [(row.attendanceDate, row.attendanceStatus, row.description)
+                for row in att.EmployeeAttendance.get_latest_by_emp(
+                    emp, start)]
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+        yield rows
+
+    def test_same_as_mark_absent(self):
+        start = AttendanceTest.start + timedelta(days=60)
+        end = start + timedelta(days=15)
+
+        marked = self.marked(start)
+        emp = next(marked)
+        day = start
+        while day < end:
+            att.EmployeeAttendance.mark_absent(emp, day)
+            day += timedelta(days=1)
+        expected = next(marked)
+
+        marked = self.marked(start)
+        att.EmployeeAttendance.mark_absent_range(next(marked), start, end)
+        self.assertEqual(next(marked), expected)
+        self.assertEqual(len(expected), 15)
+
+
+class MergeTest(unittest.TestCase):
+
+    def test_merge_rules(self):
+        emp = AttendanceTest.get_employee()
+        start = AttendanceTest.start + timedelta(days=80)
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+        for days, status, time_status in ((0, 'AL', ''), (1, 'P', 'Late'),
+                                          (2, 'P', 'InTime')):
+            att.EmployeeAttendance(
+                    start + timedelta(days=days), status, time_status,
+                    employee=emp).save()
+
+        merge = att.EmployeeAttendance
+        with unitofwork.UnitOfWork():
+            merge.merge([
+                merge.absence(emp, start),
+                merge.presence(emp, start + timedelta(days=1), late=False),
+                merge.presence(emp, start + timedelta(days=2), late=True),
+                merge.presence(emp, start + timedelta(days=3), late=True),
+                merge.presence(emp, start + timedelta(days=3), late=False)])
+        self.assertEqual(
+                [(row.attendanceStatus, row.timeStatus) for row in
+                 merge.get_latest_by_emp(emp, start)],
+                [('AL', ''), ('P', 'InTime'), ('P', 'InTime'),
+                 ('P', 'InTime')])
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+
+
+class DirtyTrackingTest(unittest.TestCase):
+
+    def test_save_writes_changed_fields(self):
+        emp = AttendanceTest.get_employee()
+        day = AttendanceTest.start + timedelta(days=100)
+        att.EmployeeAttendance.delete_by_emp(emp, day)
+        att.EmployeeAttendance(day, 'A', employee=emp).save()
+        row = att.EmployeeAttendance.get(emp, day)
+
+        counts = unitofwork.WriteCounts().install()
+        stats = querystats.QueryStats().install()
+        try:
+            row.save()
+            row.description = 'Checked'
+            row.save()
+        finally:
+            stats.uninstall()
+            counts.uninstall()
+        self.assertEqual(counts.written, {'EmployeeAttendance': 1})
+        self.assertEqual(counts.skipped, {'EmployeeAttendance': 1})
+        self.assertEqual(
+                [stat.query for stat in stats.queries()],
+                ['Update EmployeeAttendance Set description=? Where EAID = ?'])
+        self.assertEqual(att.EmployeeAttendance.get(emp, day).description,
+                         'Checked')
+        att.EmployeeAttendance.delete_by_emp(emp, day)
+
+
+class ConnectionTest(unittest.TestCase):
+
+    def test_rows_survive_other_statements(self):
+        emp = AttendanceTest.get_employee()
+        start = AttendanceTest.start + timedelta(days=120)
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+        for days in range(3):
+            att.EmployeeAttendance(start + timedelta(days=days), 'A',
+                                   employee=emp).save()
+        rows = []
+        for data in att.EmployeeAttendance.iter_rows(
+                start, start + timedelta(days=3), [emp.employeeId]):
+            # the same query run again while the rows are read
+            day = list(att.EmployeeAttendance.iter_rows(
+                    data[0], data[0] + timedelta(days=1), [emp.employeeId]))
+            self.assertEqual(day, [data])
+            rows.append(data[0])
+        self.assertEqual(rows, [start + timedelta(days=days)
+                                for days in range(3)])
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+
+
+class QueryStatsTest(unittest.TestCase):
+
+    def test_wrapped_cursor(self):
+        stats = querystats.QueryStats()
+        cursor = stats.wrap(sqlite3.connect(':memory:').cursor())
+        self.assertIs(cursor.execute('Create Table T (A int)'), cursor)
+        self.assertIs(cursor.executemany('Insert Into T Values (?)',
+                                         [(1,), (2,)]), cursor)
+        self.assertEqual(cursor.execute('Select A From T').fetchall(),
+                         [(1,), (2,)])
+        self.assertEqual(stats.get('Insert Into T Values (?)').rows, 2)
+
+
+class UnitOfWorkTest(unittest.TestCase):
+
+    class OutputCursor(object):
+        # a cursor outputting the keys with the types a driver may use
+        def __init__(self, outputs):
+            self.outputs = outputs
+
+        def execute(self, query, *params):
+            return self
+
+        def fetchall(self):
+            return self.outputs
+
+    def test_identities_of_multi_row_insert(self):
+        emp = AttendanceTest.get_employee()
+        start = AttendanceTest.start + timedelta(days=140)
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+        rows = [att.EmployeeAttendance(start + timedelta(days=days), 'A',
+                                       employee=emp) for days in range(3)]
+        with unitofwork.UnitOfWork():
+            for row in rows:
+                row.save()
+        stored = dict((data.attendanceDate, data._eaid) for data in
+                      att.EmployeeAttendance.get_latest_by_emp(emp, start))
+        self.assertEqual([row._eaid for row in rows],
+                         [stored[row.attendanceDate] for row in rows])
+        self.assertEqual(len(set(stored.values())), 3)
+        att.EmployeeAttendance.delete_by_emp(emp, start)
+
+    def test_identities_matched_across_types(self):
+        from decimal import Decimal
+        got = {}
+        writes = [((7, datetime(2018, 9, days)), (days,),
+                   [lambda eaid, days=days: got.__setitem__(days, eaid)])
+                  for days in (1, 2)]
+        uow = unitofwork.UnitOfWork()
+        uow._insert_returning(self.OutputCursor([
+            (11, Decimal(7), datetime(2018, 9, 2).date()),
+            (10, '7', '2018-09-01 00:00:00')]), 'T', '%s', writes)
+        self.assertEqual(got, {1: 10, 2: 11})
+        self.assertEqual(uow.identity('T', (7, datetime(2018, 9, 1))), 10)
+
+    def test_restore_keeps_earlier_identities(self):
+        uow = unitofwork.UnitOfWork()
+        key = (7, datetime(2018, 9, 1))
+        later = (7, datetime(2018, 9, 2))
+        uow._insert_returning(self.OutputCursor([(10,) + key]), 'T', '%s',
+                              [(key, (1,), [])])
+        state = uow.savepoint()
+        uow._insert_returning(self.OutputCursor([(11,) + later]), 'T', '%s',
+                              [(later, (2,), [])])
+        uow.restore(state)
+        self.assertEqual(uow.identity('T', key), 10)
+        self.assertIsNone(uow.identity('T', later))
+
+    def test_restore_takes_back_flushed_identities(self):
+        uow = unitofwork.UnitOfWork()
+        key = (7, datetime(2018, 9, 1))
+        got = []
+        uow.insert('T', key, '%s', (1,), on_insert=got.append)
+        state = uow.savepoint()
+        writes = [(key, write[2], write[4])
+                  for key, write in uow._tables.pop('T').items()]
+        uow._insert_returning(self.OutputCursor([(10,) + key]), 'T', '%s',
+                              writes)
+        uow.restore(state)
+        self.assertEqual(got, [10, None])
+        self.assertIsNone(uow.identity('T', key))
+        self.assertEqual(uow._tables['T'][key][0], uow.INSERT)
+
+    def test_update_never_replaces_insert(self):
+        uow = unitofwork.UnitOfWork()
+        uow.insert('T', 1, 'Insert', (1,))
+        self.assertRaises(RuntimeError, uow.update, 'T', 1, 'Update', (1,))
+
+
+class InOutIdAllocatorTest(unittest.TestCase):
+    """InOutIDs come from blocks reserved inside the caller's transaction"""
+
+    def setUp(self):
+        self.emp = att.Employee.get_by_code(AttendanceTest.uid)
+        self.conn = connection.Connection()
+        self.conn.execute('Delete From InOutIdBlocks Where EmployeeID = ?',
+                          self.emp.employeeId)
+        self.first = self.conn.execute(
+                'Select IsNull(Max(InOutID), 0) + 1 From AttendanceDetails '
+                'Where EmployeeID = ?', self.emp.employeeId).fetchone()[0]
+        self.allocator = sequence.InOutIdAllocator(2)
+
+    def tearDown(self):
+        self.allocator.close()
+        self.conn.execute('Delete From InOutIdBlocks Where EmployeeID = ?',
+                          self.emp.employeeId)
+
+    def next_reserved(self):
+        row = self.conn.execute(
+                'Select NextInOutID From InOutIdBlocks Where EmployeeID = ?',
+                self.emp.employeeId).fetchone()
+        return row and row[0]
+
+    def test_blocks(self):
+        ids = [self.allocator.next(self.emp.employeeId) for i in range(5)]
+        self.assertEqual(ids, list(range(self.first, self.first + 5)))
+        # three blocks of two
+        self.assertEqual(self.next_reserved(), self.first + 6)
+
+    def test_reserved_in_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with self.conn.transaction():
+                self.allocator.next(self.emp.employeeId)
+                self.assertEqual(self.next_reserved(), self.first + 2)
+                raise RuntimeError('Rolled back on purpose')
+        self.assertIsNone(self.next_reserved())
+        # the block stays in memory
+        self.assertEqual(self.allocator.next(self.emp.employeeId),
+                         self.first + 1)
+
+    def test_threads(self):
+        ids = []
+
+        def take():
+            try:
+                for i in range(5):
+                    ids.append(self.allocator.next(self.emp.employeeId))
+            finally:
+                connection.Connection.close()
+
+        threads = [threading.Thread(target=take) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 15)
+        self.assertTrue(min(ids) >= self.first)
+
+
+class TransactionalTest(unittest.TestCase):
+    """An entry rolled back in a transactional sync leaves the others"""
+
+    day = datetime(2019, 3, 4)
+
+    def setUp(self):
+        self.employees = [att.Employee.get_by_code(uid) for uid in
+                          (AttendanceTest.uid, AttendanceTest.other_uid)]
+        if None in self.employees:
+            self.skipTest('No employee %d' % AttendanceTest.other_uid)
+        self.tearDown()
+
+    def tearDown(self):
+        for emp in self.employees:
+            att.FPEntry.delete_by_emp(emp, self.day)
+            att.AttendanceDetail.delete_by_emp(emp, self.day)
+            # with the absences marked since the sessions before
+            att.EmployeeAttendance.delete_by_emp(emp, AttendanceTest.start)
+
+    def record(self, fail):
+        a, b = [emp.employeeCode for emp in self.employees]
+        date = self.day.strftime('%Y%m%d')
+        # the OUT of A queues the insert of a soft IN, loading the timeline
+        # of B flushes it and B fails; the IN of A then moves the soft IN
+        rows = [(date, '180000', AttendanceTest.OUT, a, 'UNIS'),
+                (date, '100000', AttendanceTest.IN, b, 'UNIS'),
+                (date, '090000', AttendanceTest.IN, a, 'UNIS')]
+
+        def record(entry):
+            fpsync.record_entry(entry)
+            if fail and entry[3] == b:
+                raise RuntimeError('Failed on purpose')
+
+        index = timeline.TimelineIndex().install()
+        try:
+            entries, rejected = punches.decode(rows)
+            workers.run_in_batches(entries, record, 100,
+                                   fpsync.report_failure, True)
+        finally:
+            index.uninstall()
+        return [(row[0], row[1].hour, row[2]) for row in
+                connection.Connection().execute(
+                    'Select EmployeeID, InOutTime, InOutStatus '
+                    'From AttendanceDetails Where InOutTime >= ? '
+                    'Order By EmployeeID, InOutTime', self.day)]
+
+    def test_control(self):
+        a, b = [emp.employeeId for emp in self.employees]
+        self.assertEqual(self.record(False),
+                         [(a, 9, 'In'), (a, 18, 'Out'), (b, 10, 'In')])
+
+    def test_failed_entry_rolled_back(self):
+        a, b = [emp.employeeId for emp in self.employees]
+        self.assertEqual(self.record(True), [(a, 9, 'In'), (a, 18, 'Out')])
+
+
+class EffectiveDatesTest(unittest.TestCase):
+    """Setup dates a shift from the days the employee came in for it"""
+
+    uid = 9700002
+
+    def setUp(self):
+        conn = connection.Connection()
+        conn.execute(
+            'Insert Into Employee(employeecode, employeename, employeestatus) '
+            'Values (?, ?, 1)', str(self.uid), 'Test')
+        self.emp = att.Employee.get_by_code(self.uid)
+        for start in (9, 14, 14):
+            conn.execute(
+                'Insert Into ShiftDetails(timeFrom, timeTo, EmployeeID) '
+                'Values (?, ?, ?)', datetime(1900, 1, 1, start),
+                datetime(1900, 1, 1, start + 9), self.emp.employeeId)
+        for day, hour in ((1, 9), (2, 8), (3, 9), (4, 14), (5, 13)):
+            time = datetime(2019, 4, day, hour, 5)
+            conn.execute(
+                'Insert Into AttendanceDetails(InOutID, EmployeeID, '
+                'TrackDate, InOutTime, InOutStatus) Values (?, ?, ?, ?, ?)',
+                day, self.emp.employeeId, datetime(2019, 4, day), time, 'In')
+
+    def tearDown(self):
+        conn = connection.Connection()
+        for table in ('AttendanceDetails', 'ShiftDetails'):
+            conn.execute('Delete From %s Where EmployeeID = ?' % table,
+                         self.emp.employeeId)
+        conn.execute('Delete From Employee Where employeeId = ?',
+                     self.emp.employeeId)
+
+    def test_filled_in(self):
+        fpsync.setup_database()
+        self.assertEqual(
+            [row[0] for row in connection.Connection().execute(
+                'Select EffectiveFrom From ShiftDetails Where EmployeeID = ? '
+                'Order By SDID', self.emp.employeeId)],
+            [None, datetime(2019, 4, 4), None])
+        history = att.ShiftDetails.get_history(self.emp)
+        self.assertEqual(
+            [history.shift_at(datetime(2019, 4, day, 12)).timeFrom.hour
+             for day in (1, 3, 4, 5)], [9, 9, 14, 14])
+
+
+class ShiftHistoryTest(unittest.TestCase):
+
+    @staticmethod
+    def shift(start, effectiveFrom=None):
+        return att.ShiftDetails(
+                datetime(1900, 1, 1, start),
+                datetime(1900, 1, 1, (start + 9) % 24),
+                employeeId=1, effectiveFrom=effectiveFrom)
+
+    def test_latest_without_dates(self):
+        history = att.ShiftHistory([self.shift(9), self.shift(10)])
+        self.assertEqual(history.shift_at(datetime(2018, 1, 1)).timeFrom.hour,
+                         10)
+
+    def test_undated_after_dated(self):
+        history = att.ShiftHistory([
+                self.shift(9), self.shift(14, datetime(2018, 9, 1)),
+                self.shift(10)])
+        self.assertEqual(
+                [history.shift_at(time).timeFrom.hour for time in (
+                    datetime(2018, 8, 31), datetime(2018, 9, 1))],
+                [9, 10])
+
+    def test_shift_at(self):
+        history = att.ShiftHistory([
+                self.shift(9), self.shift(14, datetime(2018, 9, 1)),
+                self.shift(10, datetime(2018, 8, 1))])
+        self.assertEqual(
+                [history.shift_at(time).timeFrom.hour for time in (
+                    datetime(2018, 7, 31, 23), datetime(2018, 8, 1),
+                    datetime(2018, 8, 31, 23), datetime(2018, 9, 2))],
+                [9, 10, 10, 14])
+
+    def test_session_uses_shift_of_its_time(self):
+        emp = att.Employee(1, 1, 'Test', 1)
+        emp._shifts = att.ShiftHistory([
+                self.shift(10), self.shift(22, datetime(2018, 9, 1))])
+        before = att.Session.make(employee=emp,
+                                  inTime=datetime(2018, 8, 31, 9))
+        after = att.Session.make(employee=emp,
+                                 inTime=datetime(2018, 9, 2, 9))
+        self.assertEqual(before.trackDate, datetime(2018, 8, 31))
+        self.assertEqual(after.trackDate, datetime(2018, 9, 1))
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sync_new_entries = fpsync.sync_new_entries
+
+    def tearDown(self):
+        fpsync.sync_new_entries = self.sync_new_entries
+
+    def test_interval_and_backoff(self):
+        sync = daemon.SyncDaemon(min_interval=0.001, max_interval=0.004,
+                                 backoff=2, cache_ttl=3600)
+        # any error of a poll backs off and the daemon keeps polling
+        results = [0, 0, RuntimeError('No identity'), 5,
+                   AttributeError('No shift'), 3, 0]
+        intervals = []
+        refreshed = []
+
+        def sync_new_entries(workers, chunk_size, stopping):
+            intervals.append(sync.interval)
+            refreshed.append(sync._loaded)
+            result = results.pop(0)
+            if not results:
+                sync.stop()
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        fpsync.sync_new_entries = sync_new_entries
+        sync.run()
+        self.assertEqual(intervals, [0.001, 0.002, 0.004, 0.004, 0.001,
+                                     0.002, 0.001])
+        self.assertEqual(sync.interval, 0.002)
+        # the caches are read again after every failed poll
+        self.assertTrue(refreshed[3] > refreshed[2])
+        self.assertTrue(refreshed[5] > refreshed[4])
+
+
+class ReportTest(unittest.TestCase):
+
+    def test_matrix(self):
+        emp = AttendanceTest.get_employee()
+        start = AttendanceTest.start
+        att.EmployeeAttendance(
+                start + timedelta(days=40), employee=emp,
+                attendanceStatus='AL').save()
+        rows = att.EmployeeAttendance.get_latest_by_emp(emp, start)
+        matrix = report.AttendanceMatrix.load(
+                start, start + timedelta(days=41), [emp.employeeId])
+        self.assertEqual(matrix.days, 41)
+        for row in rows:
+            if row.attendanceDate < start + timedelta(days=41):
+                self.assertEqual(
+                        matrix.get(emp.employeeId, row.attendanceDate),
+                        report.code(row.attendanceStatus, row.timeStatus))
+        self.assertEqual(matrix.get(emp.employeeId, start + timedelta(
+                days=40)), report.code('AL', ''))
+        self.assertEqual(matrix.totals['leave'], [1])
+        self.assertEqual(matrix.totals['late'], [len(
+                [row for row in rows if row.timeStatus == 'Late'])])
+        att.EmployeeAttendance.delete_by_emp(emp, start + timedelta(days=40))
+
+    def test_matrix_of_dates(self):
+        start = AttendanceTest.start
+        matrix = report.AttendanceMatrix(start, start + timedelta(days=3),
+                                         [1])
+        matrix.fill([(start.date() + timedelta(days=1), 'A', '', '', 1, 9)])
+        self.assertEqual(matrix.get(1, start.date() + timedelta(days=1)),
+                         report.code('A', ''))
+        self.assertEqual(matrix.get(1, start), report.NONE)
+
+
+@unittest.skipIf(whatif.np is None, 'numpy is not installed')
+class WhatIfTest(unittest.TestCase):
+
+    def setUp(self):
+        shift = att.ShiftDetails(datetime(1900, 1, 1, 10),
+                                 datetime(1900, 1, 1, 19), employeeId=1)
+        sessions = [
+            (1, datetime(2018, 8, 26, 11), datetime(2018, 8, 26, 15)),
+            (1, datetime(2018, 8, 27, 10, 20), datetime(2018, 8, 27, 18)),
+            (1, datetime(2018, 8, 28, 9), datetime(2018, 8, 28, 18)),
+            (1, datetime(2018, 8, 29, 11), None),
+            (2, datetime(2018, 8, 29, 11), None)]
+        self.whatif = whatif.WhatIf(
+                sessions, {1: att.ShiftHistory([shift])},
+                daycalendar.DayCalendar())
+
+    def test_policies(self):
+        outcome = self.whatif.evaluate([
+            whatif.Policy(),
+            whatif.Policy(grace_time=timedelta(minutes=15))])
+        self.assertEqual(outcome.employee_ids, [1])
+        self.assertEqual(outcome.totals(0), {
+            'present': 4, 'in_time': 2, 'late': 1, 'overtime': 1})
+        self.assertEqual(outcome.totals(1), {
+            'present': 4, 'in_time': 1, 'late': 2, 'overtime': 1})
+        self.assertEqual(str(outcome.track_dates[0][1]), '2018-08-27')
+
+
 if __name__ == "__main__":
     unittest.main()